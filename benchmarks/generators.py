@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+'''
+Generators of synthetic SparkSQL queries whose size grows with a parameter n, for the scaling benchmark, see
+scaling.py. Each generator is deterministic, so that runs can be compared.
+'''
+
+
+def wide_select(n):
+    '''
+    A SELECT with n columns, each an expression with an alias.
+
+    Parameters
+    n: int
+        Number of columns.
+
+    Return: string
+        The query.
+    '''
+    columns = ['coalesce(t.c{i}, 0) + {i} as a{i}'.format(i=i) for i in range(n)]
+    return 'select ' + ', '.join(columns) + ' from db.t where t.dt = \'2020-01-01\''
+
+
+def nested_subqueries(n):
+    '''
+    n SELECTs, each from a subquery of the next one.
+
+    Parameters
+    n: int
+        Depth of nesting.
+
+    Return: string
+        The query.
+    '''
+    query = 'select c0, c1 from db.t where c0 > 0'
+    for i in range(n):
+        query = 'select c0, c1 + {i} as c1 from ({query}) s{i} where c1 is not null'.format(i=i, query=query)
+    return query
+
+
+def nested_ctes(n):
+    '''
+    A WITH clause of n common table expressions, each selecting from the previous one.
+
+    Parameters
+    n: int
+        Number of common table expressions.
+
+    Return: string
+        The query.
+    '''
+    ctes = ['t0 as (select c0, c1 from db.t where c0 > 0)']
+    for i in range(1, n):
+        ctes.append('t{i} as (select c0, sum(c1) as c1 from t{j} group by c0)'.format(i=i, j=i - 1))
+    return 'with ' + ', '.join(ctes) + ' select * from t{j}'.format(j=n - 1)
+
+
+def in_list(n):
+    '''
+    A SELECT filtered by an IN list of n values.
+
+    Parameters
+    n: int
+        Number of values.
+
+    Return: string
+        The query.
+    '''
+    values = [str(i) if i % 2 else "'v{i}'".format(i=i) for i in range(n)]
+    return 'select c0, c1 from db.t where c0 in (' + ', '.join(values) + ')'
+
+
+def case_chain(n):
+    '''
+    A SELECT with a CASE expression of n WHEN branches.
+
+    Parameters
+    n: int
+        Number of branches.
+
+    Return: string
+        The query.
+    '''
+    branches = ["when c0 = {i} then 'v{i}'".format(i=i) for i in range(n)]
+    return 'select case ' + ' '.join(branches) + ' else null end as c from db.t'
+
+
+def many_statements(n):
+    '''
+    A script of n statements separated by ";".
+
+    Parameters
+    n: int
+        Number of statements.
+
+    Return: string
+        The script.
+    '''
+    statement = ('select c0, count(*) as n from db.t{i} left join db.u on t{i}.c0 = u.c0 where c1 between {i} and '
+                 '{j} group by c0 order by n desc limit 10;\n')
+    return ''.join(statement.format(i=i, j=i + 10) for i in range(n))
+
+
+def comments(n):
+    '''
+    A SELECT of n columns, each with a line comment, between block comments every 10 columns.
+
+    Parameters
+    n: int
+        Number of columns.
+
+    Return: string
+        The query.
+    '''
+    lines = ['select']
+    for i in range(n):
+        if i % 10 == 0:
+            lines.append('/* columns {i} to {j}\n   of the report */'.format(i=i, j=i + 9))
+        lines.append('c{i}{comma} -- column {i}'.format(i=i, comma=',' if i < n - 1 else ''))
+    lines.append('from db.t -- the table')
+    return '\n'.join(lines)
+
+
+def jinja(n):
+    '''
+    A templated script of n statements with Jinja placeholders and blocks, e.g., of dbt models.
+
+    Parameters
+    n: int
+        Number of statements.
+
+    Return: string
+        The script.
+    '''
+    statement = ('{{% if var("run_{i}") %}}\nselect {{{{ col_{i} }}}}, c1 from {{{{ ref("t{i}") }}}} where dt = '
+                 '\'{{{{ ds }}}}\' and c1 > {{{{ var("min_{i}") }}}};\n{{% endif %}}\n')
+    return ''.join(statement.format(i=i) for i in range(n))
+
+
+GENERATORS = {  # generators by name, in the order they are run by default
+    'wide_select': wide_select,
+    'nested_subqueries': nested_subqueries,
+    'nested_ctes': nested_ctes,
+    'in_list': in_list,
+    'case_chain': case_chain,
+    'many_statements': many_statements,
+    'comments': comments,
+    'jinja': jinja
+}
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+'''
+Benchmark of formatting many files with runner.format_files(), reporting the wall time and the speedup over one
+process for each number of worker processes.
+
+Usage: python benchmarks/parallel_files.py [--files FILES] [--statements STATEMENTS] [--jobs JOBS [JOBS ...]]
+'''
+from __future__ import print_function  # for print() in Python 2
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # run from a checkout
+
+from sparksqlformatter.src import runner
+from sparksqlformatter.src.style import Style
+
+STATEMENT = '''select c1, case when s > -1 then coalesce(c2, 'n/a') else null end as c, count(*) as n
+from db.t left join db.u on t.c1 = u.c1 and u.c4 in (1, 2, 3) where c2 is not null group by c1, c2 order by c1 desc;
+'''
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Wall time of formatting many files with worker processes.')
+    parser.add_argument('--files', type=int, default=2000, help='Number of files.')
+    parser.add_argument('--statements', type=int, default=20, help='Number of statements in each file.')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        nargs='+',
+        default=None,
+        help='Numbers of worker processes to compare, default to 1, 2, 4, ... up to the number of CPUs.')
+    args = parser.parse_args(argv)
+    jobsList = args.jobs
+    if not jobsList:
+        jobsList = [1]
+        while jobsList[-1] * 2 <= multiprocessing.cpu_count():
+            jobsList.append(jobsList[-1] * 2)
+
+    directory = tempfile.mkdtemp()
+    try:
+        filePaths = []
+        for i in range(args.files):
+            filePath = os.path.join(directory, 'q{i}.sql'.format(i=i))
+            with io.open(filePath, mode='w', encoding='utf-8') as f:
+                f.write(STATEMENT * args.statements)
+            filePaths.append(filePath)
+        print('files: {files}, CPUs: {cpus}'.format(files=args.files, cpus=multiprocessing.cpu_count()))
+        baseline = None
+        for jobs in jobsList:
+            start = time.time()
+            for result in runner.format_files(filePaths, style=Style(), jobs=jobs, output=io.StringIO()):
+                assert result.error is None, result.error
+            seconds = time.time() - start
+            baseline = baseline or seconds
+            print('jobs {jobs}: {seconds:.2f} s, speedup {speedup:.2f}'.format(jobs=jobs,
+                                                                               seconds=seconds,
+                                                                               speedup=baseline / seconds))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
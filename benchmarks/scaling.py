@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+'''
+Benchmark of how the time and memory of tokenizing and formatting grow with the size of the query, for each generator
+in generators.py. For each generator, the queries of the given sizes are tokenized and formatted, the best of the
+runs is kept, and the exponent k of time ~ characters^k is fitted by least squares on a log-log scale, so that
+k close to 1 is linear and k close to 2 is quadratic. The results are saved as JSON.
+
+Usage: python benchmarks/scaling.py [--generators GENERATORS [GENERATORS ...]] [--sizes SIZES [SIZES ...]]
+                                    [--repeat REPEAT] [--max-seconds MAX_SECONDS] [--max-exponent MAX_EXPONENT]
+                                    [--output OUTPUT]
+'''
+from __future__ import print_function  # for print() in Python 2
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # run from a checkout
+
+from benchmarks.generators import GENERATORS
+from sparksqlformatter.src.formatter import Formatter
+from sparksqlformatter.src.style import Style
+from sparksqlformatter.src.version import VERSION
+
+DEFAULT_SIZES = [100, 200, 400, 800, 1600]
+MEASURES = ['tokenizeSeconds', 'formatSeconds', 'peakBytes']  # measures whose exponents are fitted
+
+
+def fit_exponent(sizes, values):
+    '''
+    Fit the exponent k of value = c * size^k by least squares on log(value) = log(c) + k * log(size).
+
+    Parameters
+    sizes: list
+        Sizes of the inputs.
+    values: list
+        Measures of the inputs, e.g., seconds. Points whose size or value is not positive are left out.
+
+    Return: float
+        The exponent, or None if there are less than 2 points with different sizes.
+    '''
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if size > 0 and value > 0]
+    if len(points) < 2:
+        return None
+    meanX = sum(x for x, _ in points) / len(points)
+    meanY = sum(y for _, y in points) / len(points)
+    variance = sum((x - meanX)**2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - meanX) * (y - meanY) for x, y in points) / variance
+
+
+def measure(formatter, query, repeat):
+    '''
+    Measure tokenizing and formatting a query.
+
+    Parameters
+    formatter: Formatter() object
+        The formatter.
+    query: string
+        The query.
+    repeat: int
+        Number of runs, the best one is kept.
+
+    Return: dict
+        The characters and tokens of the query, the seconds of tokenizing and of formatting, which includes
+        tokenizing, and the peak bytes allocated while formatting.
+    '''
+    tokenizeSeconds = []
+    formatSeconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.process_time()
+        tokens = formatter.tokenizer.tokenize(query)
+        tokenizeSeconds.append(time.process_time() - start)
+        gc.collect()
+        start = time.process_time()
+        formatter.format(query)
+        formatSeconds.append(time.process_time() - start)
+    gc.collect()
+    tracemalloc.start()  # in a separate run, as tracing slows down allocations
+    try:
+        formatter.format(query)
+        peakBytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'characters': len(query),
+        'tokens': len(tokens),
+        'tokenizeSeconds': min(tokenizeSeconds),
+        'formatSeconds': min(formatSeconds),
+        'peakBytes': peakBytes
+    }
+
+
+def run_generator(formatter, generator, sizes, repeat, maxSeconds=None):
+    '''
+    Measure the queries of a generator for each size and fit the exponents.
+
+    Parameters
+    formatter: Formatter() object
+        The formatter.
+    generator: function
+        Function that takes a size and returns a query, see generators.py.
+    sizes: list
+        Sizes, in increasing order.
+    repeat: int
+        Number of runs of each query, the best one is kept.
+    maxSeconds: float
+        If given, will skip the larger sizes once formatting a query takes longer.
+
+    Return: dict
+        The measures of each size in "points" and the exponents of each measure by number of characters in
+        "exponents".
+    '''
+    points = []
+    for size in sizes:
+        point = measure(formatter, generator(size), repeat)
+        point['size'] = size
+        points.append(point)
+        if maxSeconds is not None and point['formatSeconds'] > maxSeconds:
+            break
+    characters = [point['characters'] for point in points]
+    exponents = {name: fit_exponent(characters, [point[name] for point in points]) for name in MEASURES}
+    return {'points': points, 'exponents': exponents}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Scaling of time and memory with the size of the query.')
+    parser.add_argument('--generators',
+                        type=str,
+                        nargs='+',
+                        default=list(GENERATORS),
+                        choices=list(GENERATORS),
+                        help='Generators of queries, default to all.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Sizes passed to the generators.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each query, the best one is kept.')
+    parser.add_argument('--max-seconds',
+                        type=float,
+                        default=10.0,
+                        help='Skip the larger sizes of a generator once formatting a query takes longer.')
+    parser.add_argument('--max-exponent',
+                        type=float,
+                        default=None,
+                        help='Exit with status 1 if the exponent of the time of formatting of any generator is larger, '
+                        'e.g., 1.5 to catch quadratic behaviours.')
+    parser.add_argument('--output', type=str, default='scaling.json', help='Path to the JSON file of the results.')
+    args = parser.parse_args(argv)
+
+    formatter = Formatter(style=Style())
+    results = {}
+    print('{:<20} {:>10} {:>10} {:>12} {:>12} {:>12}'.format('generator', 'size', 'characters', 'tokenize s',
+                                                             'format s', 'peak bytes'))
+    for name in args.generators:
+        result = run_generator(formatter, GENERATORS[name], sorted(args.sizes), args.repeat, args.max_seconds)
+        for point in result['points']:
+            print('{:<20} {:>10} {:>10} {:>12.4f} {:>12.4f} {:>12}'.format(name, point['size'], point['characters'],
+                                                                           point['tokenizeSeconds'],
+                                                                           point['formatSeconds'], point['peakBytes']))
+        print('{:<20} exponents: {}'.format(
+            name, ', '.join('{}={}'.format(measure, 'n/a' if exponent is None else '{:.2f}'.format(exponent))
+                            for measure, exponent in sorted(result['exponents'].items()))))
+        results[name] = result
+
+    report = {
+        'version': VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sizes': sorted(args.sizes),
+        'repeat': args.repeat,
+        'results': results
+    }
+    with io.open(args.output, mode='w', encoding='utf-8') as f:
+        f.write(json.dumps(report, indent=2, sort_keys=True))
+    print('results written to {output}'.format(output=args.output))
+
+    if args.max_exponent is not None:
+        slow = [
+            name for name, result in results.items() if result['exponents']['formatSeconds'] is not None
+            and result['exponents']['formatSeconds'] > args.max_exponent
+        ]
+        if slow:
+            print('exponents larger than {max}: {names}'.format(max=args.max_exponent, names=', '.join(sorted(slow))))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+'''
+Microbenchmark of the main loop of the formatter, reporting the number of tokens formatted per second.
+
+Usage: python benchmarks/tokens_per_second.py [--statements STATEMENTS] [--repeat REPEAT]
+'''
+from __future__ import print_function  # for print() in Python 2
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # run from a checkout
+
+from sparksqlformatter.src.formatter import Formatter
+from sparksqlformatter.src.formatting_context import FormattingContext
+from sparksqlformatter.src.style import Style
+
+STATEMENT = '''-- daily totals
+with t0 as (select c1, c2, sum(c3) as s from db.t where dt between '2020-01-01' and '2020-01-31' group by c1, c2)
+select c1, case when s > -1 then coalesce(c2, 'n/a') else null end as c, count(*) as n, max(s) - min(s) as r
+from t0 left join db.u on t0.c1 = u.c1 and u.c4 in (1, 2, 3)
+where c2 is not null /* keep nulls out */
+order by c1 desc, n limit 10;
+'''
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Number of tokens formatted per second.')
+    parser.add_argument('--statements', type=int, default=200, help='Number of statements in the query.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is reported.')
+    args = parser.parse_args(argv)
+
+    formatter = Formatter(style=Style())
+    query = STATEMENT * args.statements
+    count = len(formatter.tokenizer.tokenize(query))
+
+    formatting = []  # seconds spent in the main loop, excluding tokenizing
+    total = []  # seconds spent in format()
+    for _ in range(args.repeat):
+        # fresh tokens for every run, as formatting adds flags to them
+        context = FormattingContext(formatter.style, formatter.tokenizer.tokenize(query))
+        start = time.process_time()
+        formatter.get_formatted_query_from_tokens(context)
+        formatting.append(time.process_time() - start)
+        start = time.process_time()
+        formatter.format(query)
+        total.append(time.process_time() - start)
+    print('tokens: {count}'.format(count=count))
+    print('formatting tokens: {rate:.0f} tokens/s'.format(rate=count / min(formatting)))
+    print('format(), including tokenizing: {rate:.0f} tokens/s'.format(rate=count / min(total)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
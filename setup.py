@@ -3,9 +3,13 @@ import setuptools
 with open('README.md', 'r') as fh:
     long_description = fh.read()
 
+version = {}
+with open('sparksqlformatter/src/version.py', 'r') as fh:
+    exec(fh.read(), version)
+
 setuptools.setup(
     name='sparksqlformatter',
-    version='0.1.13',
+    version=version['VERSION'],
     author='largecats',
     author_email='linfanxiaolinda@outlook.com',
     description=
@@ -13,14 +17,13 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type='text/markdown',
     url='https://github.com/largecats/sparksql-formatter',
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks']),
     install_requires=['configparser'],
+    python_requires='>=3.7',
     classifiers=[
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
     ],
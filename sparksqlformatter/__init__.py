@@ -23,19 +23,41 @@
 # from __future__ import print_function  # for print() in Python 2
 import os
 import sys
-import argparse
-import logging
-import codecs
-import json
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sparksqlformatter.src.style import Style
-from sparksqlformatter.src import api
-from sparksqlformatter.src.formatter import Formatter
+# the modules of the library and of the command-line tool, e.g., argparse, are imported when first used, so that
+# importing the package is fast and has no side effects, e.g., logging is only configured by main()
+LAZY_ATTRIBUTES = {  # attributes of the package imported by __getattr__(), by name, as (module, attribute in module)
+    'api': ('sparksqlformatter.src.api', None),
+    'runner': ('sparksqlformatter.src.runner', None),
+    'discovery': ('sparksqlformatter.src.discovery', None),
+    'Style': ('sparksqlformatter.src.style', 'Style'),
+    'Formatter': ('sparksqlformatter.src.formatter', 'Formatter'),
+    'FileCache': ('sparksqlformatter.src.file_cache', 'FileCache')
+}
+SLOWEST_FILES = 10  # number of the slowest files in the report of --stats
+LOG_FORMAT = '[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s:%(funcName)s] %(message)s'
 
-logger = logging.getLogger(__name__)
-log_formatter = '[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s:%(funcName)s] %(message)s'
-logging.basicConfig(stream=sys.stdout, level=logging.INFO, format=log_formatter)
+
+def __getattr__(name):
+    '''
+    Import the attributes of the package in LAZY_ATTRIBUTES on first use, e.g., by "from sparksqlformatter import api".
+
+    Parameters
+    name: string
+        The name of the attribute.
+
+    Return: module, class or function
+        The attribute.
+    '''
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+    import importlib
+    moduleName, attribute = LAZY_ATTRIBUTES[name]
+    value = importlib.import_module(moduleName)
+    if attribute is not None:
+        value = getattr(value, attribute)
+    globals()[name] = value  # later uses do not call __getattr__()
+    return value
 
 
 def main(argv):
@@ -45,17 +67,209 @@ def main(argv):
     Parameters
     argv: list
         List of arguments in sys.argv, excluding the first argument which is the script itself.
+
+    Return: int
+        The exit status, 0 if all files are formatted, 1 if any file fails to be formatted or, with --check, if any file
+        would change.
     '''
+    import logging
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format=LOG_FORMAT)  # keep stdout for the output
     args = get_arguments(argv)
-    style = args['style']
+    if args['profile'] or args['profile_output'] or args['stats'] or args['stats_output']:
+        return run_with_profile(args)
+    return run(args)
+
+
+def run(args, counts=None):
+    '''
+    Format the files or run the server as given by the command-line arguments.
+
+    Parameters
+    args: dict
+        The arguments, see get_arguments().
+    counts: dict
+        If given, will be filled with the numbers of files by outcome, i.e., "changed", "unchanged", "failed" and
+        "unknown", i.e., formatted to stdout without finding out whether formatting changes them.
+
+    Return: int
+        The exit status, see main().
+    '''
+    import logging
+    import multiprocessing
+    from sparksqlformatter.src import api
+    from sparksqlformatter.src import runner
+    from sparksqlformatter.src import discovery
+    from sparksqlformatter.src.file_cache import FileCache
+
+    logger = logging.getLogger(__name__)
+    style = api._get_style(args['style'] or None)
+    if args['serve']:
+        from sparksqlformatter.src import server  # only needed when serving
+        server.serve(args['address'], style)
+        return 0
     filePaths = args['files']
+    status = 0
+    counts = {} if counts is None else counts
+    counts.update({'changed': 0, 'unchanged': 0, 'failed': 0, 'unknown': 0})
     if filePaths:
-        if style:
-            for filePath in filePaths:
-                api.format_file(filePath=filePath, style=style, inPlace=args.get('in_place'))
+        jobs = args['jobs'] if args['jobs'] else multiprocessing.cpu_count()
+        filePaths = discovery.discover_files(filePaths,
+                                             include=args['include'],
+                                             exclude=args['exclude'],
+                                             useGitignore=not args['no_gitignore'])
+        cache = None if args['no_cache'] else FileCache(style, directory=args['cache_dir'])
+        for result in runner.format_files(filePaths,
+                                          style=style,
+                                          inPlace=args.get('in_place'),
+                                          jobs=jobs,
+                                          cache=cache,
+                                          check=args['check'],
+                                          diff=args['diff']):
+            if result.error is not None:
+                logger.error('Failed to format ' + result.filePath + ': ' + result.error)
+                counts['failed'] += 1
+                status = 1
+            elif result.changed:
+                if args['check'] and not args['diff']:
+                    logger.info('Would reformat ' + result.filePath)
+                counts['changed'] += 1
+                status = 1 if args['check'] else status
+            elif result.changed is None:  # written to stdout
+                counts['unknown'] += 1
+            else:
+                counts['unchanged'] += 1
+        if args['in_place'] or (args['check'] and not args['diff']):  # other modes write files to stdout
+            logger.info(summarize(counts, args['check']))
+    return status
+
+
+def run_with_profile(args):
+    '''
+    Run run() while profiling, then write the summary of the profile to stderr if args['profile'], the statistics of
+    cProfile to the file in args['profile_output'] if given, which can be read by pstats, e.g., python -m pstats <file>,
+    and the report of get_stats() in JSON to the file in args['stats_output'] if given, else to stderr if args['stats'].
+
+    Parameters
+    args: dict
+        The arguments, see get_arguments().
+
+    Return: int
+        The exit status, see main().
+    '''
+    from sparksqlformatter.src import profiling
+
+    profiler = None
+    if args['profile_output']:
+        import cProfile
+        profiler = cProfile.Profile()
+    slowest = profiling.SlowestCalls(SLOWEST_FILES)
+    counts = {}
+    with profiling.profile(callback=slowest) as profile:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            status = run(args, counts)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    if profiler is not None:
+        profiler.dump_stats(args['profile_output'])
+    if args['profile'] or args['profile_output']:
+        sys.stderr.write(profile.summary() + '\n')
+    if args['stats'] or args['stats_output']:
+        import json
+        report = json.dumps(get_stats(profile, counts, slowest.get()), indent=2, sort_keys=True) + '\n'
+        if args['stats_output']:
+            with open(args['stats_output'], 'w') as f:
+                f.write(report)
         else:
-            for filePath in filePaths:
-                api.format_file(filePath=filePath, inPlace=args.get('in_place'))
+            sys.stderr.write(report)
+    return status
+
+
+def get_stats(profile, counts, slowestCalls):
+    '''
+    Get the report of a run for --stats, e.g., the throughput and the slowest files.
+
+    Parameters
+    profile: profiling.Profile() object
+        The profile of the run.
+    counts: dict
+        Numbers of files by outcome, i.e., "changed", "unchanged", "failed" and "unknown".
+    slowestCalls: list
+        Profile() objects of the slowest files, the slowest first, see profiling.SlowestCalls.
+
+    Return: dict
+        The report, which can be serialized to JSON.
+    '''
+    from sparksqlformatter.src import profiling
+    from sparksqlformatter.src.version import VERSION
+
+    def rate(count):
+        return count / profile.wallTime if profile.wallTime > 0 else None
+
+    return {
+        'version':
+        VERSION,
+        'wallSeconds':
+        profile.wallTime,
+        'files': {
+            'total': profile.counts.get('files', 0),
+            'changed': counts.get('changed', 0),
+            'unchanged': counts.get('unchanged', 0),
+            'failed': counts.get('failed', 0),
+            'unknown': counts.get('unknown', 0),
+            'cached': profile.counts.get('fileCacheHits', 0)
+        },
+        'inputBytes':
+        profile.counts.get('inputBytes', 0),
+        'tokens':
+        profile.counts.get('tokens', 0),
+        'filesPerSecond':
+        rate(profile.counts.get('files', 0)),
+        'bytesPerSecond':
+        rate(profile.counts.get('inputBytes', 0)),
+        'tokensPerSecond':
+        rate(profile.counts.get('tokens', 0)),
+        'phases':
+        dict(profile.times),
+        'counters':
+        dict(profile.counts),
+        'slowestFiles': [{
+            'filePath': callProfile.name,
+            'seconds': callProfile.wallTime,
+            'bytes': callProfile.counts.get('inputBytes', 0),
+            'tokens': callProfile.counts.get('tokens', 0)
+        } for callProfile in slowestCalls],
+        'peakRssBytes':
+        profiling.get_peak_rss(),
+        'peakChildrenRssBytes':
+        profiling.get_peak_rss(children=True)
+    }
+
+
+def summarize(counts, check=False):
+    '''
+    Summarize the numbers of files changed, unchanged and failed to be formatted.
+
+    Parameters
+    counts: dict
+        Numbers of files by outcome, i.e., "changed", "unchanged" and "failed".
+    check: bool
+        If True, the files were only checked and not changed.
+
+    Return: string
+        The summary, e.g., "2 files reformatted, 10 files left unchanged".
+    '''
+    def files(count):
+        return str(count) + (' file' if count == 1 else ' files')
+
+    parts = [files(counts['changed']) + (' would be reformatted' if check else ' reformatted')]
+    parts.append(files(counts['unchanged']) + (' would be left unchanged' if check else ' left unchanged'))
+    if counts['failed']:
+        parts.append(files(counts['failed']) + ' failed to be formatted')
+    return ', '.join(parts)
 
 
 def get_arguments(argv):
@@ -69,11 +283,91 @@ def get_arguments(argv):
     Returns: dict
         A dictionary containing arguments for the formatter.
     '''
+    import argparse
+    from sparksqlformatter.src import discovery
+
     parser = argparse.ArgumentParser(description='Formatter for SparkSQL queries.')
 
-    parser.add_argument('-f', '--files', type=str, nargs='+', help='Paths to files to format.')
+    parser.add_argument(
+        '-f',
+        '--files',
+        type=str,
+        nargs='+',
+        help='Paths to files, directories or glob patterns to format. Directories are walked recursively.')
+
+    parser.add_argument('--include',
+                        type=str,
+                        nargs='+',
+                        default=discovery.DEFAULT_INCLUDE,
+                        help='Patterns of names of files to format in directories, default to *.sql.')
+
+    parser.add_argument('--exclude',
+                        type=str,
+                        nargs='+',
+                        default=[],
+                        help='.gitignore-style patterns of files and directories to skip.')
+
+    parser.add_argument('--no-gitignore',
+                        action='store_true',
+                        help='Format files in directories even if they are ignored by .gitignore files.')
+
+    mode = parser.add_mutually_exclusive_group()
+
+    mode.add_argument('-i', '--in-place', action='store_true', help='Format the files in place.')
+
+    parser.add_argument('--check',
+                        action='store_true',
+                        help='Do not write the files, exit with status 1 if any file would change.')
+
+    mode.add_argument('--diff',
+                      action='store_true',
+                      help='Do not write the files, write the diff of each file that would change to stdout.')
 
-    parser.add_argument('-i', '--in-place', action='store_true', help='Format the files in place.')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=None,
+                        help='Number of processes to format the files in, default to the number of CPUs.')
+
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        default=None,
+                        help='Directory of the cache of formatted files, default to ~/.cache/sparksqlformatter.')
+
+    parser.add_argument('--no-cache', action='store_true', help='Format all files, even those known to be formatted.')
+
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Run a server that formats queries sent by sparksqlformatter.src.client until interrupted.')
+
+    parser.add_argument('--address',
+                        type=str,
+                        default=None,
+                        help='Address of the server, a Unix domain socket path or host:port, default to a socket in '
+                        '$XDG_RUNTIME_DIR or the temporary directory.')
+
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Write the time spent reading, tokenizing, formatting and writing, and counters, e.g., '
+                        'of tokens and cache hits, to stderr at the end.')
+
+    parser.add_argument('--profile-output',
+                        type=str,
+                        default=None,
+                        help='Like --profile, and also write the statistics of cProfile for this process to the file, '
+                        'which can be read with python -m pstats.')
+
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Write a report in JSON to stderr at the end, e.g., of files, bytes and tokens per second, '
+        'the slowest files, the peak memory and the numbers of files changed, unchanged and failed.')
+
+    parser.add_argument('--stats-output',
+                        type=str,
+                        default=None,
+                        help='Like --stats, but write the report to the file.')
 
     parser.add_argument('--style',
                         type=str,
@@ -81,6 +375,8 @@ def get_arguments(argv):
                         help="Style configurations for SparkSQL. Can be a path to a style config file or a dictionary.")
 
     args = vars(parser.parse_args(argv[1:]))
+    if args['in_place'] and args['check']:  # --check may be combined with --diff, so it is not in the group
+        parser.error('argument --check: not allowed with argument -i/--in-place')
 
     return args
 
@@ -89,8 +385,9 @@ def run_main():
     '''
     Entry point for console_scripts in setup.py
     '''
-    main(sys.argv)
+    sys.exit(main(sys.argv))
 
 
 if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     run_main()
@@ -24,23 +24,28 @@
 from io import open  # for open() in Python 2
 import sys
 import re
-import logging
-if sys.version_info[0] >= 3:
-    import configparser
-else:
-    from backports import configparser
-import ast
+import os
+import time
+import stat
 
 from sparksqlformatter.src.style import Style
 from sparksqlformatter.src.formatter import Formatter
 from sparksqlformatter.src.style import DEFAULT_STYLE_SECTION
+from sparksqlformatter.src.cache import LRUCache, FormatCache
+from sparksqlformatter.src import profiling
 
-logger = logging.getLogger(__name__)
-log_formatter = '[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s:%(funcName)s] %(message)s'
-logging.basicConfig(stream=sys.stdout, level=logging.INFO, format=log_formatter)
+# the modules only needed by some of the functions, e.g., configparser, multiprocessing and logging, are imported by
+# them, so that importing the package stays fast; logging is not configured, which is left to the application
 
+FORMATTER_CACHE = LRUCache(maxSize=64)  # formatters of recently used styles, keyed by style
+STYLE_CACHE = LRUCache(maxSize=64)  # styles loaded from recently used files and dictionaries, see _get_style()
+QUERY_CHUNK_SIZE = 256  # default number of queries sent to a worker process at once by format_queries()
 
-def format_file(filePath, style=Style(), inPlace=False):
+WORKER_FORMATTER = None  # the formatter of a worker process of format_queries(), created once by _init_worker()
+WORKER_FORMAT_CACHE = None  # the format cache of a worker process of format_queries(), if any
+
+
+def format_file(filePath, style=None, inPlace=False):
     '''
     Format given file with given styleurations.
 
@@ -48,28 +53,18 @@ def format_file(filePath, style=Style(), inPlace=False):
     filePath: string
         Path to the file to format.
     style: string, dict, or sparksqlformatter.src.style.Style() object
-        Styleurations for the query language.
+        Styleurations for the query language, default to Style().
     inPlace: bool
         If True, will format the file in place.
         Else, will write the formatted file to stdout.
     '''
-    if type(style) == type(Style()):  # style is a Style() object
-        formatter = Formatter(style=style)
-    else:  # create Style() object from style
-        if type(style) == str:
-            if style.startswith('{'):  # style is a dictionary in string
-                style = eval(style)
-                formatter = Formatter(style=_create_style_from_dict(style))
-            else:  # style is a file path
-                formatter = Formatter(style=_create_style_from_file(style))
-        elif type(style) == dict:  # style is a dictionary
-            formatter = Formatter(style=_create_style_from_dict(style))
-        else:
-            raise Exception('Unsupported style type')
-    _format_file(filePath, formatter, inPlace)
+    formatter = _get_formatter(style)
+    with profiling.call(filePath):
+        profiling.count('files')
+        _format_file(filePath, formatter, inPlace)
 
 
-def format_query(query, style=Style()):
+def format_query(query, style=None, formatCache=None):
     '''
     Format query using given styleurations.
 
@@ -77,28 +72,193 @@ def format_query(query, style=Style()):
     query: string
         The query to be formatted.
     style: string, dict, or sparksqlformatter.src.style.Style() object
-        Styleurations for the query language.
+        Styleurations for the query language, default to Style().
+    formatCache: sparksqlformatter.src.cache.FormatCache() object
+        If given, reuse the queries and statements formatted before, see Formatter.format().
     
     Return: string
         The formatted query.
     '''
-    if type(style) == type(Style()):
-        formatter = Formatter(style=style)
+    formatter = _get_formatter(style)
+    return _format_query(query, formatter, formatCache)
+
+
+def format_queries(queries, style=None, workers=1, chunkSize=QUERY_CHUNK_SIZE, formatCache=None):
+    '''
+    Format given queries using given styleurations. The style is resolved once and one formatter formats all queries,
+    or one formatter per worker process if workers > 1.
+
+    Parameters
+    queries: iterable
+        The queries to be formatted, consumed lazily.
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for the query language, default to Style().
+    workers: int
+        Number of worker processes. If 1, will format the queries in this process.
+    chunkSize: int
+        Number of queries sent to a worker process at once.
+    formatCache: sparksqlformatter.src.cache.FormatCache() object
+        If given, reuse the queries and statements formatted before, see Formatter.format().
+        If workers > 1, each worker process uses its own empty cache with the same limits instead.
+
+    Return: generator
+        Generator of (formattedQuery, error) tuples in the order of queries. If a query fails to be formatted,
+        formattedQuery is None and error is the exception raised, else error is None. A failed query does not stop
+        the other queries.
+    '''
+    formatter = _get_formatter(style)
+    if workers <= 1:
+        for query in queries:
+            yield _format_query_safely(query, formatter, formatCache)
+        return
+    cacheLimits = None if formatCache is None else (formatCache.maxSize, formatCache.maxBytes)
+    import multiprocessing  # only needed with workers
+    pool = multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=(formatter.style, cacheLimits))
+    try:
+        for result in pool.imap(_format_query_in_worker, queries, chunkSize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _init_worker(style, cacheLimits=None):
+    '''
+    Create the formatter and format cache of a worker process of format_queries().
+
+    Parameters
+    style: sparksqlformatter.src.style.Style() object
+        Styleurations for the query language.
+    cacheLimits: tuple
+        The maxSize and maxBytes of the format cache, or None for no cache.
+    '''
+    global WORKER_FORMATTER, WORKER_FORMAT_CACHE
+    WORKER_FORMATTER = _get_formatter(style)
+    WORKER_FORMAT_CACHE = None if cacheLimits is None else FormatCache(*cacheLimits)
+
+
+def _format_query_in_worker(query):
+    '''
+    Format one query in a worker process of format_queries().
+
+    Parameters
+    query: string
+        The query to format.
+
+    Return: tuple
+        The formatted query and the exception raised, see format_queries().
+    '''
+    return _format_query_safely(query, WORKER_FORMATTER, WORKER_FORMAT_CACHE)
+
+
+def _format_query_safely(query, formatter, formatCache=None):
+    '''
+    Format given query using given formatter, returning the exception raised instead of raising it.
+
+    Parameters
+    query: string
+        The query to format.
+    formatter: sparksqlformatter.src.formatter.Formatter object
+        Formatter.
+    formatCache: sparksqlformatter.src.cache.FormatCache() object
+        The format cache, if any.
+
+    Return: tuple
+        The formatted query and the exception raised, see format_queries().
+    '''
+    try:
+        return formatter.format(query, formatCache), None
+    except Exception as e:
+        return None, e
+
+
+def _get_formatter(style):
+    '''
+    Get the formatter for given styleurations from FORMATTER_CACHE, creating it on a miss.
+    Formatters keep no state between queries, so one formatter is reused for all queries with the same style.
+
+    Parameters
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for the query language, default to Style().
+
+    Return: sparksqlformatter.src.formatter.Formatter() object
+        The formatter.
+    '''
+    style = _get_style(style)
+    formatter = FORMATTER_CACHE.get(style)
+    if formatter is None:
+        formatter = Formatter(style=style)  # styles cannot be changed, so the style need not be copied
+        FORMATTER_CACHE.put(style, formatter)
+    return formatter
+
+
+def _get_style(style):
+    '''
+    Create Style() object from given styleurations.
+    Styles created from files and dictionaries are kept in STYLE_CACHE, so that a style file is only read and parsed
+    again if its size or mtime changes, and a dictionary is only parsed again if its contents change.
+
+    Parameters
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for the query language, default to Style().
+
+    Return: sparksqlformatter.src.style.Style() object
+        The Style() object.
+    '''
+    if isinstance(style, Style):
+        return style
+    if style is None:  # the default style
+        key = ('default', )
+        create = Style
+    elif type(style) == str:
+        if style.startswith('{'):  # style is a dictionary in string
+            key = ('string', style)
+            create = lambda: _create_style_from_dict(_literal_eval(style))
+        else:  # style is a file path
+            key = _get_style_file_key(style)
+            create = lambda: _create_style_from_file(style)
+    elif type(style) == dict:  # style is a dictionary
+        import json  # only needed for styles in dictionaries
+        try:
+            key = ('dict', json.dumps(style, sort_keys=True, default=repr))
+        except TypeError:  # keys that cannot be sorted
+            key = None
+        create = lambda: _create_style_from_dict(style)
     else:
-        if type(style) == str:
-            if style.startswith('{'):
-                style = eval(style)
-                formatter = Formatter(style=_create_style_from_dict(style))
-            else:
-                formatter = Formatter(style=_create_style_from_file(style))
-        elif type(style) == dict:
-            formatter = Formatter(style=_create_style_from_dict(style))
-        else:
-            raise Exception('Unsupported style type')
-    return _format_query(query, formatter)
+        raise Exception('Unsupported style type')
+    if key is None:
+        return create()
+    styleObject = STYLE_CACHE.get(key)
+    if styleObject is None:
+        styleObject = create()
+        STYLE_CACHE.put(key, styleObject)
+    return styleObject
+
+
+def _get_style_file_key(styleFilePath):
+    '''
+    Get the key in STYLE_CACHE of the style in given file, which changes with the size and mtime of the file.
+
+    Parameters
+    styleFilePath: string
+        Path to the style file.
+
+    Return: tuple
+        The key, or None if the file does not exist or was modified too recently for its mtime to tell whether it
+        changes again.
+    '''
+    from sparksqlformatter.src.file_cache import RACY_WINDOW_NS  # the rest of file_cache is only used by the CLI
+    try:
+        fileStat = os.stat(styleFilePath)
+    except OSError:  # let _create_style_from_file() report the missing file
+        return None
+    if time.time() * 10**9 - fileStat.st_mtime_ns < RACY_WINDOW_NS:
+        return None
+    return ('file', os.path.abspath(styleFilePath), fileStat.st_size, fileStat.st_mtime_ns)
 
 
-def _format_file(filePath, formatter, inPlace=False):
+def _format_file(filePath, formatter, inPlace=False, output=None):
     '''
     The I/O helper function for format_file(). Read from given file, format it, and write to specified output.
 
@@ -109,15 +269,27 @@ def _format_file(filePath, formatter, inPlace=False):
         Formatter.
     inPlace: bool
         If True, will format the file in place.
-        Else, will write the formatted file to stdout.
+        Else, will write the formatted file to output.
+    output: file object
+        Stream to write the formatted file to if not inPlace, default to sys.stdout.
+
+    Return: tuple
+        The formatted file and whether it differs from the file if inPlace, else None.
     '''
-    query = _read_from_file(filePath)
-    formattedQuery = _format_query(query, formatter)
-    if inPlace:  # overwrite file
-        logger.info('Writing to ' + filePath + '...')
-        _write_to_file(formattedQuery, filePath)
-    else:  # write to stdout
-        sys.stdout.write(formattedQuery)
+    if inPlace:  # overwrite file if it changes
+        with profiling.phase('read'):
+            content, query = _read_content_from_file(filePath)
+        formattedQuery = _format_query(query, formatter)
+        changed = formattedQuery.encode('utf-8') != content
+        if changed:  # an unchanged file keeps its mtime
+            import logging
+            logging.getLogger(__name__).debug('Writing to ' + filePath + '...')
+            with profiling.phase('write'):
+                _write_to_file(formattedQuery, filePath)
+        return formattedQuery, changed
+    else:  # write to output one statement at a time, so that large files are not read into memory
+        with open(file=filePath, mode='r', newline=None, encoding='utf-8') as f:
+            formatter.format_stream(f, output if output is not None else sys.stdout)
 
 
 def _read_from_file(filePath):
@@ -137,9 +309,29 @@ def _read_from_file(filePath):
     return text
 
 
+def _read_content_from_file(filePath):
+    '''
+    The input helper function for _format_file() when formatting in place. Read from given file and return its content
+    both as it is and as returned by _read_from_file().
+
+    Parameters
+    filePath: string
+        Path to the file to format.
+
+    Return: tuple
+        The file content in bytes, and the file content decoded with newlines translated to "\n".
+    '''
+    with open(file=filePath, mode='rb') as f:
+        content = f.read()
+    return content, content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
 def _write_to_file(formattedQuery, filePath):
     '''
     The output helper function for _format_file(). Write formatted query to given file.
+    The query is written to a temporary file in the same directory, which then replaces the file atomically, so that
+    the file is never left half-written. The permissions, owner and group of the file are kept. If the owner or group
+    cannot be given to the temporary file, e.g., the file belongs to another user, the file is written in place instead.
 
     Parameters
     formattedQuery: string
@@ -147,12 +339,35 @@ def _write_to_file(formattedQuery, filePath):
     filePath: string
         Path to the file to write to.
     '''
-    # see https://docs.python.org/3.5/library/functions.html#open
-    with open(file=filePath, mode='w', newline='\n', encoding='utf-8') as f:
-        f.write(formattedQuery)
-
-
-def _format_query(query, formatter):
+    filePath = os.path.realpath(filePath)  # replace the target of a symbolic link, not the link
+    import tempfile  # only needed to format files in place
+    descriptor, temporaryPath = tempfile.mkstemp(prefix='.' + os.path.basename(filePath) + '.',
+                                                 suffix='.tmp',
+                                                 dir=os.path.dirname(filePath))
+    try:
+        # see https://docs.python.org/3.5/library/functions.html#open
+        with open(file=descriptor, mode='w', newline='\n', encoding='utf-8') as f:
+            f.write(formattedQuery)
+        if os.path.exists(filePath):
+            fileStat = os.stat(filePath)
+            temporaryStat = os.stat(temporaryPath)  # created with mode 0600 and the owner and group of this process
+            if (fileStat.st_uid, fileStat.st_gid) != (temporaryStat.st_uid, temporaryStat.st_gid):
+                try:
+                    os.chown(temporaryPath, fileStat.st_uid, fileStat.st_gid)
+                except (AttributeError, OSError):  # os.chown() is not available on Windows
+                    os.remove(temporaryPath)
+                    with open(filePath, mode='w', newline='\n', encoding='utf-8') as f:
+                        f.write(formattedQuery)
+                    return
+            os.chmod(temporaryPath, stat.S_IMODE(fileStat.st_mode))  # after chown(), which may clear setuid bits
+        os.replace(temporaryPath, filePath)
+    except BaseException:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
+
+
+def _format_query(query, formatter, formatCache=None):
     '''
     The wrapper function for format_query(). Format a given query using given formatter.
 
@@ -161,11 +376,13 @@ def _format_query(query, formatter):
         The query to format.
     formatter: sparksqlformatter.src.formatter.Formatter object
         Formatter.
+    formatCache: sparksqlformatter.src.cache.FormatCache() object
+        The format cache, if any.
     
     Return: string
         The formatted query
     '''
-    return formatter.format(query)
+    return formatter.format(query, formatCache)
 
 
 def _create_style_from_dict(styleDict, defaultStyleSection=DEFAULT_STYLE_SECTION):
@@ -181,8 +398,7 @@ def _create_style_from_dict(styleDict, defaultStyleSection=DEFAULT_STYLE_SECTION
     Return: sparksqlformatter.src.style.Style() object
         The Style() object created from styleDict.
     '''
-    styleParser = configparser.ConfigParser()
-    styleParser.optionxform = str  # makes the parser case-sensitive
+    styleParser = _create_style_parser()
     if defaultStyleSection not in styleDict:
         styleDict = {defaultStyleSection: styleDict}  # add top-level section
     styleParser.read_dict(styleDict)  # styleParser assumes the existence of a top-level section
@@ -204,8 +420,7 @@ def _create_style_from_file(styleFilePath, defaultStyleSection=DEFAULT_STYLE_SEC
     Return: sparksqlformatter.src.style.Style() object
         The Style() object created from the style file.
     '''
-    styleParser = configparser.ConfigParser()
-    styleParser.optionxform = str  # makes the parser case-sensitive
+    styleParser = _create_style_parser()
     styleParser.read(styleFilePath)
     if defaultStyleSection in styleParser:
         styleDict = _parse_args_in_correct_type(styleParser, defaultStyleSection)
@@ -233,5 +448,36 @@ def _parse_args_in_correct_type(styleParser, defaultStyleSection=DEFAULT_STYLE_S
         if key == 'indent' and sys.version_info < (3, 9):  # https://github.com/largecats/sparksql-formatter/issues/72
             args[key] = value
         else:
-            args[key] = ast.literal_eval(value)
+            args[key] = _literal_eval(value)
     return args
+
+
+def _create_style_parser():
+    '''
+    Create a parser for style files, importing configparser on first use, as styles are cached by _get_style().
+
+    Return: a configparser.ConfigParser() object
+        Parser for style files, which is case-sensitive.
+    '''
+    if sys.version_info[0] >= 3:
+        import configparser
+    else:
+        from backports import configparser
+    styleParser = configparser.ConfigParser()
+    styleParser.optionxform = str  # makes the parser case-sensitive
+    return styleParser
+
+
+def _literal_eval(value):
+    '''
+    Evaluate given string as a Python literal, importing ast on first use, as styles are cached by _get_style().
+
+    Parameters
+    value: string
+        The literal, e.g., a dictionary or a list.
+
+    Return: object
+        The value of the literal.
+    '''
+    import ast
+    return ast.literal_eval(value)
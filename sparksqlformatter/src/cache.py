@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import sys
+import threading
+from collections import OrderedDict
+
+ENTRY_OVERHEAD = 256  # approximate bytes taken by an entry of FormatCache() besides its key and text
+
+
+class LRUCache:
+    '''
+    Class for a thread-safe cache that evicts the least recently used entries when it is full.
+    '''
+    def __init__(self, maxSize=128):
+        '''
+        Parameters
+        maxSize: int
+            Maximum number of entries in the cache.
+        '''
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        '''
+        Get the value cached under given key and mark it as most recently used.
+
+        Parameters
+        key: hashable
+            The key of the entry.
+        default: object
+            The value to return if there is no entry with given key.
+
+        Return: object
+            The cached value, or default if there is none.
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        '''
+        Cache value under given key, evicting the least recently used entries if the cache is full.
+
+        Parameters
+        key: hashable
+            The key of the entry.
+        value: object
+            The value to cache.
+        '''
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Remove all entries and reset the hit and miss counters.
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        '''
+        Get statistics of the cache.
+
+        Return: dict
+            Number of hits, misses, entries and the maximum number of entries.
+        '''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxSize': self.maxSize}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FormatCache(LRUCache):
+    '''
+    Class for a thread-safe cache of formatted queries and statements, see Formatter.format(), that evicts the least
+    recently used entries when it has more than maxSize entries or takes more than about maxBytes bytes.
+    The entries are keyed by hashes that include the style fingerprint, so one cache can be shared by formatters of
+    different styles.
+    '''
+    def __init__(self, maxSize=100000, maxBytes=64 * 1024 * 1024):
+        '''
+        Parameters
+        maxSize: int
+            Maximum number of entries in the cache.
+        maxBytes: int
+            Maximum number of bytes taken by the entries, counting the formatted text, the key and ENTRY_OVERHEAD
+            per entry.
+        '''
+        LRUCache.__init__(self, maxSize)
+        self.maxBytes = maxBytes
+        self.sizes = {}  # bytes taken by each entry
+        self.bytes = 0
+
+    def put(self, key, value):
+        '''
+        Cache value under given key, evicting the least recently used entries if the cache is full.
+        A value that alone takes more than maxBytes is not cached.
+
+        Parameters
+        key: bytes
+            The key of the entry.
+        value: string or tuple
+            The formatted query, or a tuple whose first item is the formatted statement.
+        '''
+        text = value if isinstance(value, str) else value[0]
+        size = sys.getsizeof(key) + sys.getsizeof(text) + ENTRY_OVERHEAD
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+                self.bytes -= self.sizes.pop(key)
+            if size > self.maxBytes:
+                return
+            self.entries[key] = value
+            self.sizes[key] = size
+            self.bytes += size
+            while len(self.entries) > self.maxSize or self.bytes > self.maxBytes:
+                oldKey, _ = self.entries.popitem(last=False)
+                self.bytes -= self.sizes.pop(oldKey)
+
+    def clear(self):
+        '''
+        Remove all entries and reset the hit and miss counters.
+        '''
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        '''
+        Get statistics of the cache.
+
+        Return: dict
+            Number of hits, misses, hit rate, entries, bytes and their maximums.
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': float(self.hits) / lookups if lookups else 0.0,
+                'size': len(self.entries),
+                'maxSize': self.maxSize,
+                'bytes': self.bytes,
+                'maxBytes': self.maxBytes
+            }
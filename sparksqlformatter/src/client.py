@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Client of the formatter server started by `sparksqlformatter --serve`, see server.py.
+
+This module only imports the standard library, so that editors can format a query on save without paying for
+importing the formatter, e.g.,
+    python -m sparksqlformatter.src.client < query.sql
+"""
+from __future__ import print_function  # for print() in Python 2
+import os
+import re
+import sys
+import json
+import socket
+
+TCP_ADDRESS_REGEX = re.compile(r'^([\w.-]*):(\d+)$')  # e.g., "127.0.0.1:7438", anything else is a socket path
+DEFAULT_TCP_ADDRESS = '127.0.0.1:7438'  # used where Unix domain sockets are not available
+
+
+class ServerError(Exception):
+    '''
+    Raised by Client() when the server fails to format a query.
+    '''
+    pass
+
+
+def get_default_address():
+    '''
+    Get the default address of the server, i.e., a Unix domain socket in $XDG_RUNTIME_DIR or the temporary directory,
+    or DEFAULT_TCP_ADDRESS where Unix domain sockets are not available.
+
+    Return: string
+        Path to the socket, or "host:port".
+    '''
+    if not hasattr(socket, 'AF_UNIX'):
+        return DEFAULT_TCP_ADDRESS
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        import tempfile  # imported here, as are the other modules only needed by some of the functions
+        directory = tempfile.gettempdir()
+    user = str(os.getuid()) if hasattr(os, 'getuid') else os.environ.get('USERNAME', '')
+    return os.path.join(directory, 'sparksqlformatter-' + user + '.sock')
+
+
+def parse_address(address):
+    '''
+    Parse given server address.
+
+    Parameters
+    address: string
+        Path to a Unix domain socket, or "host:port" of a TCP socket.
+
+    Return: tuple
+        The socket family and the address in the form expected by socket.connect() and socket.bind().
+    '''
+    match = TCP_ADDRESS_REGEX.match(address)
+    if match:
+        return socket.AF_INET, (match.group(1) or '127.0.0.1', int(match.group(2)))
+    return socket.AF_UNIX, address
+
+
+class Client:
+    '''
+    Class for a connection to the formatter server. Requests and responses are JSON objects, one per line.
+    '''
+    def __init__(self, address=None, timeout=None):
+        '''
+        Parameters
+        address: string
+            Address of the server, default to get_default_address().
+        timeout: float
+            Timeout in seconds of connecting and of each request, default to no timeout.
+        '''
+        self.address = address if address else get_default_address()
+        self.timeout = timeout
+        self.socket = None
+        self.reader = None
+
+    def connect(self):
+        '''
+        Connect to the server, unless already connected.
+        '''
+        if self.socket is None:
+            family, address = parse_address(self.address)
+            connection = socket.socket(family, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(address)
+            except Exception:
+                connection.close()
+                raise
+            self.socket = connection
+            self.reader = connection.makefile(mode='rb')
+
+    def close(self):
+        '''
+        Close the connection to the server.
+        '''
+        if self.socket is not None:
+            self.reader.close()
+            self.socket.close()
+            self.socket = None
+            self.reader = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, request):
+        '''
+        Send given request to the server and wait for its response.
+
+        Parameters
+        request: dict
+            The request.
+
+        Return: dict
+            The response.
+        '''
+        self.connect()
+        try:
+            self.socket.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            line = self.reader.readline()
+        except Exception:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise ServerError('Connection closed by the server')
+        return json.loads(line.decode('utf-8'))
+
+    def format(self, query, style=None):
+        '''
+        Format query using given styleurations on the server.
+
+        Parameters
+        query: string
+            The query to be formatted.
+        style: string, dict or None
+            Styleurations for the query language, as in api.format_query(), default to the style of the server. A
+            path to a style file is relative to the current directory of this process.
+
+        Return: string
+            The formatted query.
+        '''
+        request = {'query': query}
+        if isinstance(style, str) and not style.startswith('{'):
+            style = os.path.abspath(style)  # a path to a style file, relative to this process, not to the server
+        if style is not None:
+            request['style'] = style
+        response = self.request(request)
+        if 'error' in response:
+            raise ServerError(response['error'])
+        return response['formattedQuery']
+
+
+def main(argv):
+    '''
+    Format the query read from stdin on the server and write it to stdout.
+
+    Parameters
+    argv: list
+        List of arguments in sys.argv, excluding the first argument which is the script itself.
+
+    Return: int
+        The exit status, 0 if the query is formatted, else 1.
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='Format the query read from stdin with the SparkSQL formatter server.')
+    parser.add_argument('--address', type=str, default=None, help='Address of the server, a socket path or host:port.')
+    parser.add_argument('--style', type=str, default=None, help='Style configurations, as in sparksqlformatter.')
+    parser.add_argument('--timeout', type=float, default=None, help='Timeout in seconds.')
+    args = parser.parse_args(argv)
+    query = sys.stdin.read()
+    try:
+        with Client(args.address, timeout=args.timeout) as client:
+            formattedQuery = client.format(query, style=args.style)
+    except (ServerError, socket.error) as e:
+        print('sparksqlformatter client: ' + str(e), file=sys.stderr)
+        return 1
+    sys.stdout.write(formattedQuery)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
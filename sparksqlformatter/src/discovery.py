@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import re
+import glob
+import fnmatch
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INCLUDE = ['*.sql']
+GITIGNORE = '.gitignore'
+SKIPPED_DIRECTORIES = frozenset(['.git', '.hg', '.svn'])  # version control directories, never formatted
+GLOB_CHARACTERS = re.compile(r'[*?[]')
+GLOB_BASE = re.compile(r'[^*?[]*(?=[\\/])|')  # the leading directories of a glob pattern without glob characters
+
+
+class IgnoreRule:
+    '''
+    Class for one .gitignore-style rule, e.g., "build/", "/tmp/*.sql", "**/staging" or "!keep.sql".
+    '''
+    __slots__ = ['base', 'regex', 'negated', 'directoryOnly']
+
+    def __init__(self, base, pattern):
+        '''
+        Parameters
+        base: string
+            Absolute path of the directory the rule is relative to, e.g., the directory of the .gitignore file.
+        pattern: string
+            The rule in .gitignore syntax.
+        '''
+        self.base = base
+        self.negated = pattern.startswith('!')
+        if self.negated:
+            pattern = pattern[1:]
+        elif pattern.startswith('\\'):  # escaped leading "!" or "#"
+            pattern = pattern[1:]
+        self.directoryOnly = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        anchored = '/' in pattern  # a rule with a slash other than at the end is relative to base
+        pattern = pattern.lstrip('/')
+        self.regex = re.compile(('' if anchored else '(?:.*/)?') + translate(pattern) + '$')
+
+    def matches(self, relativePath, isDirectory):
+        '''
+        Check if the rule matches given path.
+
+        Parameters
+        relativePath: string
+            Path relative to the base of the rule, with "/" as separator.
+        isDirectory: bool
+            Whether the path is a directory.
+
+        Return: bool
+            True if the rule matches the path.
+        '''
+        if self.directoryOnly and not isDirectory:
+            return False
+        return self.regex.match(relativePath) is not None
+
+
+def translate(pattern):
+    '''
+    Translate a .gitignore-style pattern to a regex. "**" matches any number of directories, "*" and "?" do not match
+    "/".
+
+    Parameters
+    pattern: string
+        The pattern, without leading "!" and trailing "/".
+
+    Return: string
+        The regex.
+    '''
+    regex = ''
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif c == '*':
+            regex += '[^/]*'
+            i += 1
+        elif c == '?':
+            regex += '[^/]'
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                regex += re.escape(c)
+                i += 1
+            else:
+                characters = pattern[i + 1:end]
+                if characters.startswith('!'):
+                    characters = '^' + characters[1:]
+                regex += '[' + characters.replace('\\', '\\\\') + ']'
+                i = end + 1
+        elif c == '\\' and i + 1 < n:
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(c)
+            i += 1
+    return regex
+
+
+def read_ignore_rules(directory):
+    '''
+    Read the rules in the .gitignore file of given directory.
+
+    Parameters
+    directory: string
+        Absolute path of the directory.
+
+    Return: list
+        List of IgnoreRule() objects, empty if the directory has no .gitignore file.
+    '''
+    rules = []
+    try:
+        with open(os.path.join(directory, GITIGNORE), mode='r') as f:
+            for line in f:
+                line = line.rstrip('\r\n').rstrip(' ')
+                if line and not line.startswith('#'):
+                    rules.append(IgnoreRule(directory, line))
+    except (IOError, OSError):  # no readable .gitignore
+        pass
+    return rules
+
+
+def is_ignored(absolutePath, isDirectory, rules):
+    '''
+    Check if given path is ignored by given rules. As in .gitignore, the last rule that matches the path decides.
+
+    Parameters
+    absolutePath: string
+        Absolute path.
+    isDirectory: bool
+        Whether the path is a directory.
+    rules: list
+        List of IgnoreRule() objects, in the order of precedence.
+
+    Return: bool
+        True if the path is ignored.
+    '''
+    ignored = False
+    for rule in rules:
+        if rule.negated != ignored:  # the rule cannot change the outcome
+            continue
+        if absolutePath.startswith(rule.base + os.sep):
+            relativePath = absolutePath[len(rule.base) + 1:]
+        else:
+            relativePath = os.path.relpath(absolutePath, rule.base)
+        if os.sep != '/':
+            relativePath = relativePath.replace(os.sep, '/')
+        if rule.matches(relativePath, isDirectory):
+            ignored = not rule.negated
+    return ignored
+
+
+def get_parent_ignore_rules(directory):
+    '''
+    Get the rules in the .gitignore files of the parent directories of given directory, up to the root of the git
+    repository that contains it. If the directory is not in a git repository, there are no such rules.
+
+    Parameters
+    directory: string
+        Absolute path of the directory.
+
+    Return: list
+        List of IgnoreRule() objects, outermost directory first.
+    '''
+    parents = []
+    parent = os.path.dirname(directory)
+    while not os.path.isdir(os.path.join(directory, '.git')):
+        if parent == directory:  # reached the file system root without finding a repository
+            return []
+        parents.append(parent)
+        directory, parent = parent, os.path.dirname(parent)
+    rules = []
+    for parent in reversed(parents):
+        rules.extend(read_ignore_rules(parent))
+    return rules
+
+
+def discover_files(paths, include=DEFAULT_INCLUDE, exclude=[], useGitignore=True):
+    '''
+    Find the files to format in given paths, lazily, so that formatting can start before all directories are walked.
+
+    Parameters
+    paths: list
+        Paths to files, directories or glob patterns, e.g., "queries/**/*.sql". Directories are walked recursively.
+        Files given explicitly are always yielded, files matching a glob pattern are yielded if they are not excluded,
+        and files found by walking directories are yielded if they match include and are not excluded or ignored.
+    include: list
+        Patterns of names of files to format, e.g., "*.sql".
+    exclude: list
+        .gitignore-style rules, relative to the current directory, of files and directories to skip.
+    useGitignore: bool
+        If True, will also skip files and directories ignored by .gitignore files.
+
+    Return: generator
+        Generator of paths to the files, each yielded once, in the order of paths and in name order within each
+        directory.
+    '''
+    includeRegex = re.compile('|'.join(fnmatch.translate(pattern) for pattern in include))
+    cwd = os.path.abspath(os.curdir)
+    excludeRules = [IgnoreRule(cwd, pattern) for pattern in exclude]
+    seen = set()
+    for path in paths:
+        if os.path.exists(path) or not GLOB_CHARACTERS.search(path):
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            globBase = os.path.abspath(GLOB_BASE.match(path).group())  # the directory the pattern starts from
+            if not matches:
+                logger.warning('No files match ' + path)
+        for match in matches:
+            absolutePath = os.path.abspath(match)
+            if os.path.isdir(match):
+                ignoreRules = get_parent_ignore_rules(absolutePath) if useGitignore else []
+                for filePath in _walk(match, absolutePath, includeRegex, ignoreRules, excludeRules, useGitignore, seen):
+                    yield filePath
+            elif absolutePath in seen or (match != path and _is_excluded(absolutePath, globBase, excludeRules)):
+                continue
+            else:  # a file, or a missing path whose error is reported when formatting
+                seen.add(absolutePath)
+                yield match
+
+
+def _is_excluded(absolutePath, globBase, excludeRules):
+    '''
+    Check if given file matching a glob pattern, or any directory between it and the start of the pattern, is excluded
+    by given rules.
+
+    Parameters
+    absolutePath: string
+        Absolute path of the file.
+    globBase: string
+        Absolute path of the directory the glob pattern starts from.
+    excludeRules: list
+        List of IgnoreRule() objects given by the user.
+
+    Return: bool
+        True if the file is excluded.
+    '''
+    if is_ignored(absolutePath, False, excludeRules):
+        return True
+    directory = os.path.dirname(absolutePath)
+    while directory.startswith(globBase + os.sep) or directory == globBase:
+        if is_ignored(directory, True, excludeRules):
+            return True
+        directory = os.path.dirname(directory)
+    return False
+
+
+def _walk(directory, absoluteDirectory, includeRegex, ignoreRules, excludeRules, useGitignore, seen):
+    '''
+    Walk given directory recursively with os.scandir(), which gets the type of each entry without another stat call.
+
+    Parameters
+    directory: string
+        Path to the directory, as given by the user.
+    absoluteDirectory: string
+        Absolute path of the directory.
+    includeRegex: compiled regex
+        Regex of names of files to format.
+    ignoreRules: list
+        List of IgnoreRule() objects of the .gitignore files of the parent directories, outermost directory first.
+    excludeRules: list
+        List of IgnoreRule() objects given by the user, which take precedence over .gitignore files.
+    useGitignore: bool
+        If True, will also apply the rules of the .gitignore files of the directory and its sub-directories.
+    seen: set
+        Absolute paths of files already yielded.
+
+    Return: generator
+        Generator of paths to the files.
+    '''
+    if useGitignore:
+        ignoreRules = ignoreRules + read_ignore_rules(absoluteDirectory)  # deeper .gitignore files take precedence
+    rules = ignoreRules + excludeRules
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError as e:
+        logger.warning('Cannot read directory ' + directory + ': ' + str(e))
+        return
+    for entry in entries:
+        absolutePath = os.path.join(absoluteDirectory, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name in SKIPPED_DIRECTORIES or is_ignored(absolutePath, True, rules):
+                continue
+            for filePath in _walk(entry.path, absolutePath, includeRegex, ignoreRules, excludeRules, useGitignore,
+                                  seen):
+                yield filePath
+        elif entry.is_file() and includeRegex.match(entry.name) and not is_ignored(absolutePath, False, rules):
+            if absolutePath not in seen:
+                seen.add(absolutePath)
+                yield entry.path
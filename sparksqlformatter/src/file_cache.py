@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+from sparksqlformatter.src.version import VERSION
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = 'SPARKSQLFORMATTER_CACHE_DIR'
+HASH_CHUNK_SIZE = 64 * 1024
+RACY_WINDOW_NS = 2 * 10**9  # a file modified this recently may change again without changing its mtime
+SOURCE_DIGEST = None  # hash of the source files of the formatter, computed once by get_source_digest()
+
+
+def get_default_cache_dir():
+    '''
+    Get the default directory of the file cache, i.e., $SPARKSQLFORMATTER_CACHE_DIR if set, else sparksqlformatter in
+    $XDG_CACHE_HOME or ~/.cache.
+
+    Return: string
+        Path to the directory.
+    '''
+    directory = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if directory:
+        return directory
+    cacheHome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'sparksqlformatter')
+
+
+def get_source_digest():
+    '''
+    Hash the source files of the formatter, i.e., the modules of this package, so that a checkout or an editable
+    install whose formatter code changes without a new VERSION does not use the cache of the previous code.
+
+    Return: string
+        Hex digest of the names and contents of the source files.
+    '''
+    global SOURCE_DIGEST
+    if SOURCE_DIGEST is None:
+        digest = hashlib.sha1()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.py'):
+                digest.update(name.encode('utf-8') + b'\0')
+                with io.open(os.path.join(directory, name), mode='rb') as f:
+                    digest.update(f.read())
+        SOURCE_DIGEST = digest.hexdigest()
+    return SOURCE_DIGEST
+
+
+def hash_file(filePath):
+    '''
+    Hash the content of given file, reading it in chunks.
+
+    Parameters
+    filePath: string
+        Path to the file.
+
+    Return: string
+        Hex digest of the content.
+    '''
+    digest = hashlib.sha1()
+    with io.open(filePath, mode='rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_entry(stat, digest):
+    '''
+    Make the cache entry of a formatted file.
+
+    Parameters
+    stat: os.stat_result
+        Status of the file.
+    digest: string
+        Hex digest of the content of the file.
+
+    Return: list
+        Size, mtime in nanoseconds and digest of the file. The mtime of a file modified within RACY_WINDOW_NS is not
+        kept, so that the file is hashed again the next time it is looked up.
+    '''
+    mtime = stat.st_mtime_ns
+    if time.time() * 10**9 - mtime < RACY_WINDOW_NS:
+        mtime = None
+    return [stat.st_size, mtime, digest]
+
+
+class HashingWriter:
+    '''
+    Class for a stream that writes to another stream and hashes what is written, encoded in UTF-8.
+    '''
+    def __init__(self, output):
+        '''
+        Parameters
+        output: file object
+            The stream to write to.
+        '''
+        self.output = output
+        self.digest = hashlib.sha1()
+
+    def write(self, text):
+        '''
+        Write given text to the output stream.
+
+        Parameters
+        text: string
+            The text to write.
+        '''
+        self.digest.update(text.encode('utf-8'))
+        self.output.write(text)
+
+    def hexdigest(self):
+        '''
+        Get the hash of what is written so far.
+
+        Return: string
+            Hex digest of the text written, encoded in UTF-8.
+        '''
+        return self.digest.hexdigest()
+
+
+class FileCache:
+    '''
+    Class for the on-disk cache of files known to be formatted, so that they are not formatted again until they change.
+
+    The cache of a style is one JSON file in the cache directory, named after Style.fingerprint(), VERSION and
+    get_source_digest(), so that changing the style or the code of the formatter starts an empty cache. It maps the absolute path of each formatted
+    file to its size, mtime and content hash. A file whose size and mtime match its entry is formatted without reading
+    it; otherwise it is formatted if the hash of its content matches.
+    '''
+    def __init__(self, style, directory=None):
+        '''
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for the query language.
+        directory: string
+            Path to the cache directory, default to get_default_cache_dir().
+        '''
+        self.directory = directory if directory else get_default_cache_dir()
+        key = ':'.join([style.fingerprint(), VERSION, get_source_digest()])
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(self.directory, 'cache.' + key + '.json')
+        self.entries = self._read()
+        self.updates = {}
+
+    def _read(self):
+        '''
+        Read the entries of the cache file. A missing or unreadable cache file is treated as an empty cache.
+
+        Return: dict
+            Dictionary mapping absolute paths to entries.
+        '''
+        try:
+            with io.open(self.path, mode='r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def is_formatted(self, filePath, stat=None):
+        '''
+        Check if given file is known to be formatted.
+
+        Parameters
+        filePath: string
+            Path to the file.
+        stat: os.stat_result
+            Status of the file, default to os.stat(filePath).
+
+        Return: tuple
+            Whether the file is formatted, and the digest of its content if it was hashed, else None.
+        '''
+        return is_formatted(self.entries, filePath, stat)
+
+    def update(self, filePath, entry):
+        '''
+        Record that given file is formatted.
+
+        Parameters
+        filePath: string
+            Path to the file.
+        entry: list
+            The entry of the file, see make_entry().
+        '''
+        self.updates[os.path.abspath(filePath)] = entry
+
+    def save(self):
+        '''
+        Write the updated entries to the cache file. The cache file is read again and merged with the updates right
+        before it is replaced atomically, so that concurrent runs do not corrupt it and rarely lose each other's
+        entries. Failing to write the cache is logged and otherwise ignored.
+        '''
+        if not self.updates:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            entries = self._read()
+            entries.update(self.updates)
+            descriptor, temporaryPath = tempfile.mkstemp(prefix='.cache.', suffix='.tmp', dir=self.directory)
+            try:
+                with io.open(descriptor, mode='w', encoding='utf-8') as f:
+                    f.write(json.dumps(entries, separators=(',', ':')))
+                os.replace(temporaryPath, self.path)
+            except BaseException:
+                os.remove(temporaryPath)
+                raise
+        except (IOError, OSError) as e:
+            logger.warning('Cannot write cache ' + self.path + ': ' + str(e))
+            return
+        self.entries = entries
+        self.updates = {}
+
+
+def is_formatted(entries, filePath, stat=None):
+    '''
+    Check if given file is known to be formatted by given cache entries.
+
+    Parameters
+    entries: dict
+        Dictionary mapping absolute paths to entries, see FileCache().
+    filePath: string
+        Path to the file.
+    stat: os.stat_result
+        Status of the file, default to os.stat(filePath).
+
+    Return: tuple
+        Whether the file is formatted, and the digest of its content if it was hashed, else None.
+    '''
+    entry = entries.get(os.path.abspath(filePath))
+    if entry is None:
+        return False, None
+    if stat is None:
+        stat = os.stat(filePath)
+    size, mtime, digest = entry
+    if size != stat.st_size:
+        return False, None
+    if mtime is not None and mtime == stat.st_mtime_ns:
+        return True, None
+    fileDigest = hash_file(filePath)
+    return fileDigest == digest, fileDigest
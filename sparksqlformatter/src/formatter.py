@@ -23,15 +23,21 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 from __future__ import print_function  # for print() in Python 2
+import io
 import re
 
 from sparksqlformatter.src.tokenizer import TokenType, Tokenizer
-from sparksqlformatter.src.indentation import Indentation
-from sparksqlformatter.src.inline_block import InlineBlock
-from sparksqlformatter.src.subquery import SubQuery
 from sparksqlformatter.src.style import Style
+from sparksqlformatter.src.formatting_context import FormattingContext
+from sparksqlformatter.src.token_index import TokenIndex
+from sparksqlformatter.src import profiling
 
-trim_trailing_spaces = lambda s: re.sub(pattern='[ \t]+$', repl='', string=s)  # remove trailing spaces except \n
+# types of the tokens after which '-' is a negative sign rather than a minus sign
+NEGATIVE_SIGN_PRECEDING_TYPES = frozenset([
+    TokenType.KEYWORD, TokenType.RESERVED_KEYWORD, TokenType.NEWLINE_KEYWORD, TokenType.TOP_LEVEL_KEYWORD,
+    TokenType.TOP_LEVEL_KEYWORD_NO_INDENT
+])
+PREVIOUS_TOKENS_KEPT = 4  # number of tokens of the previous statement kept by format_stream()
 
 
 class Flag:
@@ -46,206 +52,450 @@ class Formatter:
     '''
     Class for formatting queries.
     '''
-    def __init__(self, style=Style(), tokenOverride=None):
+    def __init__(self, style=None, tokenOverride=None, useTokenBuffer=False):
         '''
         Paramters
         style: sparksqlformatter.src.style.Style() object
-            Styleurations for the query language.
+            Styleurations for the query language, default to Style().
         tokenOverride: function
             Function that takes token, previousKeyword and returns a token to overwrite given token (?).
-        '''
+        useTokenBuffer: bool
+            If True, keep the tokens in a sparksqlformatter.src.token_buffer.TokenBuffer() object, which takes much less
+            memory for very large queries.
+            Else, keep the tokens in a list of sparksqlformatter.src.tokenizer.Token() objects, which is faster.
+        '''
+        # the state of formatting a query is kept in a FormattingContext() per call instead of on the formatter,
+        # so that a formatter can be reused and shared by threads
+        style = Style() if style is None else style
         self.style = style
-        self.indentation = Indentation(style.indent)
-        self.inlineBlock = InlineBlock(style.inlineMaxLength)
-        self.subQuery = SubQuery()
         self.tokenizer = Tokenizer(style=style)  # use the same styleurations as Formatter()
         self.tokenOverride = tokenOverride
-        self.previousKeyword = None
-        self.previousTopLevelKeyword = None
-        self.tokens = []
-        self.index = 0
-
-    def format(self, query):
+        self.useTokenBuffer = useTokenBuffer
+        # handlers of the tokens by type, None for whitespace, which is ignored
+        self.tokenHandlers = {
+            TokenType.WHITESPACE: None,
+            TokenType.LINE_COMMENT: self.format_line_comment,
+            TokenType.BLOCK_COMMENT: self.format_block_comment,
+            TokenType.TOP_LEVEL_KEYWORD_NO_INDENT: self.format_top_level_keyword_no_indent,
+            TokenType.TOP_LEVEL_KEYWORD: self.format_top_level_keyword,
+            TokenType.NEWLINE_KEYWORD: self.format_newline_keyword,
+            TokenType.RESERVED_KEYWORD: self.format_keyword_with_spaces,
+            TokenType.KEYWORD: self.format_keyword_with_spaces,
+            TokenType.OPEN_PAREN: self.format_opening_parentheses,
+            TokenType.CLOSE_PAREN: self.format_closing_parentheses,
+            TokenType.WORD: self.format_other,
+            TokenType.STRING: self.format_other,
+            TokenType.NUMBER: self.format_other,
+            TokenType.OPERATOR: self.format_other
+        }
+        # handlers of the tokens of the other types by value
+        self.valueHandlers = {
+            ',': self.format_comma,
+            ':': self.format_colon,
+            '.': self.format_dot,
+            ';': self.format_query_separator,
+            '-': self.format_minus
+        }
+
+    def format(self, query, formatCache=None):
         '''
         Format query.
         
         Parameters
         query: str
             The query string.
+        formatCache: sparksqlformatter.src.cache.FormatCache() object
+            If given, look up the formatted query in the cache by the hash of query and the style, and on a miss,
+            format the query one statement at a time, looking up each statement, see format_stream().
+            Not used with tokenOverride, whose result may depend on anything.
         
         Return: str
             The formatted query.
         '''
-        self.tokens = self.tokenizer.tokenize(input=query)  # identify tokens in the query
-        formattedQuery = self.get_formatted_query_from_tokens()
+        with profiling.call():  # does nothing unless profiling, as do the other hooks
+            profiling.count('queries')
+            if formatCache is not None and self.tokenOverride is None:
+                key = self.get_cache_key(b'query', query.encode('utf-8'))
+                formattedQuery = formatCache.get(key)
+                if formattedQuery is None:
+                    profiling.count('formatCacheMisses')
+                    output = io.StringIO()
+                    self.format_stream(query, output, formatCache=formatCache)
+                    formattedQuery = output.getvalue()
+                    formatCache.put(key, formattedQuery)
+                else:
+                    profiling.count('formatCacheHits')
+                    profiling.count('outputCharacters', len(formattedQuery))
+                return formattedQuery
+
+            # identify tokens in the query
+            with profiling.phase('tokenize'):
+                if self.useTokenBuffer:
+                    tokens = self.tokenizer.tokenize_into_buffer(input=query)
+                else:
+                    tokens = self.tokenizer.tokenize(input=query)
+            with profiling.phase('format'):
+                context = FormattingContext(self.style, tokens)
+                self.get_formatted_query_from_tokens(context)
+                formattedQuery = context.query.getvalue().strip()
+            profiling.count('tokens', len(tokens))
+            profiling.count('inlineBlockLookaheads', context.inlineBlock.lookaheads)
+            profiling.count('outputCharacters', len(formattedQuery))
 
-        return formattedQuery.strip()
+        return formattedQuery
 
-    def get_formatted_query_from_tokens(self):
+    def format_stream(self, source, output, formatCache=None):
         '''
-        Create formatted query from identified tokens.
+        Format query one statement at a time, writing each formatted statement to output as soon as it is done.
+        Statements are separated by ';', where format_query_separator() resets the indentation, so only the tokens of
+        the current statement and the formatted query after the last ';' are kept in memory.
+        The output is the same as that of format().
 
         Parameters
+        source: string or file-like object
+            The query, or a file opened in text mode to read it from.
+        output: file-like object
+            The stream to write the formatted query to.
+        formatCache: sparksqlformatter.src.cache.FormatCache() object
+            If given, look up each formatted statement in the cache, see format_statement_with_cache().
+            Not used with tokenOverride, whose result may depend on anything.
+        '''
+        if self.tokenOverride is not None or formatCache is None:
+            formatStatement = self.get_formatted_query_from_tokens
+        else:
+            formatStatement = lambda context, start: self.format_statement_with_cache(context, start, formatCache)
+        # the hooks of profiling are set up once instead of once per statement; tokenizing includes reading the source
+        profile = profiling.get_profile()
+        statements = profiling.timed(self.iter_statements(source), 'tokenize')
+        formatStatement = profiling.timed_function(formatStatement, 'format')
+        write = profiling.timed_function(output.write, 'write')
+        with profiling.call():
+            context = FormattingContext(self.style)
+            query = context.query  # the formatted query after the last ';' written to output
+            started = False  # whether anything has been written to output
+            for statement in statements:
+                # keep a few tokens of the previous statement for previous_token()
+                previousTokens = context.tokens[-PREVIOUS_TOKENS_KEPT:]
+                context.tokens = previousTokens + statement
+                formatStatement(context, len(previousTokens))
+                if profile is not None:
+                    profile.count('tokens', len(statement))
+                if statement[-1].value == ';':
+                    # write up to ';' and keep the blank lines after it, which the next token may take back
+                    formattedQuery = query.getvalue()
+                    formattedStatement = formattedQuery.rstrip('\n')
+                    query.clear()
+                    query.append(formattedQuery[len(formattedStatement):])
+                    if not started:
+                        formattedStatement = formattedStatement.lstrip()
+                    write(formattedStatement)
+                    started = True
+                    if profile is not None:
+                        profile.count('outputCharacters', len(formattedStatement))
+            formattedQuery = query.getvalue()
+            formattedQuery = formattedQuery.rstrip() if started else formattedQuery.strip()
+            write(formattedQuery)
+            if profile is not None:
+                profile.count('outputCharacters', len(formattedQuery))
+                profile.count('inlineBlockLookaheads', context.inlineBlock.lookaheads)
+
+    def iter_statements(self, source):
+        '''
+        Generate the statements in query as lists of tokens, each ending with ';' except possibly the last one.
 
-        Return: string
-            The formatted query.
+        Parameters
+        source: string or file-like object
+            The query, or a file opened in text mode to read it from.
+
+        Return: generator
+            Lists of sparksqlformatter.src.tokenizer.Token() objects.
+        '''
+        statement = []
+        for token in self.tokenizer.iter_tokens(source):
+            statement.append(token)
+            if token.value == ';':
+                yield statement
+                statement = []
+        if statement:
+            yield statement
+
+    def format_statement_with_cache(self, context, start, formatCache):
+        '''
+        Format the statement in context.tokens[start:], looking it up in formatCache first.
+        On a hit, context.query and the previous tokens in context are set as if the statement had been formatted.
+        On a miss, the statement is formatted and cached, unless it ends inside parentheses or an indented block.
+
+        Parameters
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query.
+        start: int
+            The index in context.tokens of the first token of the statement.
+        formatCache: sparksqlformatter.src.cache.FormatCache() object
+            The cache of formatted statements.
+        '''
+        key = self.get_statement_key(context, start)
+        if key is None:  # the statement depends on more of the state than the key covers
+            self.get_formatted_query_from_tokens(context, start=start)
+            return
+        cached = formatCache.get(key)
+        profiling.count('formatCacheMisses' if cached is None else 'formatCacheHits')
+        if cached is not None:
+            (formattedQuery, context.tokens, context.previousKeyword, context.previousTopLevelKeyword,
+             context.previousNonWhiteSpaceToken) = cached
+            context.query.clear()
+            context.query.append(formattedQuery)
+            return
+        self.get_formatted_query_from_tokens(context, start=start)
+        if self.is_between_statements(context):
+            formatCache.put(key,
+                            (context.query.getvalue(), context.tokens[-PREVIOUS_TOKENS_KEPT:], context.previousKeyword,
+                             context.previousTopLevelKeyword, context.previousNonWhiteSpaceToken))
+
+    def get_statement_key(self, context, start):
+        '''
+        Get the key of the statement in context.tokens[start:] in a FormatCache().
+        Besides the statement and the style, the key covers the state the statement is formatted in, i.e., the previous
+        tokens, the previous keywords and the formatted query after the last ';'.
+
+        Parameters
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query.
+        start: int
+            The index in context.tokens of the first token of the statement.
+
+        Return: bytes
+            The key, or None if the statement starts inside parentheses or an indented block.
+        '''
+        if not self.is_between_statements(context):
+            return None
+        describe = lambda token: None if token is None else (token.type, token.value, token.flag)
+        state = ([describe(token) for token in context.tokens[:start]], describe(context.previousKeyword),
+                 describe(context.previousTopLevelKeyword), describe(context.previousNonWhiteSpaceToken),
+                 context.query.getvalue())
+        statement = ''.join(token.value for token in context.tokens[start:])
+        return self.get_cache_key(b'statement', repr(state).encode('utf-8'), statement.encode('utf-8'))
+
+    def get_cache_key(self, *parts):
+        '''
+        Get the key of an entry in a FormatCache(), which is the hash of the style fingerprint and given parts.
+
+        Parameters
+        parts: list
+            The bytes that identify the entry.
+
+        Return: bytes
+            The key.
+        '''
+        import hashlib  # only needed with a FormatCache(), so not imported with the package
+        return hashlib.sha1(b'\0'.join((self.style.fingerprint().encode('utf-8'), ) + parts)).digest()
+
+    @staticmethod
+    def is_between_statements(context):
         '''
-        formattedQuery = ''
+        Check if the indentation, inline blocks and subqueries in context are all reset, as at the start of a query.
 
-        for i in range(len(self.tokens)):
-            token = self.tokens[i]
-            self.index = i
+        Parameters
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query.
+
+        Return: bool
+            True if so, False otherwise.
+        '''
+        return (not context.indentation.indentTypes and context.inlineBlock.level == 0 and not context.subQuery.stack
+                and not context.subQuery.started)
+
+    def get_formatted_query_from_tokens(self, context, start=0):
+        '''
+        Create formatted query from identified tokens.
+
+        Parameters
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The formatted tokens are added to context.query.
+        start: int
+            The index in context.tokens of the first token to format, default to 0.
+            The tokens before it have been formatted already.
+        '''
+        context.tokenIndex = TokenIndex(context.tokens)  # for looking ahead at upcoming tokens in constant time
+        tokens = context.tokens
+        tokenHandlers = self.tokenHandlers
+        for i in range(start, len(tokens)):
+            token = tokens[i]
+            context.index = i
 
             if self.tokenOverride:
-                token = self.tokenOverride(token, self.previousKeyword) or token
+                token = self.tokenOverride(token, context.previousKeyword) or token
 
-            if token.value.upper() == 'GROUP BY' or (token.value.upper() == 'ORDER BY'
-                                                     and self.previousKeyword.value.upper() != 'PARTITION BY'):
+            if token.upper == 'GROUP BY' or (token.upper == 'ORDER BY'
+                                             and context.previousKeyword.upper != 'PARTITION BY'):
                 token.flag = Flag.INLINE
 
             # print("token.value = {}, token.type = {}".format(token.value, token.type))
 
-            if token.type == TokenType.WHITESPACE:
-                # ignore
-                continue
-            elif token.type == TokenType.LINE_COMMENT:
-                formattedQuery = self.format_line_comment(token, formattedQuery)
-            elif token.type == TokenType.BLOCK_COMMENT:
-                formattedQuery = self.format_block_comment(token, formattedQuery)
-            elif token.type == TokenType.TOP_LEVEL_KEYWORD_NO_INDENT:
-                formattedQuery = self.format_top_level_keyword_no_indent(token, formattedQuery)
-                self.previousKeyword = token
-            elif token.type == TokenType.TOP_LEVEL_KEYWORD:
-                formattedQuery = self.format_top_level_keyword(token, formattedQuery)
-                self.previousKeyword = token
-                self.previousTopLevelKeyword = token
-            elif token.type == TokenType.NEWLINE_KEYWORD:
-                formattedQuery = self.format_newline_keyword(token, formattedQuery)
-                self.previousKeyword = token
-            elif token.type == TokenType.RESERVED_KEYWORD:
-                formattedQuery = self.format_with_spaces(token, formattedQuery)
-                self.previousKeyword = token
-            elif token.type == TokenType.KEYWORD:
-                formattedQuery = self.format_with_spaces(token, formattedQuery)
-                self.previousKeyword = token
-            elif token.type == TokenType.OPEN_PAREN:
-                formattedQuery = self.format_opening_parentheses(token, formattedQuery)
-                if token.value == 'CASE':
-                    self.previousKeyword = token
-            elif token.type == TokenType.CLOSE_PAREN:
-                formattedQuery = self.format_closing_parentheses(token, formattedQuery)
-                if token.value == 'END':
-                    self.previousKeyword = token
-            elif token.value == ',':
-                formattedQuery = self.format_comma(token, formattedQuery)
-            elif token.value == ':':
-                formattedQuery = Formatter.format_without_spaces_before_with_space_after(token, formattedQuery)
-            elif token.value == '.':  # no space before or after
-                formattedQuery = Formatter.format_without_spaces(token, formattedQuery)
-            elif token.value == ';':
-                formattedQuery = self.format_query_separator(token, formattedQuery)
-            elif token.value == '-':
-                if i > 1:
-                    offset = 1
-                    while self.previous_token(offset=offset).type == TokenType.WHITESPACE:
-                        offset += 1  # find most immediate previous token that is not white space
-                    if self.previous_token(offset=offset).type in [
-                            TokenType.KEYWORD, TokenType.RESERVED_KEYWORD, TokenType.NEWLINE_KEYWORD,
-                            TokenType.TOP_LEVEL_KEYWORD, TokenType.TOP_LEVEL_KEYWORD_NO_INDENT
-                    ]:
-                        formattedQuery = Formatter.format_without_spaces_after(token, formattedQuery)
-                    else:
-                        formattedQuery = self.format_with_spaces(token, formattedQuery)
+            handler = tokenHandlers[token.type]
+            if handler:  # whitespace is ignored
+                handler(token, context)
+            if tokens[i].type != TokenType.WHITESPACE:
+                context.previousNonWhiteSpaceToken = tokens[i]
+
+    def format_other(self, token, context):
+        '''
+        Format token of a type without a handler of its own, e.g., an operator, by its value.
+
+        Parameters
+        token: sparksqlformatter.src.token.Token() object
+            Identified token.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted token is added to context.query.
+        '''
+        handler = self.valueHandlers.get(token.value)
+        if handler:
+            handler(token, context)
+        else:
+            self.format_with_spaces(token, context.query)
+
+    def format_colon(self, token, context):
+        '''
+        Format ':' with no space before it.
+
+        Parameters
+        token: sparksqlformatter.src.token.Token() object
+            Identified token with value ':'.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted ':' is added to context.query.
+        '''
+        Formatter.format_without_spaces_before_with_space_after(token, context.query)
+
+    def format_dot(self, token, context):
+        '''
+        Format '.' with no space before or after it.
+
+        Parameters
+        token: sparksqlformatter.src.token.Token() object
+            Identified token with value '.'.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted '.' is added to context.query.
+        '''
+        Formatter.format_without_spaces(token, context.query)
+
+    def format_minus(self, token, context):
+        '''
+        Format '-', with no space after it if it is a negative sign, i.e., if it comes after a keyword.
+
+        Parameters
+        token: sparksqlformatter.src.token.Token() object
+            Identified token with value '-'.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted '-' is added to context.query.
+        '''
+        if context.index > 1:
+            if context.previousNonWhiteSpaceToken.type in NEGATIVE_SIGN_PRECEDING_TYPES:
+                Formatter.format_without_spaces_after(token, context.query)
             else:
-                formattedQuery = self.format_with_spaces(token, formattedQuery)
+                self.format_with_spaces(token, context.query)
 
-        return formattedQuery
+    def format_keyword_with_spaces(self, token, context):
+        '''
+        Format reserved and plain keywords.
+
+        Parameters
+        token: sparksqlformatter.src.token.Token() object
+            Identified token of type Token.RESERVED_KEYWORD or Token.KEYWORD.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted keyword is added to context.query.
+        '''
+        self.format_with_spaces(token, context.query)
+        context.previousKeyword = token
 
-    def format_line_comment(self, token, query):
+    def format_line_comment(self, token, context):
         '''
         Format line comment.
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type TOKEN.LINE_COMMENT.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted line comment.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted line comment is added to context.query.
         '''
-        return self.add_newline(query.rstrip() + ' ' + token.value)
+        query = context.query
+        query.rstrip()
+        query.append(' ' + token.value)
+        self.add_newline(context)
 
-    def format_block_comment(self, token, query):
+    def format_block_comment(self, token, context):
         '''
         Format block comment.
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type Token.BLOCK_COMMENT.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted block comment.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted block comment is added to context.query.
         '''
-        return self.add_newline(self.add_newline(query) + self.indent_comment(token.value))
+        query = context.query
+        self.add_newline(context)
+        query.append(self.indent_comment(token.value, context))
+        self.add_newline(context)
 
-    def indent_comment(self, comment):
+    def indent_comment(self, comment, context):
         '''
         Indent comment.
 
         Parameters
         comment: string
             Value of the comment token.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query.
         
         Return: string
             The comment with proper indentation.
         '''
-        return re.sub(pattern='\n[ \t]*', repl=('\n' + self.indentation.get_indent()), string=comment)
+        return re.sub(pattern='\n[ \t]*', repl=('\n' + context.indentation.get_indent()), string=comment)
 
-    def format_top_level_keyword_no_indent(self, token, query):
+    def format_top_level_keyword_no_indent(self, token, context):
         '''
         Format top-level keywords that are not indented.
 
         Paramaters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type Token.TOP_LEVEL_KEYWORD_NO_INDENT.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted top-level keyword with no indent.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query.
+            The newly formatted top-level keyword with no indent is added to context.query.
         '''
-        self.indentation.decrease_top_level()
-        query = self.add_newline(query) + Formatter.equalize_white_space(self.format_reserved_keyword(token.value))
-        return self.add_newline(query)
+        query = context.query
+        context.indentation.decrease_top_level()
+        self.add_newline(context)
+        query.append(Formatter.equalize_white_space(self.format_reserved_keyword(token.value)))
+        self.add_newline(context)
+        context.previousKeyword = token
 
-    def format_top_level_keyword(self, token, query):
+    def format_top_level_keyword(self, token, context):
         '''
         Format top-level keywords with indentation.
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type Token.TOP_LEVEL_KEYWORD.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted top-level keyword.
-        '''
-        self.indentation.decrease_top_level()
-        query = self.add_newline(query)
-        self.indentation.increase_top_level()
-        query += Formatter.equalize_white_space(self.format_reserved_keyword(token.value))
-        return self.add_newline(query)
-
-    def format_newline_keyword(self, token, query):
-        if (self.previousKeyword.value.upper() in ['BETWEEN'] and token.value.upper() in ['AND']):
-            return query + Formatter.equalize_white_space(self.format_reserved_keyword(token.value)) + ' '
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted top-level keyword is added to context.query.
+        '''
+        query = context.query
+        context.indentation.decrease_top_level()
+        self.add_newline(context)
+        context.indentation.increase_top_level()
+        query.append(Formatter.equalize_white_space(self.format_reserved_keyword(token.value)))
+        self.add_newline(context)
+        context.previousKeyword = token
+        context.previousTopLevelKeyword = token
+
+    def format_newline_keyword(self, token, context):
+        query = context.query
+        if context.previousKeyword.upper == 'BETWEEN' and token.upper == 'AND':
+            query.append(Formatter.equalize_white_space(self.format_reserved_keyword(token.value)) + ' ')
         else:
-            return self.add_newline(query) + Formatter.equalize_white_space(self.format_reserved_keyword(
-                token.value)) + ' '
+            self.add_newline(context)
+            query.append(Formatter.equalize_white_space(self.format_reserved_keyword(token.value)) + ' ')
+        context.previousKeyword = token
 
     @staticmethod
     def equalize_white_space(s):
@@ -261,7 +511,7 @@ class Formatter:
         '''
         return re.sub(pattern='\s+', repl=' ', string=s)
 
-    def format_opening_parentheses(self, token, query):
+    def format_opening_parentheses(self, token, context):
         '''
         Opening parentheses increase the block indent level and start a new line.
         Take out the preceding space unless there was whitespace there in the original query or another opening parens or line comment.
@@ -269,109 +519,106 @@ class Formatter:
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type Token.OPEN_PAREN.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted opening parentheses.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted opening parentheses is added to context.query.
         '''
+        query = context.query
         preserveWhiteSpaceFor = [TokenType.WHITESPACE, TokenType.OPEN_PAREN, TokenType.LINE_COMMENT]
-        if not (any(t == self.previous_token().type for t in preserveWhiteSpaceFor)):
-            query = trim_trailing_spaces(query)
-        query += token.value.upper() if self.style.reservedKeywordUppercase else token.value.lower()
+        if not (any(t == context.previous_token().type for t in preserveWhiteSpaceFor)):
+            query.trim_trailing_spaces()
+        query.append(token.upper if self.style.reservedKeywordUppercase else token.value.lower())
 
         # take care of block indent level
-        self.inlineBlock.begin_if_possible(self.tokens, self.index)
-        if not self.inlineBlock.is_active():
-            self.indentation.increase_block_level()
-            query = self.add_newline(query)
+        context.inlineBlock.begin_if_possible(context.tokenIndex, context.index)
+        if not context.inlineBlock.is_active():
+            context.indentation.increase_block_level()
+            self.add_newline(context)
 
         # take care of subquery
         if token.value == '(':
-            if (self.previousKeyword.value.upper() == 'AS' and
-                (self.previous_token(offset=2).value.upper() == 'AS' or  # t0 AS (...)
-                 (
-                     self.previous_token(offset=1).type == TokenType.LINE_COMMENT  # t0 AS -- comment (...)
-                     and self.previous_token(offset=3).value.upper() == 'AS'))):  # start of subQuery, e.g., t0 AS (...)
+            if (context.previousKeyword.upper == 'AS'
+                    and (context.previous_token(offset=2).upper == 'AS' or  # t0 AS (...)
+                         (
+                             context.previous_token(offset=1).type == TokenType.LINE_COMMENT  # t0 AS -- comment (...)
+                             and context.previous_token(offset=3).upper == 'AS'))
+                ):  # start of subQuery, e.g., t0 AS (...)
                 # print("marking subquery start")
-                self.subQuery.started = True  # mark that subquery has started
+                context.subQuery.started = True  # mark that subquery has started
                 # This is to differentiate from opening/closng parentheses inside subquery
                 # and to distinguish the starting opening parenthesis of the subquery
-            self.subQuery.update(self, token)  # update subquery with the current token
-
-        return query
+            context.subQuery.update(self, token)  # update subquery with the current token
+        if token.value == 'CASE':
+            context.previousKeyword = token
 
-    def format_closing_parentheses(self, token, query):
+    def format_closing_parentheses(self, token, context):
         '''
         Closing parentheses decrease the block indent level.
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token of type Token.CLOSE_PAREN.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted closing parentheses.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted closing parentheses is added to context.query.
         '''
-        token.value = token.value.upper() if self.style.reservedKeywordUppercase else token.value.lower()
+        query = context.query
+        token.value = token.upper if self.style.reservedKeywordUppercase else token.value.lower()
 
         # take care of block indent level
-        if (self.inlineBlock.is_active()):
-            self.inlineBlock.end()
-            query = Formatter.format_without_spaces_before_with_space_after(token, query)
+        if (context.inlineBlock.is_active()):
+            context.inlineBlock.end()
+            Formatter.format_without_spaces_before_with_space_after(token, query)
         else:
-            self.indentation.decrease_block_level()
-            query = self.format_with_spaces(token, self.add_newline(query))
+            context.indentation.decrease_block_level()
+            self.add_newline(context)
+            self.format_with_spaces(token, query)
 
         # take care of subquery
         if token.value == ')':  # if this is the subquery's ending closing parenthesis
-            self.subQuery.update(self, token)  # update subquery with the current token
-            if self.subQuery.started and self.subQuery.matched():
+            context.subQuery.update(self, token)  # update subquery with the current token
+            if context.subQuery.started and context.subQuery.matched():
                 token.flag = Flag.SUBQUERY_ENDING_PAREN  # add flag to mark this as subquery's ending parenthesis
                 # print("Adding extra blank lines after subquery")
-                query = query.rstrip() + '\n' * (1 + self.style.linesBetweenQueries)  # add extra blank lines
-                self.subQuery.reset()  # reset to start again
-        return query
+                query.rstrip()
+                query.append('\n' * (1 + self.style.linesBetweenQueries))  # add extra blank lines
+                context.subQuery.reset()  # reset to start again
+        if token.value == 'END':
+            context.previousKeyword = token
 
-    def format_comma(self, token, query):
+    def format_comma(self, token, context):
         '''
         Commas start a new line (unless within inline parentheses or SQL "LIMIT" clause).
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token with value ','.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted comma.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted comma is added to context.query.
         '''
+        query = context.query
         # if this is the comma immediately after the closing parenthesis of a subquery, add extra blank line
-        if self.previous_token().flag == Flag.SUBQUERY_ENDING_PAREN:
-            query = query.strip()  # remove the \n added immediately after )
-            self.subQuery.reset()
-            return query + token.value + '\n' * (1 + self.style.linesBetweenQueries)  # add \n after ),
-        query = trim_trailing_spaces(query) + token.value + ' '
-        if (self.inlineBlock.is_active()):
-            return query
-        if re.search(pattern='^LIMIT$', string=self.previousKeyword.value):
-            return query
-        if self.previousTopLevelKeyword.flag == Flag.INLINE:
+        if context.previous_token().flag == Flag.SUBQUERY_ENDING_PAREN:
+            query.rstrip()  # remove the \n added immediately after )
+            context.subQuery.reset()
+            query.append(token.value + '\n' * (1 + self.style.linesBetweenQueries))  # add \n after ),
+            return
+        query.trim_trailing_spaces()
+        query.append(token.value + ' ')
+        if (context.inlineBlock.is_active()):
+            return
+        if re.search(pattern='^LIMIT$', string=context.previousKeyword.value):
+            return
+        if context.previousTopLevelKeyword.flag == Flag.INLINE:
             if self.style.splitOnComma:
-                return self.add_newline(query)
+                self.add_newline(context)
             else:
-                inlineLength = len(query) - query.rfind('\n') + 1
+                inlineLength = query.column() + 2
                 if inlineLength < self.style.inlineMaxLength:  # if fit in a line, don't split at comma
-                    return query
+                    return
                 else:  # else, split at comma
-                    indent = self.indentation.get_indent()
-                    lastCommaIndex = query.rfind(',')
-                    query = query[:lastCommaIndex + 1] + '\n' + indent + query[lastCommaIndex +
-                                                                               2:len(query)]  # split at the last comma
-                    return query
+                    query.trim_trailing_spaces()  # remove the space after the comma
+                    query.append('\n' + context.indentation.get_indent())
         else:
-            return self.add_newline(query)
+            self.add_newline(context)
 
     @staticmethod
     def format_without_spaces_before_with_space_after(token, query):
@@ -381,13 +628,11 @@ class Formatter:
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Current token to be formatted.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted token.
+        query: sparksqlformatter.src.output_builder.OutputBuilder() object
+            The query formatted so far, which the newly formatted token is added to.
         '''
-        return trim_trailing_spaces(query) + token.value + ' '
+        query.trim_trailing_spaces()
+        query.append(token.value + ' ')
 
     @staticmethod
     def format_without_spaces(token, query):
@@ -397,13 +642,11 @@ class Formatter:
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Current token to be formatted.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted token.
+        query: sparksqlformatter.src.output_builder.OutputBuilder() object
+            The query formatted so far, which the newly formatted token is added to.
         '''
-        return trim_trailing_spaces(query) + token.value
+        query.trim_trailing_spaces()
+        query.append(token.value)
 
     @staticmethod
     def format_without_spaces_after(token, query):
@@ -413,13 +656,10 @@ class Formatter:
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Current token to be formatted.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted token.
+        query: sparksqlformatter.src.output_builder.OutputBuilder() object
+            The query formatted so far, which the newly formatted token is added to.
         '''
-        return query + token.value
+        query.append(token.value)
 
     def format_with_spaces(self, token, query):
         '''
@@ -428,11 +668,8 @@ class Formatter:
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Current token to be formatted.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted token.
+        query: sparksqlformatter.src.output_builder.OutputBuilder() object
+            The query formatted so far, which the newly formatted token is added to.
         '''
         if token.type == TokenType.RESERVED_KEYWORD:
             value = self.format_reserved_keyword(token.value)
@@ -440,7 +677,7 @@ class Formatter:
             value = self.format_keyword(token.value)
         else:
             value = token.value
-        return query + value + ' '
+        query.append(value + ' ')
 
     def format_reserved_keyword(self, value):
         '''
@@ -449,11 +686,9 @@ class Formatter:
         Parameters
         value: string
             Value of the Token.RESERVED_KEYWORD token.
-        query: string
-            The query formatted so far.
-        
+
         Return: string
-            The query formatted so far together with the newly formatted reserved keyword.
+            The reserved keyword in uppercase or lowercase.
         '''
         return value.upper() if self.style.reservedKeywordUppercase else value.lower()
 
@@ -464,57 +699,38 @@ class Formatter:
         Parameters
         value: string
             Value of the Token.KEYWORD token.
-        query: string
-            The query formatted so far.
-        
+
         Return: string
-            The query formatted so far together with the newly formatted keyword.
+            The formatted keyword.
         '''
         # return value.upper() if self.style.reservedKeywordUppercase else value.lower()
         return value
 
-    def format_query_separator(self, token, query):
+    def format_query_separator(self, token, context):
         '''
         Format ';', which separates queries, including blank lines between queries.
 
         Parameters
         token: sparksqlformatter.src.token.Token() object
             Identified token with value ';'.
-        query: string
-            The query formatted so far.
-        
-        Return: string
-            The query formatted so far together with the newly formatted ';'.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The newly formatted ';' is added to context.query.
         '''
-        self.indentation.reset_indentation()
-        return trim_trailing_spaces(query) + token.value + '\n' * (self.style.linesBetweenQueries or 1)
+        query = context.query
+        context.indentation.reset_indentation()
+        query.trim_trailing_spaces()
+        query.append(token.value + '\n' * (self.style.linesBetweenQueries or 1))
 
-    def add_newline(self, query):
+    def add_newline(self, context):
         '''
         Add blank line after the end of query with proper indentation.
 
         Parameters
-        query: string
-            The query to process.
-        
-        Return: string
-            The query with newly added blank line and indentation.
+        context: sparksqlformatter.src.formatting_context.FormattingContext() object
+            The state of formatting the query. The blank line and indentation are added to context.query.
         '''
-        query = trim_trailing_spaces(query)
+        query = context.query
+        query.trim_trailing_spaces()
         if not query.endswith('\n'):
-            query += '\n'
-        return query + self.indentation.get_indent()
-
-    def previous_token(self, offset=1):
-        '''
-        Get previous token.
-
-        Parameters
-        offset: int
-            The number of tokens to trace back.
-
-        Return: sparksqlformatter.src.token.Token() object or None
-            The token obtained by stepping backwards by given offset, if it exists.
-            Return None if there is no such token.
-        '''
-        return self.tokens[self.index - offset] or None
+            query.append('\n')
+        query.append(context.indentation.get_indent())
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from sparksqlformatter.src.indentation import Indentation
+from sparksqlformatter.src.inline_block import InlineBlock
+from sparksqlformatter.src.subquery import SubQuery
+from sparksqlformatter.src.output_builder import OutputBuilder
+
+
+class FormattingContext:
+    '''
+    Class for the state of formatting one query.
+
+    Formatter() only holds what does not change while formatting, i.e., the style and the tokenizer, and creates a
+    FormattingContext() for every call to Formatter.format(), so that one formatter can be reused for any number of
+    queries and shared by threads.
+    '''
+    def __init__(self, style, tokens=None):
+        '''
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for the query language.
+        tokens: list or sparksqlformatter.src.token_buffer.TokenBuffer() object
+            Tokens of the query, default to an empty list.
+        '''
+        self.indentation = Indentation(style.indent)
+        self.inlineBlock = InlineBlock(style.inlineMaxLength)
+        self.subQuery = SubQuery()
+        self.previousKeyword = None
+        self.previousTopLevelKeyword = None
+        self.previousNonWhiteSpaceToken = None  # the last token before context.index that is not whitespace
+        self.tokens = [] if tokens is None else tokens
+        self.tokenIndex = None
+        self.index = 0
+        self.query = OutputBuilder()  # the query formatted so far
+
+    def previous_token(self, offset=1):
+        '''
+        Get previous token.
+
+        Parameters
+        offset: int
+            The number of tokens to trace back.
+
+        Return: sparksqlformatter.src.token.Token() object or None
+            The token obtained by stepping backwards by given offset, if it exists.
+            Return None if there is no such token.
+        '''
+        return self.tokens[self.index - offset] or None
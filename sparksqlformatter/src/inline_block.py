@@ -35,18 +35,19 @@ class InlineBlock:
     def __init__(self, inlineMaxLength):
         self.level = 0
         self.inlineMaxLength = inlineMaxLength
+        self.lookaheads = 0  # number of lookaheads by is_inline_block(), reported when profiling
 
-    def begin_if_possible(self, tokens, index):
+    def begin_if_possible(self, tokenIndex, index):
         """
         Begins inline block when lookahead through upcoming tokens determines that the block would be smaller than self.inlineMaxLength.
 
         Parameters
-        tokens: list
-            List of tokens.
+        tokenIndex: sparksqlformatter.src.token_index.TokenIndex() object
+            Tables computed from the list of tokens.
         index: int
             Current token position.
         """
-        if self.level == 0 and self.is_inline_block(tokens, index):
+        if self.level == 0 and self.is_inline_block(tokenIndex, index):
             self.level = 1
         elif self.level > 0:
             self.level += 1
@@ -68,38 +69,25 @@ class InlineBlock:
         """
         return self.level > 0
 
-    def is_inline_block(self, tokens, index):
+    def is_inline_block(self, tokenIndex, index):
         """
         Check if this should be an inline parentheses block.
         Examples are "NOW()", "COUNT(*)", "int(10)", key(`some_column`), DECIMAL(7,2).
+        That is, the parentheses are matched, the block is no longer than self.inlineMaxLength and does not contain
+        forbidden tokens, which is looked up in tokenIndex instead of scanning through the upcoming tokens.
 
         Parameters
-        tokens: list
-            List of tokens.
+        tokenIndex: sparksqlformatter.src.token_index.TokenIndex() object
+            Tables computed from the list of tokens.
         index: int
             Current token position.
         """
-        length = 0
-        level = 0
-
-        for i in range(index, len(tokens)):
-            token = tokens[i]
-            length += len(token.value)
-
-            if length > self.inlineMaxLength:
-                return False
-
-            if token.type == TokenType.OPEN_PAREN:
-                level += 1
-            elif token.type == TokenType.CLOSE_PAREN:
-                level -= 1
-                if level == 0:
-                    return True
-
-            if InlineBlock.is_forbidden_token(token):
-                return False
-
-        return False
+        self.lookaheads += 1
+        end = tokenIndex.matching_paren(index)
+        if end is None:
+            return False
+        return (tokenIndex.length(index, end + 1) <= self.inlineMaxLength
+                and tokenIndex.count_forbidden(index, end + 1) == 0)
 
     @staticmethod
     def is_forbidden_token(token):
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+class OutputBuilder:
+    '''
+    Class for building the formatted query from fragments.
+
+    The formatter keeps adding to and trimming the end of the formatted query. Doing so on a string copies the whole
+    query every time, which makes formatting quadratic in the size of the query. OutputBuilder keeps the fragments in a
+    list and the offsets of the newlines in a stack, so that adding, trimming and getting the current column only touch
+    the end of the query.
+    '''
+    def __init__(self, text=''):
+        '''
+        Parameters
+        text: string
+            The initial content, default to ''.
+        '''
+        self.fragments = []  # non-empty strings that make up the query
+        self.length = 0
+        self.newlines = []  # offsets of the \n in the query, in increasing order
+        self.append(text)
+
+    def append(self, text):
+        '''
+        Add text to the end of the query.
+
+        Parameters
+        text: string
+            The text to add.
+        '''
+        if not text:
+            return
+        position = text.find('\n')
+        while position != -1:
+            self.newlines.append(self.length + position)
+            position = text.find('\n', position + 1)
+        self.fragments.append(text)
+        self.length += len(text)
+
+    def pop(self):
+        '''
+        Remove the last fragment from the query.
+
+        Return: string
+            The removed fragment.
+        '''
+        text = self.fragments.pop()
+        self.length -= len(text)
+        while self.newlines and self.newlines[-1] >= self.length:
+            self.newlines.pop()
+        return text
+
+    def clear(self):
+        '''
+        Remove everything from the query.
+        '''
+        self.fragments = []
+        self.length = 0
+        self.newlines = []
+
+    def last(self, n):
+        '''
+        Get the last n characters of the query.
+
+        Parameters
+        n: int
+            The number of characters to get.
+
+        Return: string
+            The last n characters, or the whole query if it is shorter.
+        '''
+        parts = []
+        size = 0
+        for text in reversed(self.fragments):
+            parts.append(text)
+            size += len(text)
+            if size >= n:
+                break
+        return ''.join(reversed(parts))[-n:]
+
+    def endswith(self, suffix):
+        '''
+        Check if the query ends with given suffix.
+
+        Parameters
+        suffix: string
+            The suffix to check.
+
+        Return: bool
+        '''
+        return self.last(len(suffix)) == suffix
+
+    def rstrip(self, chars=None):
+        '''
+        Remove trailing characters from the query, like str.rstrip().
+
+        Parameters
+        chars: string
+            The characters to remove, default to whitespace.
+        '''
+        while self.fragments:
+            text = self.fragments[-1]
+            stripped = text.rstrip(chars)
+            if len(stripped) == len(text):
+                return
+            self.pop()
+            if stripped:
+                self.append(stripped)
+                return
+
+    def trim_trailing_spaces(self):
+        '''
+        Remove spaces and tabs at the end of the query, or right before the \n that ends the query.
+        Same as re.sub(pattern='[ \t]+$', repl='', string=query).
+        '''
+        end = self.last(2)
+        if end[-1:] in [' ', '\t']:
+            self.rstrip(' \t')
+        elif end in [' \n', '\t\n']:
+            self.append(self.pop()[:-1])
+            self.rstrip(' \t')
+            self.append('\n')
+
+    def column(self):
+        '''
+        Get the number of characters after the last \n in the query.
+
+        Return: int
+            The current column.
+        '''
+        if self.newlines:
+            return self.length - self.newlines[-1] - 1
+        return self.length
+
+    def getvalue(self):
+        '''
+        Get the query built so far.
+
+        Return: string
+            The query.
+        '''
+        return ''.join(self.fragments)
+
+    def __len__(self):
+        return self.length
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Opt-in instrumentation of formatting, e.g.,
+    with profiling.profile(callback=print) as profile:
+        api.format_query(query)
+    print(profile.summary())
+The hooks in the formatter do nothing while no profile is active in the thread, see get_profile().
+"""
+import sys
+import time
+import heapq
+import threading
+import contextlib
+
+PHASES = ['read', 'tokenize', 'format', 'write']  # the phases of formatting, in the order of the summary
+COUNTERS = [  # the counters reported, in the order of the summary
+    'files', 'inputBytes', 'queries', 'tokens', 'outputCharacters', 'inlineBlockLookaheads', 'formatCacheHits',
+    'formatCacheMisses', 'fileCacheHits'
+]
+
+ACTIVE = threading.local()  # the active profile of each thread, set by profile()
+
+
+class Profile:
+    '''
+    Class for the wall time spent in each phase of formatting and the counters, e.g., of tokens and cache hits, while
+    the profile is active. A call, i.e., formatting one query or file, is recorded in a Profile() of its own, which is
+    passed to the callback and then added to the totals.
+    '''
+    def __init__(self, callback=None, name=None):
+        '''
+        Parameters
+        callback: function
+            Function called with the Profile() of each call when it ends, or None.
+        name: string
+            The name of the call, e.g., the path to the file, or None.
+        '''
+        self.callback = callback
+        self.name = name
+        self.times = {}  # seconds by phase
+        self.counts = {}  # counters by name
+        self.wallTime = 0.0  # seconds the profile, or the call, has been active
+        self.call = None  # the Profile() of the current call, if any
+        self.depth = 0  # number of nested calls, e.g., Formatter.format() in api._format_file()
+
+    def add_time(self, phase, seconds):
+        '''
+        Add given time to a phase of the current call, or of the totals outside calls.
+
+        Parameters
+        phase: string
+            The phase, one of PHASES.
+        seconds: float
+            The wall time spent in the phase.
+        '''
+        target = self.call if self.call is not None else self
+        target.times[phase] = target.times.get(phase, 0.0) + seconds
+
+    def count(self, name, n=1):
+        '''
+        Add n to a counter of the current call, or of the totals outside calls.
+
+        Parameters
+        name: string
+            The counter, one of COUNTERS.
+        n: int
+            The number to add.
+        '''
+        target = self.call if self.call is not None else self
+        target.counts[name] = target.counts.get(name, 0) + n
+
+    def merge(self, other):
+        '''
+        Add the times and counters of other to the totals, calling the callback with it.
+
+        Parameters
+        other: Profile() object
+            The profile of a call.
+        '''
+        if self.callback is not None:
+            self.callback(other)
+        for phase, seconds in other.times.items():
+            self.times[phase] = self.times.get(phase, 0.0) + seconds
+        for name, n in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def to_dict(self):
+        '''
+        Get the times and counters, e.g., to send them from a worker process or to dump them as JSON.
+
+        Return: dict
+            The seconds by phase in "times", the counters in "counts" and the seconds active in "wallTime".
+        '''
+        return {'times': dict(self.times), 'counts': dict(self.counts), 'wallTime': self.wallTime}
+
+    @staticmethod
+    def from_dict(profileDict):
+        '''
+        Create Profile() object from the dictionary returned by to_dict().
+
+        Parameters
+        profileDict: dict
+            The times and counters.
+
+        Return: Profile() object
+            The profile.
+        '''
+        profile = Profile()
+        profile.times.update(profileDict['times'])
+        profile.counts.update(profileDict['counts'])
+        profile.wallTime = profileDict['wallTime']
+        return profile
+
+    def summary(self):
+        '''
+        Get a table of the time spent in each phase and the counters.
+
+        Return: string
+            The table. The shares are of the total time of the phases, which is more than the wall time if the files
+            are formatted by several processes.
+        '''
+        total = sum(self.times.values())
+        lines = ['%-24s %12s %8s' % ('phase', 'seconds', 'share')]
+        for phase in PHASES + sorted(set(self.times) - set(PHASES)):
+            seconds = self.times.get(phase, 0.0)
+            lines.append('%-24s %12.4f %7.1f%%' % (phase, seconds, 100.0 * seconds / total if total else 0.0))
+        lines.append('%-24s %12.4f' % ('total', total))
+        lines.append('%-24s %12.4f' % ('wall', self.wallTime))
+        lines.append('')
+        lines.append('%-24s %12s' % ('counter', 'count'))
+        for name in COUNTERS + sorted(set(self.counts) - set(COUNTERS)):
+            lines.append('%-24s %12d' % (name, self.counts.get(name, 0)))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def profile(callback=None):
+    '''
+    Activate a new Profile() in the current thread in the block of a with statement, e.g.,
+        with profiling.profile() as p:
+            ...
+    Profiles can be nested, in which case the inner one is active until the block ends.
+
+    Parameters
+    callback: function
+        Function called with the Profile() of each query or file formatted, or None.
+
+    Return: context manager
+        The context manager, which gives the profile.
+    '''
+    previous = getattr(ACTIVE, 'profile', None)
+    current = ACTIVE.profile = Profile(callback)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.wallTime += time.perf_counter() - start
+        ACTIVE.profile = previous
+
+
+class Timer:
+    '''
+    Context manager that adds the time spent in it to a phase of the active profile.
+    '''
+    __slots__ = ['profile', 'phase', 'start']
+
+    def __init__(self, profile, phase):
+        self.profile = profile
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add_time(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+class Call:
+    '''
+    Context manager for one call, i.e., formatting one query or file, see Profile(). Nested calls are part of the
+    outermost one.
+    '''
+    __slots__ = ['profile', 'name', 'start']
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        profile = self.profile
+        if profile.depth == 0:
+            profile.call = Profile(name=self.name)
+            self.start = time.perf_counter()
+        profile.depth += 1
+
+    def __exit__(self, *exc):
+        profile = self.profile
+        profile.depth -= 1
+        if profile.depth == 0:
+            callProfile, profile.call = profile.call, None
+            callProfile.wallTime = time.perf_counter() - self.start
+            profile.merge(callProfile)
+        return False
+
+
+class NullContext:
+    '''
+    Context manager that does nothing, used by the hooks while no profile is active.
+    '''
+    __slots__ = []
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_CONTEXT = NullContext()
+
+
+class SlowestCalls:
+    '''
+    Callback of profile() that keeps the n named calls with the longest wall times, e.g., the slowest files, in a heap,
+    so that it takes the same memory however many calls there are.
+    '''
+    def __init__(self, n=10):
+        '''
+        Parameters
+        n: int
+            Number of calls to keep.
+        '''
+        self.n = n
+        self.heap = []  # (wallTime, number, Profile()) of the slowest calls, the fastest first
+        self.number = 0  # number of calls seen, which orders calls with the same wall time
+
+    def __call__(self, callProfile):
+        if callProfile.name is None:  # not a file
+            return
+        self.number += 1
+        entry = (callProfile.wallTime, self.number, callProfile)
+        if len(self.heap) < self.n:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def get(self):
+        '''
+        Get the slowest calls.
+
+        Return: list
+            Profile() objects of the calls, the slowest first.
+        '''
+        return [entry[2] for entry in sorted(self.heap, reverse=True)]
+
+
+def get_peak_rss(children=False):
+    '''
+    Get the peak resident set size of this process or of its terminated child processes, e.g., worker processes.
+
+    Parameters
+    children: bool
+        If True, will get the largest peak of the child processes.
+        Else, will get the peak of this process.
+
+    Return: int
+        The peak in bytes, or None where the resource module is not available, e.g., on Windows.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024  # bytes on macOS, else kilobytes
+
+
+def get_profile():
+    '''
+    Get the active profile of the current thread.
+
+    Return: Profile() object
+        The profile, or None if profiling is not active.
+    '''
+    return getattr(ACTIVE, 'profile', None)
+
+
+def phase(name):
+    '''
+    Time the block of a with statement as given phase of the active profile, if any.
+
+    Parameters
+    name: string
+        The phase, one of PHASES.
+
+    Return: context manager
+        The timer.
+    '''
+    profile = getattr(ACTIVE, 'profile', None)
+    return NULL_CONTEXT if profile is None else Timer(profile, name)
+
+
+def call(name=None):
+    '''
+    Record the block of a with statement as one call in the active profile, if any.
+
+    Parameters
+    name: string
+        The name of the call, e.g., the path to the file, or None.
+
+    Return: context manager
+        The call.
+    '''
+    profile = getattr(ACTIVE, 'profile', None)
+    return NULL_CONTEXT if profile is None else Call(profile, name)
+
+
+def count(name, n=1):
+    '''
+    Add n to given counter of the active profile, if any.
+
+    Parameters
+    name: string
+        The counter, one of COUNTERS.
+    n: int
+        The number to add.
+    '''
+    profile = getattr(ACTIVE, 'profile', None)
+    if profile is not None:
+        profile.count(name, n)
+
+
+def timed(iterable, name):
+    '''
+    Time getting each item of iterable as given phase of the active profile, if any, e.g., for lazy tokenizing.
+
+    Parameters
+    iterable: iterable
+        The items.
+    name: string
+        The phase, one of PHASES.
+
+    Return: iterable
+        The items, or iterable itself if no profile is active.
+    '''
+    profile = getattr(ACTIVE, 'profile', None)
+    return iterable if profile is None else _timed(iter(iterable), profile, name)
+
+
+def timed_function(function, name):
+    '''
+    Time each call of function as given phase of the active profile, if any.
+
+    Parameters
+    function: function
+        The function.
+    name: string
+        The phase, one of PHASES.
+
+    Return: function
+        The function timed, or function itself if no profile is active.
+    '''
+    profile = getattr(ACTIVE, 'profile', None)
+    if profile is None:
+        return function
+
+    def timedFunction(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.add_time(name, time.perf_counter() - start)
+
+    return timedFunction
+
+
+def _timed(iterator, profile, name):
+    '''
+    Generate the items of iterator, adding the time spent getting each to given phase of profile, see timed().
+    '''
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profile.add_time(name, time.perf_counter() - start)
+        yield item
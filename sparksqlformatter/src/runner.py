@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import io
+import os
+import sys
+import logging
+import hashlib
+import difflib
+import itertools
+import shutil
+import tempfile
+import multiprocessing
+
+from sparksqlformatter.src import api
+from sparksqlformatter.src import file_cache
+from sparksqlformatter.src import profiling
+
+logger = logging.getLogger(__name__)
+
+MAX_CHUNK_SIZE = 64  # maximum number of files sent to a worker process at once
+STREAM_CHUNK_SIZE = 16  # number of files sent to a worker process at once when the number of files is unknown
+SPOOL_SIZE = 1024 * 1024  # characters of the output of a file kept in memory before it is spooled to a temporary file
+
+WORKER_FORMATTER = None  # the formatter of a worker process, created once by _init_worker()
+WORKER_CACHE_ENTRIES = None  # the file cache entries of a worker process, set once by _init_worker()
+WORKER_PROFILED = False  # whether a worker process profiles each file, set once by _init_worker()
+
+
+class Mode:
+    '''
+    Class for what is done with each formatted file.
+    '''
+    OUTPUT = 'output'  # write the formatted file to output
+    IN_PLACE = 'in_place'  # overwrite the file with the formatted file
+    CHECK = 'check'  # only find out whether formatting would change the file
+    DIFF = 'diff'  # write the diff between the file and the formatted file to output
+
+
+class FileResult:
+    '''
+    Class for the result of formatting one file.
+    '''
+    __slots__ = ['filePath', 'outputText', 'error', 'cached', 'cacheEntry', 'changed', 'profile']
+
+    def __init__(self,
+                 filePath,
+                 outputText=None,
+                 error=None,
+                 cached=False,
+                 cacheEntry=None,
+                 changed=None,
+                 profile=None):
+        '''
+        Parameters
+        filePath: string
+            Path to the file.
+        outputText: string
+            The text to write to output, i.e., the formatted file or its diff, if it was formatted in a worker process.
+        error: string
+            The error raised while formatting the file, or None if it was formatted.
+        cached: bool
+            True if the file cache showed that the file is formatted, so it was not formatted again.
+        cacheEntry: list
+            The new file cache entry of the file, if it is formatted, see file_cache.make_entry().
+        changed: bool
+            Whether formatting changes the file, or None if it is not known.
+        profile: dict
+            The profile of formatting the file in a worker process, see profiling.Profile.to_dict(), if profiling.
+        '''
+        self.filePath = filePath
+        self.outputText = outputText
+        self.error = error
+        self.cached = cached
+        self.cacheEntry = cacheEntry
+        self.changed = changed
+        self.profile = profile
+
+
+class DivergedError(Exception):
+    '''
+    Raised by ComparingWriter() when what is written differs from what is expected.
+    '''
+    pass
+
+
+class ComparingWriter:
+    '''
+    Class for a stream that compares what is written with an expected text instead of writing it, so that formatting
+    can stop as soon as the formatted query differs from the original one.
+    '''
+    def __init__(self, expected):
+        '''
+        Parameters
+        expected: string
+            The expected text.
+        '''
+        self.expected = expected
+        self.position = 0  # length of the text written so far
+
+    def write(self, text):
+        '''
+        Compare given text with the expected text at the current position.
+
+        Parameters
+        text: string
+            The text to write.
+        '''
+        if not self.expected.startswith(text, self.position):
+            raise DivergedError()
+        self.position += len(text)
+
+    def is_complete(self):
+        '''
+        Check if all of the expected text has been written.
+
+        Return: bool
+            True if the text written so far is the expected text.
+        '''
+        return self.position == len(self.expected)
+
+
+def format_files(filePaths, style=None, inPlace=False, jobs=1, output=None, cache=None, check=False, diff=False):
+    '''
+    Format given files and yield the result of each file in the order of filePaths.
+    An error in one file is recorded in its result and does not stop the other files.
+
+    Parameters
+    filePaths: list or iterable
+        Paths to the files to format. An iterable, e.g., the generator of discovery.discover_files(), is consumed
+        lazily, so that formatting starts before all paths are known.
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for the query language, default to Style().
+    inPlace: bool
+        If True, will format the files in place.
+        Else, will write the formatted files to output in the order of filePaths.
+    jobs: int
+        Number of worker processes. If 1, will format the files in this process.
+    output: file object
+        Stream to write the formatted files or their diffs to, default to sys.stdout.
+    cache: sparksqlformatter.src.file_cache.FileCache() object
+        Cache of files known to be formatted with the style, which are skipped. It is updated with the files formatted
+        and saved after the last file. If None, all files are formatted.
+    check: bool
+        If True, will only find out whether formatting would change the files, see FileResult.changed, without writing
+        to the files or to output.
+    diff: bool
+        If True, will write the diff between each file that would change and the formatted file to output instead of
+        the formatted file, without writing to the files.
+
+    Return: generator
+        Generator of FileResult() objects.
+    '''
+    if inPlace and (check or diff):
+        raise ValueError('inPlace cannot be combined with check or diff')
+    mode = Mode.IN_PLACE if inPlace else Mode.DIFF if diff else Mode.CHECK if check else Mode.OUTPUT
+    style = api._get_style(style)  # fail early on an invalid style instead of once per file
+    output = output if output is not None else sys.stdout
+    if hasattr(filePaths, '__len__'):
+        processes = min(jobs, len(filePaths))
+        chunkSize = max(1, min(MAX_CHUNK_SIZE, len(filePaths) // (processes * 4 or 1)))
+    else:
+        # do not start a pool for a single file, e.g., from an editor or a pre-commit hook
+        filePaths = iter(filePaths)
+        firstPaths = list(itertools.islice(filePaths, 2))
+        processes = jobs if len(firstPaths) > 1 else 1
+        chunkSize = STREAM_CHUNK_SIZE
+        filePaths = itertools.chain(firstPaths, filePaths)
+    cacheEntries = cache.entries if cache is not None else None
+    if processes <= 1:
+        results = _format_files_serially(filePaths, style, mode, output, cacheEntries)
+    else:
+        results = _format_files_in_pool(filePaths, style, mode, processes, chunkSize, cacheEntries)
+    profile = profiling.get_profile()
+    for result in results:
+        if result.profile is not None and profile is not None:
+            callProfile = profiling.Profile.from_dict(result.profile)
+            callProfile.name = result.filePath
+            profile.merge(callProfile)
+            result.profile = None
+        if result.outputText is not None:
+            output.write(result.outputText)
+            result.outputText = None
+        if result.cacheEntry is not None and cache is not None:
+            cache.update(result.filePath, result.cacheEntry)
+        yield result
+    if cache is not None:
+        cache.save()
+
+
+def _format_files_serially(filePaths, style, mode, output, cacheEntries):
+    '''
+    Format given files one after another in this process. The output of each file is spooled to a temporary file
+    beyond SPOOL_SIZE characters, so that memory does not grow with the size of the file, and only copied to output
+    once the file is formatted, so that, as with the worker processes, nothing is written for a file that fails to be
+    formatted part-way.
+
+    Parameters
+    filePaths: list or iterable
+        Paths to the files to format.
+    style: sparksqlformatter.src.style.Style() object
+        Styleurations for the query language.
+    mode: string
+        What is done with each formatted file, see Mode().
+    output: file object
+        Stream to write the formatted files or their diffs to.
+    cacheEntries: dict
+        Entries of the file cache, or None if there is no cache.
+
+    Return: generator
+        Generator of FileResult() objects.
+    '''
+    formatter = api._get_formatter(style)
+    for filePath in filePaths:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+', encoding='utf-8', newline='') as spool:
+            try:
+                result = _format_file(filePath, formatter, mode, spool, cacheEntries)
+            except Exception as e:
+                result = FileResult(filePath, error=_describe_error(e))
+            else:
+                spool.seek(0)
+                shutil.copyfileobj(spool, output)
+        yield result
+
+
+def _format_files_in_pool(filePaths, style, mode, processes, chunkSize, cacheEntries):
+    '''
+    Format given files in a pool of worker processes. Each worker creates its formatter once and formats the files
+    it is sent one after another. The paths are read from filePaths by a thread of the pool while the workers format,
+    and the results are returned in the order of filePaths whatever order the workers finish in.
+
+    Parameters
+    filePaths: list or iterable
+        Paths to the files to format.
+    style: sparksqlformatter.src.style.Style() object
+        Styleurations for the query language.
+    mode: string
+        What is done with each formatted file, see Mode(). The text to write to output is returned in the results.
+    processes: int
+        Number of worker processes.
+    chunkSize: int
+        Number of files sent to a worker process at once.
+    cacheEntries: dict
+        Entries of the file cache, or None if there is no cache.
+
+    Return: generator
+        Generator of FileResult() objects.
+    '''
+    profiled = profiling.get_profile() is not None  # the workers send the profile of each file back
+    pool = multiprocessing.Pool(processes=processes, initializer=_init_worker, initargs=(style, cacheEntries, profiled))
+    try:
+        for result in pool.imap(_format_file_in_worker, ((filePath, mode) for filePath in filePaths), chunkSize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _init_worker(style, cacheEntries, profiled=False):
+    '''
+    Create the formatter of a worker process.
+
+    Parameters
+    style: sparksqlformatter.src.style.Style() object
+        Styleurations for the query language.
+    cacheEntries: dict
+        Entries of the file cache, or None if there is no cache.
+    profiled: bool
+        If True, will profile each file and return its profile in the result.
+    '''
+    global WORKER_FORMATTER, WORKER_CACHE_ENTRIES, WORKER_PROFILED
+    WORKER_FORMATTER = api._get_formatter(style)
+    WORKER_CACHE_ENTRIES = cacheEntries
+    WORKER_PROFILED = profiled
+
+
+def _format_file_in_worker(task):
+    '''
+    Format one file in a worker process.
+
+    Parameters
+    task: tuple
+        Path to the file and what is done with the formatted file, see Mode().
+
+    Return: FileResult() object
+        The result of formatting the file, with the text to write to output if any.
+    '''
+    filePath, mode = task
+    profile = None
+    try:
+        output = io.StringIO()
+        if WORKER_PROFILED:
+            with profiling.profile() as profile:
+                result = _format_file(filePath, WORKER_FORMATTER, mode, output, WORKER_CACHE_ENTRIES)
+        else:
+            result = _format_file(filePath, WORKER_FORMATTER, mode, output, WORKER_CACHE_ENTRIES)
+        result.outputText = output.getvalue() or None
+    except Exception as e:
+        result = FileResult(filePath, error=_describe_error(e))
+    if profile is not None:  # also of a file that failed, so that it is counted as in this process
+        result.profile = profile.to_dict()
+    return result
+
+
+def _format_file(filePath, formatter, mode, output, cacheEntries):
+    '''
+    Format one file, unless the file cache shows that it is formatted, in which case it is not tokenized and, in
+    Mode.OUTPUT, is written to output as it is.
+
+    Parameters
+    filePath: string
+        Path to the file.
+    formatter: sparksqlformatter.src.formatter.Formatter() object
+        Formatter.
+    mode: string
+        What is done with the formatted file, see Mode().
+    output: file object
+        Stream to write the formatted file or its diff to.
+    cacheEntries: dict
+        Entries of the file cache, or None if there is no cache.
+
+    Return: FileResult() object
+        The result of formatting the file, with the new cache entry of the file if it is formatted.
+    '''
+    with profiling.call(filePath):  # does nothing unless profiling
+        profiling.count('files')
+        if profiling.get_profile() is not None:
+            profiling.count('inputBytes', os.path.getsize(filePath))
+        stat = None
+        digest = None
+        if cacheEntries is not None:
+            stat = os.stat(filePath)
+            formatted, digest = file_cache.is_formatted(cacheEntries, filePath, stat)
+            if formatted:
+                profiling.count('fileCacheHits')
+                if mode == Mode.OUTPUT:
+                    output.write(api._read_from_file(filePath))
+                # the file was hashed if its mtime changed, so record the new mtime
+                cacheEntry = file_cache.make_entry(stat, digest) if digest is not None else None
+                return FileResult(filePath, cached=True, cacheEntry=cacheEntry, changed=False)
+        if mode in (Mode.CHECK, Mode.DIFF):
+            return _check_file(filePath, formatter, mode == Mode.DIFF, output, stat)
+        inPlace = mode == Mode.IN_PLACE
+        if cacheEntries is None:
+            result = api._format_file(filePath, formatter, inPlace, output)
+            return FileResult(filePath, changed=result[1] if inPlace else None)
+        if inPlace:
+            formattedQuery, changed = api._format_file(filePath, formatter, inPlace=True)
+            digest = hashlib.sha1(formattedQuery.encode('utf-8')).hexdigest()
+            return FileResult(filePath, cacheEntry=file_cache.make_entry(os.stat(filePath), digest), changed=changed)
+        if digest is None:
+            digest = file_cache.hash_file(filePath)
+        writer = file_cache.HashingWriter(output)
+        api._format_file(filePath, formatter, output=writer)
+        if writer.hexdigest() != digest:  # the file is not formatted yet, so it must be formatted again next time
+            return FileResult(filePath)
+        return FileResult(filePath, cacheEntry=file_cache.make_entry(stat, digest))
+
+
+def _check_file(filePath, formatter, diff, output, stat):
+    '''
+    Find out whether formatting would change given file, without opening it for writing.
+
+    Parameters
+    filePath: string
+        Path to the file.
+    formatter: sparksqlformatter.src.formatter.Formatter() object
+        Formatter.
+    diff: bool
+        If True, will write the diff between the file and the formatted file to output if they differ.
+        Else, will stop formatting as soon as the formatted file differs from the file.
+    output: file object
+        Stream to write the diff to.
+    stat: os.stat_result
+        Status of the file if there is a file cache, else None.
+
+    Return: FileResult() object
+        The result of checking the file, with the new cache entry of the file if it is formatted.
+    '''
+    with profiling.phase('read'):
+        content, query = api._read_content_from_file(filePath)
+    if diff:
+        formattedQuery = api._format_query(query, formatter)
+        if formattedQuery != query:
+            output.write(''.join(
+                difflib.unified_diff(_split_lines(query), _split_lines(formattedQuery), filePath + ' (original)',
+                                     filePath + ' (formatted)')))
+        formatted = formattedQuery == query
+    else:
+        writer = ComparingWriter(query)
+        try:
+            formatter.format_stream(io.StringIO(query), writer)
+            formatted = writer.is_complete()
+        except DivergedError:
+            formatted = False
+    # a file with "\r\n" newlines changes when formatted in place even if its formatted query is the same
+    changed = not formatted or query.encode('utf-8') != content
+    cacheEntry = None
+    if not changed and stat is not None:
+        cacheEntry = file_cache.make_entry(stat, hashlib.sha1(content).hexdigest())
+    return FileResult(filePath, cacheEntry=cacheEntry, changed=changed)
+
+
+def _split_lines(text):
+    '''
+    Split given text into lines for difflib.unified_diff(), marking a last line without newline as in git diffs.
+
+    Parameters
+    text: string
+        The text.
+
+    Return: list
+        The lines, each ending with a newline.
+    '''
+    lines = io.StringIO(text).readlines()
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n\\ No newline at end of file\n'
+    return lines
+
+
+def _describe_error(e):
+    '''
+    Describe given error in one line.
+
+    Parameters
+    e: Exception
+        The error.
+
+    Return: string
+        The type and message of the error.
+    '''
+    return type(e).__name__ + ': ' + str(e)
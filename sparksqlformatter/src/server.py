@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+if sys.version_info[0] >= 3:
+    import socketserver
+else:
+    import SocketServer as socketserver
+
+from sparksqlformatter.src import api
+from sparksqlformatter.src.cache import LRUCache, FormatCache
+from sparksqlformatter.src.client import get_default_address, parse_address
+
+logger = logging.getLogger(__name__)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Class for handling one connection to the server, which may send any number of requests, one JSON object per line.
+    '''
+    def handle(self):
+        '''
+        Answer each request of the connection until it is closed.
+        '''
+        for line in self.rfile:
+            if line.strip():
+                response = self.server.respond(line)
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+
+class FormatServerMixIn:
+    '''
+    Class for the part of the server that formats queries, shared by the Unix domain socket and TCP servers.
+    '''
+    daemon_threads = True  # do not wait for open connections when stopping
+    allowStyleFiles = True  # whether requests may name style files, which the server reads with its own privileges
+
+    def setup_formatters(self, style):
+        '''
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for requests without style.
+        '''
+        self.style = style
+        self.formatters = LRUCache(maxSize=64)  # formatters of recently used styles, keyed by the style in JSON
+        self.formatCache = FormatCache()  # editors send the same buffer again and again
+
+    def get_formatter(self, style):
+        '''
+        Get the formatter for given styleurations, keeping it warm for later requests with the same style.
+
+        Parameters
+        style: string, dict or None
+            Styleurations for the query language, as in api.format_query(), or None for the style of the server.
+
+        Return: sparksqlformatter.src.formatter.Formatter() object
+            The formatter.
+        '''
+        if isinstance(style, str) and not style.startswith('{') and not self.allowStyleFiles:
+            raise Exception('Style files are not allowed on a TCP socket, send the style as a dictionary')
+        key = json.dumps(style, sort_keys=True)
+        formatter = self.formatters.get(key)
+        if formatter is None:
+            formatter = api._get_formatter(self.style if style is None else style)
+            if not (isinstance(style, str) and not style.startswith('{')):  # a style file may change
+                self.formatters.put(key, formatter)
+        return formatter
+
+    def respond(self, line):
+        '''
+        Answer one request.
+
+        Parameters
+        line: bytes
+            The request, a JSON object with the query to format in "query" and optionally its style in "style", as in
+            api.format_query(), and an "id" that is returned in the response.
+
+        Return: dict
+            The response, with the formatted query in "formattedQuery", or the error in "error".
+        '''
+        response = {}
+        try:
+            request = json.loads(line.decode('utf-8'))
+            if 'id' in request:
+                response['id'] = request['id']
+            response['formattedQuery'] = self.get_formatter(request.get('style')).format(
+                request['query'], self.formatCache)
+        except Exception as e:
+            response['error'] = type(e).__name__ + ': ' + str(e)
+        return response
+
+
+class UnixFormatServer(FormatServerMixIn, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Class for the server on a Unix domain socket.
+    '''
+    pass
+
+
+class TCPFormatServer(FormatServerMixIn, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    '''
+    Class for the server on a TCP socket. Any local user may connect to it, so requests may not name style files.
+    '''
+    allow_reuse_address = True
+    allowStyleFiles = False
+
+
+def make_server(address=None, style=None):
+    '''
+    Create the formatter server, listening on given address.
+
+    Parameters
+    address: string
+        Path to a Unix domain socket, or "host:port" of a TCP socket, default to client.get_default_address(). The host
+        of a TCP socket defaults to 127.0.0.1, e.g., ":7438", and should be localhost, as the server has no
+        authentication.
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for requests without style, default to Style().
+
+    Return: UnixFormatServer() or TCPFormatServer() object
+        The server, to be started with serve_forever().
+    '''
+    address = address if address else get_default_address()
+    family, socketAddress = parse_address(address)
+    if family == socket.AF_INET:
+        server = TCPFormatServer(socketAddress, RequestHandler)
+    else:
+        _remove_stale_socket(socketAddress)
+        umask = os.umask(0o177)  # the socket is created with mode 0600 by bind(), so only the user may ever connect
+        try:
+            server = UnixFormatServer(socketAddress, RequestHandler)
+        finally:
+            os.umask(umask)
+    server.setup_formatters(api._get_style(style))
+    api._get_formatter(server.style)  # warm up the formatter of the default style
+    return server
+
+
+def serve(address=None, style=None):
+    '''
+    Run the formatter server until interrupted.
+
+    Parameters
+    address: string
+        Path to a Unix domain socket, or "host:port" of a TCP socket, default to client.get_default_address().
+    style: string, dict, or sparksqlformatter.src.style.Style() object
+        Styleurations for requests without style, default to Style().
+    '''
+    server = make_server(address, style)
+    logger.info('Serving on ' + (address if address else get_default_address()))
+    try:
+        signal.signal(signal.SIGTERM, lambda signalNumber, frame: sys.exit(0))  # clean up when terminated
+    except ValueError:  # not in the main thread
+        pass
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(server, UnixFormatServer) and os.path.exists(server.server_address):
+            os.remove(server.server_address)
+
+
+def _remove_stale_socket(path):
+    '''
+    Remove the socket left at given path by a server that is no longer running.
+
+    Parameters
+    path: string
+        Path to the socket.
+    '''
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:  # nobody is listening
+        os.remove(path)
+    else:
+        raise Exception('A server is already running on ' + path)
+    finally:
+        probe.close()
@@ -27,9 +27,10 @@ from sparksqlformatter.src import config
 DEFAULT_STYLE_SECTION = 'sparksqlformatter'  # default section heading for style config files
 
 
-class Style:
+class Style(object):
     '''
-    Class for formatting style.
+    Class for formatting style. A Style() object cannot be changed once created, and keeps the lists it is given as
+    tuples, so that it can be hashed and used as a key of caches. Use replace() to create a changed copy.
     '''
     def __init__(
             self,
@@ -119,17 +120,96 @@ class Style:
         #                  config.Function.TABLE_GENERATING_FUNCTIONS + config.Function.TYPE_CONVERSION_FUNCTIONS +
         #                  config.Function.WINDOW_FUNCTIONS + config.Function.XPATH_FUNCTIONS + userDefinedFunctions)
         # self.reservedKeywords = config.Keyword.RESERVED_KEYWORDS
-        self.topLevelKeywords = topLevelKeywords
-        self.newlineKeywords = newlineKeywords
-        self.topLevelKeywordsNoIndent = topLevelKeywordsNoIndent
-        self.userDefinedFunctions = userDefinedFunctions
-        self.stringTypes = stringTypes
-        self.openParens = openParens
-        self.closeParens = closeParens
-        self.lineCommentTypes = lineCommentTypes
+        self.topLevelKeywords = tuple(topLevelKeywords)
+        self.newlineKeywords = tuple(newlineKeywords)
+        self.topLevelKeywordsNoIndent = tuple(topLevelKeywordsNoIndent)
+        self.userDefinedFunctions = tuple(userDefinedFunctions)
+        self.stringTypes = tuple(stringTypes)
+        self.openParens = tuple(openParens)
+        self.closeParens = tuple(closeParens)
+        self.lineCommentTypes = tuple(lineCommentTypes)
         self.reservedKeywordUppercase = reservedKeywordUppercase
         self.linesBetweenQueries = linesBetweenQueries
-        self.specialWordChars = specialWordChars
+        self.specialWordChars = tuple(specialWordChars)
         self.indent = indent
         self.inlineMaxLength = inlineMaxLength
         self.splitOnComma = splitOnComma
+        # computed once, as the style does not change; setting _key freezes the object, see __setattr__()
+        self._fingerprint = None  # computed on first use, see fingerprint()
+        key = tuple(sorted(self.attributes().items()))
+        self._hash = hash(key)
+        self._key = key
+
+    def __setattr__(self, name, value):
+        if '_key' in self.__dict__:
+            raise AttributeError('Style() object cannot be changed, use replace() to change ' + name)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError('Style() object cannot be changed, use replace() to change ' + name)
+
+    def __eq__(self, other):
+        return isinstance(other, Style) and self._key == other._key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        # create the style again when unpickled, as the hash of strings differs between processes
+        return (_create_style, (self.attributes(), ))
+
+    def __repr__(self):
+        return 'Style(' + ', '.join(name + '=' + repr(value) for name, value in self._key) + ')'
+
+    def attributes(self):
+        '''
+        Get the attributes of the style.
+
+        Return: dict
+            The attributes by name, which can be passed to Style() to create an equal style.
+        '''
+        return dict((name, value) for name, value in vars(self).items() if not name.startswith('_'))
+
+    def replace(self, **changes):
+        '''
+        Create a copy of the style with given attributes changed.
+
+        Parameters
+        changes: dict
+            The new values of the attributes by name.
+
+        Return: sparksqlformatter.src.style.Style() object
+            The changed copy.
+        '''
+        attributes = self.attributes()
+        attributes.update(changes)
+        return Style(**attributes)
+
+    def fingerprint(self):
+        '''
+        Get a stable hash of the style, which stays the same across processes and only changes with the attributes.
+
+        Return: string
+            Hex digest of the attributes of the style.
+        '''
+        if self._fingerprint is None:
+            import hashlib  # only needed by the on-disk and format caches, so not imported with the package
+            object.__setattr__(self, '_fingerprint', hashlib.sha1(repr(self._key).encode('utf-8')).hexdigest())
+        return self._fingerprint
+
+
+def _create_style(attributes):
+    '''
+    Create Style() object from its attributes, see Style.__reduce__().
+
+    Parameters
+    attributes: dict
+        The attributes by name.
+
+    Return: sparksqlformatter.src.style.Style() object
+        The style.
+    '''
+    return Style(**attributes)
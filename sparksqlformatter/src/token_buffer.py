@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from array import array
+
+OFFSET_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'  # unsigned integer of at least 4 bytes
+
+
+class TokenBuffer(object):
+    '''
+    Class for storing the tokens of a query as a struct of arrays.
+
+    The type and the start and end offsets of the tokens in the query are kept in parallel arrays, which take 9 bytes
+    per token instead of a Token() object each. Values are sliced from the query only when a token is accessed.
+    Indexing the buffer gives BufferedToken() views that can be used in place of Token() objects.
+    '''
+    def __init__(self, query):
+        '''
+        Parameters
+        query: string
+            The query the tokens are extracted from.
+        '''
+        self.query = query
+        self.types = array('B')
+        self.starts = array(OFFSET_TYPECODE)
+        self.ends = array(OFFSET_TYPECODE)
+        self.flags = {}  # flags added by formatter.py when formatting, keyed by token index
+        self.values = {}  # values replaced by formatter.py when formatting, keyed by token index
+
+    def append(self, type, start, end):
+        '''
+        Add a token to the end of the buffer.
+
+        Parameters
+        type: int
+            Type of the token, one of the TokenType types.
+        start: int
+            Offset of the token in the query.
+        end: int
+            Offset right after the token in the query.
+        '''
+        self.types.append(type)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('token index out of range')
+        return BufferedToken(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield BufferedToken(self, index)
+
+
+class BufferedToken(object):
+    '''
+    Class for a view of a token in a TokenBuffer() object, with the same attributes as Token().
+    Changes to the value or flag are stored in the buffer, so they are seen by all views of the same token.
+    '''
+    __slots__ = 'buffer', 'index'
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self):
+        return self.buffer.types[self.index]
+
+    @property
+    def start(self):
+        return self.buffer.starts[self.index]
+
+    @property
+    def end(self):
+        return self.buffer.ends[self.index]
+
+    @property
+    def value(self):
+        value = self.buffer.values.get(self.index)
+        if value is None:
+            value = self.buffer.query[self.buffer.starts[self.index]:self.buffer.ends[self.index]]
+        return value
+
+    @value.setter
+    def value(self, value):
+        self.buffer.values[self.index] = value
+
+    @property
+    def upper(self):
+        return self.value.upper()
+
+    @property
+    def flag(self):
+        return self.buffer.flags.get(self.index)
+
+    @flag.setter
+    def flag(self, flag):
+        self.buffer.flags[self.index] = flag
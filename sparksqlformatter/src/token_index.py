@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# MIT License
+
+# Copyright (c) 2020-present largecats
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from array import array
+
+from sparksqlformatter.src.tokenizer import TokenType
+from sparksqlformatter.src.inline_block import InlineBlock
+from sparksqlformatter.src.token_buffer import OFFSET_TYPECODE
+
+
+class TokenIndex(object):
+    '''
+    Class for tables computed in one pass over the tokens of a query, so that questions about a range of tokens, e.g.,
+    whether a parenthesized block fits in a line, take constant time instead of a scan over the range.
+
+    The tables are
+    1. the index of the closing parenthesis matching each opening parenthesis,
+    2. prefix sums of the lengths of the token values,
+    3. prefix counts of the tokens that do not belong to an inline block, see InlineBlock.is_forbidden_token().
+    '''
+    def __init__(self, tokens):
+        '''
+        Parameters
+        tokens: list or sparksqlformatter.src.token_buffer.TokenBuffer() object
+            Tokens of the query.
+        '''
+        size = len(tokens)
+        # index of the matching closing parenthesis of the opening parenthesis at each index, 0 for no match as
+        # a closing parenthesis always comes after the opening one
+        self.matchingParens = array(OFFSET_TYPECODE, [0]) * size
+        self.lengths = array(OFFSET_TYPECODE, [0])  # total length of the values of the tokens before each index
+        self.forbiddenCounts = array(OFFSET_TYPECODE, [0])  # number of forbidden tokens before each index
+
+        openParens = []  # indices of the opening parentheses not matched yet
+        length = 0
+        forbiddenCount = 0
+        appendLength, appendForbiddenCount = self.lengths.append, self.forbiddenCounts.append
+        for i, token in enumerate(tokens):
+            if token.type == TokenType.OPEN_PAREN:
+                openParens.append(i)
+            elif token.type == TokenType.CLOSE_PAREN:
+                if openParens:
+                    self.matchingParens[openParens.pop()] = i
+            elif InlineBlock.is_forbidden_token(token):
+                forbiddenCount += 1
+            length += len(token.value)
+            appendLength(length)
+            appendForbiddenCount(forbiddenCount)
+
+    def matching_paren(self, index):
+        '''
+        Get the closing parenthesis that matches the opening parenthesis at given index.
+
+        Parameters
+        index: int
+            Index of the opening parenthesis.
+
+        Return: int or None
+            Index of the matching closing parenthesis, or None if it is not matched.
+        '''
+        return self.matchingParens[index] or None
+
+    def length(self, start, end):
+        '''
+        Get the total length of the values of the tokens in a range.
+
+        Parameters
+        start: int
+            Index of the first token in the range.
+        end: int
+            Index right after the last token in the range.
+
+        Return: int
+        '''
+        return self.lengths[end] - self.lengths[start]
+
+    def count_forbidden(self, start, end):
+        '''
+        Get the number of tokens in a range that do not belong to an inline block.
+
+        Parameters
+        start: int
+            Index of the first token in the range.
+        end: int
+            Index right after the last token in the range.
+
+        Return: int
+        '''
+        return self.forbiddenCounts[end] - self.forbiddenCounts[start]
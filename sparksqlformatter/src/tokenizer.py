@@ -26,67 +26,169 @@ from __future__ import print_function  # for print() in Python 2
 import re
 
 import sparksqlformatter.src.config as config
+from sparksqlformatter.src.cache import LRUCache
+from sparksqlformatter.src.token_buffer import TokenBuffer
+
+STREAM_CHUNK_SIZE = 64 * 1024  # number of characters read at a time when tokenizing a file
+STREAM_LOOKAHEAD = 4  # number of characters the regexes may look at after a token, e.g., for \b or longer operators
+# characters that re.IGNORECASE matches with an ASCII letter but whose upper() is not that letter, see upper_keyword()
+IGNORECASE_LETTERS = {u'\u0130': u'I', u'\u212a': u'K'}  # capital I with dot above, Kelvin sign
+
+
+def upper_keyword(word):
+    '''
+    Upper-case a word to look it up among the keywords, so that it matches the same keywords as with re.IGNORECASE,
+    which compares one character at a time, e.g., "\u00df" is not "SS".
+
+    Parameters
+    word: string
+        The word.
+
+    Return: string
+        The upper-cased word.
+    '''
+    upper = word.upper()
+    if len(upper) == len(word) and u'\u0130' not in upper and u'\u212a' not in upper:
+        return upper
+    return ''.join(IGNORECASE_LETTERS.get(c) or (c.upper() if len(c.upper()) == 1 else c) for c in word)
 
 
 class TokenType:
     '''
     Different types of tokens.
+    Types are small integers, so that they are cheap to compare and fit in an array of bytes.
     '''
-    WHITESPACE = 'WHITESPACE'
-    WORD = 'WORD'
-    KEYWORD = 'KEYWORD'
-    STRING = 'STRING'
-    RESERVED_KEYWORD = 'RESERVED_KEYWORD'
-    TOP_LEVEL_KEYWORD = 'TOP_LEVEL_KEYWORD'
-    TOP_LEVEL_KEYWORD_NO_INDENT = 'TOP_LEVEL_KEYWORD_NO_INDENT'
-    NEWLINE_KEYWORD = 'NEWLINE_KEYWORD'
-    OPERATOR = 'OPERATOR'
-    OPEN_PAREN = 'OPEN_PAREN'
-    CLOSE_PAREN = 'CLOSE_PAREN'
-    LINE_COMMENT = 'LINE_COMMENT'
-    BLOCK_COMMENT = 'BLOCK_COMMENT'
-    NUMBER = 'NUMBER'
-
-
-class Token:
+    WHITESPACE = 0
+    WORD = 1
+    KEYWORD = 2
+    STRING = 3
+    RESERVED_KEYWORD = 4
+    TOP_LEVEL_KEYWORD = 5
+    TOP_LEVEL_KEYWORD_NO_INDENT = 6
+    NEWLINE_KEYWORD = 7
+    OPERATOR = 8
+    OPEN_PAREN = 9
+    CLOSE_PAREN = 10
+    LINE_COMMENT = 11
+    BLOCK_COMMENT = 12
+    NUMBER = 13
+
+
+class Token(object):
     '''
     A token is a string that forms a unit in formatting.
     '''
-    def __init__(self, type, value, flag=None):
-        __slots__ = 'type', 'value', 'flag'  # saves space since there would be many instances of Token
+    __slots__ = 'type', 'value', 'upper', 'flag', 'start', 'end'  # saves space since there would be many instances of Token
+
+    def __init__(self, type, value, flag=None, start=None, end=None, upper=None):
         self.type = type
         self.value = value
+        # value in uppercase, computed once for case-insensitive comparisons
+        self.upper = value.upper() if upper is None else upper
         self.flag = flag  # added by formatter.py when formatting
+        self.start = start  # offset of the token in the query
+        self.end = end  # offset right after the token in the query
+
+
+class Engine:
+    '''
+    Different engines for tokenizing the query.
+    '''
+    SCANNER = 'scanner'  # match all token types with one master regex, one match per token
+    CASCADE = 'cascade'  # try the regex of each token type in turn, kept for comparison
 
 
 class Tokenizer:
-    def __init__(self, style):
-        self.WHITESPACE_REGEX = u'^(\s+)'
-        self.NUMBER_REGEX = r'^((-\s*)?[0-9]+(\.[0-9]+)?|0x[0-9a-fA-F]+|0b[01]+)\b'
-        self.OPERATOR_REGEX = u'^([^\{\}]!=|<>|==|<=|>=|!=|!<|!>|\|\||::|->>|->|~~\*|~~|!~~\*|!~~|~\*|!~\*|!~|:=|.)'
-
-        self.BLOCK_COMMENT_REGEX = u'(?s:(\/\*.*?\*\/))'  # (?s:...) applies flag for re.DOTALL over ...
-        self.LINE_COMMENT_REGEX = Tokenizer.create_line_comment_regex(style.lineCommentTypes)
-
-        self.TOP_LEVEL_KEYWORD_REGEX = Tokenizer.create_keyword_regex(style.topLevelKeywords)
-        self.TOP_LEVEL_KEYWORD_NO_INDENT_REGEX = Tokenizer.create_keyword_regex(style.topLevelKeywordsNoIndent)
-        self.NEWLINE_KEYWORD_REGEX = Tokenizer.create_keyword_regex(style.newlineKeywords)
-        self.RESERVED_KEYWORD_REGEX = Tokenizer.create_keyword_regex(config.Keyword.RESERVED_KEYWORDS)
-        self.PLAIN_KEYWORD_REGEX = Tokenizer.create_keyword_regex(
-            config.Keyword.RESERVED_KEYWORDS + config.Keyword.NON_RESERVED_KEYWORDS +
-            config.Function.AGGREGATE_FUNCTIONS + config.Function.ARRAY_FUNCTIONS +
-            config.Function.CONDITIONAL_FUNCTIONS + config.Function.DATE_TIME_FUNCTIONS +
-            config.Function.HASH_FUNCTIONS + config.Function.JSON_FUNCTIONS + config.Function.MAP_FUNCTIONS +
-            config.Function.MATHEMATICAL_FUNCTIONS + config.Function.MISC_FUNCTIONS +
-            config.Function.OPERATOR_FUNCTIONS + config.Function.STRING_FUNCTIONS + config.Function.STRUCT_FUNCTIONS +
-            config.Function.TABLE_GENERATING_FUNCTIONS + config.Function.TYPE_CONVERSION_FUNCTIONS +
-            config.Function.WINDOW_FUNCTIONS + config.Function.XPATH_FUNCTIONS + style.userDefinedFunctions)
-
-        self.WORD_REGEX = Tokenizer.create_word_regex(style.specialWordChars)
-        self.STRING_REGEX = Tokenizer.create_string_regex(style.stringTypes)
-
-        self.OPEN_PAREN_REGEX = Tokenizer.create_paren_regex(style.openParens)
-        self.CLOSE_PAREN_REGEX = Tokenizer.create_paren_regex(style.closeParens)
+    def __init__(self, style, engine=Engine.SCANNER):
+        '''
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for the query language.
+        engine: string
+            One of the Engine types, default to Engine.SCANNER.
+        '''
+        if engine not in [Engine.SCANNER, Engine.CASCADE]:
+            raise Exception('Unsupported tokenizer engine ' + str(engine))
+        self.engine = engine
+        self.grammar = Tokenizer.get_grammar(style, engine)
+
+    @staticmethod
+    def get_grammar(style, engine=Engine.SCANNER):
+        '''
+        Get the compiled grammar for given style and engine from GRAMMAR_CACHE, building it on a miss.
+
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for the query language.
+        engine: string
+            One of the Engine types, default to Engine.SCANNER.
+
+        Return: Grammar() object
+            The compiled grammar.
+        '''
+        key = (style, engine)
+        grammar = GRAMMAR_CACHE.get(key)
+        if grammar is None:
+            grammar = Grammar(style, engine)
+            GRAMMAR_CACHE.put(key, grammar)
+        return grammar
+
+    @staticmethod
+    def create_keyword_trie(keywords):
+        '''
+        Create a trie of upper-cased keywords to look up the type of a word or sequence of words.
+        Each node is a list [rank, type, children] where rank orders the keywords the same way as the alternation in
+        create_keyword_regex() does, i.e., by the type first and then by the position in the list of keywords.
+        Keywords made of several words, e.g., LEFT OUTER JOIN, have one node per word.
+
+        Parameters
+        keywords: list
+            Pairs of token type and list of keywords of that type, in the order in which they should be tried.
+
+        Return: dict
+            Children of the root of the trie, mapping upper-cased words to nodes, see upper_keyword().
+        '''
+        trie = {}
+        rank = 0
+        for type, words in keywords:
+            for keyword in words:
+                rank += 1
+                children = trie
+                node = None
+                for part in keyword.split():
+                    part = upper_keyword(part)
+                    if part not in children:
+                        children[part] = [None, None, {}]
+                    node = children[part]
+                    children = node[2]
+                if node is not None and node[0] is None:  # keep the first occurrence
+                    node[0], node[1] = rank, type
+        return trie
+
+    @staticmethod
+    def create_scanner_regex(tokenRegexes):
+        '''
+        Create the master regex that matches a token of any of the given types with a single match.
+        The regex of each type is put in a named group of one alternation, so the first alternative that matches wins,
+        which gives the same priority as trying the regexes one after another.
+
+        Parameters
+        tokenRegexes: list
+            Pairs of token type and compiled regex pattern, in the order in which they should be tried.
+
+        Return: tuple
+            The compiled master regex pattern and a dictionary mapping the group names to token types.
+        '''
+        groups = []
+        types = {}
+        for i, (type, regex) in enumerate(tokenRegexes):
+            name = 'T{i}'.format(i=i)
+            pattern = regex.pattern
+            if regex.flags & re.IGNORECASE:
+                pattern = '(?i:' + pattern + ')'  # scope the flag to the token types that ignore case
+            groups.append('(?P<{name}>{pattern})'.format(name=name, pattern=pattern))
+            types[name] = type
+        return re.compile('|'.join(groups), re.UNICODE), types
 
     @staticmethod
     def create_line_comment_regex(lineCommentTypes):
@@ -101,7 +203,7 @@ class Tokenizer:
             Regex pattern that matches line comment.
         '''
         lineCommentTypesString = ('|').join(list(map(lambda c: re.escape(c), lineCommentTypes)))
-        regexString = u'^((?:{lineCommentTypesString}).*?(?:\r\n|\r|\n|$))'.format(
+        regexString = u'((?:{lineCommentTypesString}).*?(?:\r\n|\r|\n|$))'.format(
             lineCommentTypesString=lineCommentTypesString)
         return regexString
 
@@ -121,9 +223,23 @@ class Tokenizer:
         keywordsPattern = re.sub(
             pattern=' ', repl='\\\s+', string=keywordsString
         )  # https://stackoverflow.com/questions/58328587/python-3-7-4-re-error-bad-escape-s-at-position-0
-        regexString = u'^({keywordsPattern})\\b'.format(keywordsPattern=keywordsPattern)
+        regexString = u'({keywordsPattern})\\b'.format(keywordsPattern=keywordsPattern)
         return regexString
 
+    @staticmethod
+    def compile_keyword_regex(keywords):
+        '''
+        Compile regex pattern that matches keywords in the query, ignoring case.
+
+        Parameters
+        keywords: list
+            Attribute of hiveqlformatter.src.style.Style() object.
+
+        Return: re.Pattern
+            Compiled regex pattern that matches keywords.
+        '''
+        return re.compile(Tokenizer.create_keyword_regex(keywords), re.IGNORECASE | re.UNICODE)
+
     @staticmethod
     def create_word_regex(specialChars=[]):
         '''
@@ -137,7 +253,7 @@ class Tokenizer:
             Regex pattern that matches word with special characters.     
         '''
         specialCharsString = ('|').join(specialChars)
-        regexString = u'^([\\w{specialCharsString}]+)'.format(specialCharsString=specialCharsString)
+        regexString = u'([\\w{specialCharsString}]+)'.format(specialCharsString=specialCharsString)
         return regexString
 
     @staticmethod
@@ -152,7 +268,7 @@ class Tokenizer:
         Return: string
             Regex pattern that matches strings.    
         '''
-        regexString = '^(' + Tokenizer.create_string_pattern(stringTypes) + ')'
+        regexString = '(' + Tokenizer.create_string_pattern(stringTypes) + ')'
         return regexString
 
     @staticmethod
@@ -191,7 +307,7 @@ class Tokenizer:
             Regex pattern that matches parentheses.
         '''
         parensString = ('|').join(list(map(lambda p: Tokenizer.escape_paren(p), parens)))
-        return '^(' + parensString + ')'
+        return '(' + parensString + ')'
 
     @staticmethod
     def escape_paren(paren):
@@ -213,7 +329,7 @@ class Tokenizer:
     def tokenize(self, input):
         """
         Takes a SQL string and breaks it into tokens.
-        Each token is an object with type and value.
+        Each token is an object with type, value and its start and end offsets in the string.
 
         Parameters
         input: string
@@ -224,19 +340,235 @@ class Tokenizer:
         """
         if not input:
             return []
+        if self.engine == Engine.CASCADE:
+            return self.tokenize_by_cascade(input)
 
+        tokens = []
+        values = {}  # distinct token values and their uppercase, so that tokens with the same value share the strings
+        for type, start, end in self.scan(input):
+            value = input[start:end]
+            shared = values.get(value)
+            if shared is None:
+                upper = value.upper()
+                shared = values[value] = (value, value if upper == value else upper)
+            tokens.append(Token(type=type, value=shared[0], start=start, end=end, upper=shared[1]))
+
+        return tokens
+
+    def tokenize_into_buffer(self, input):
+        """
+        Takes a SQL string and breaks it into tokens stored in a TokenBuffer() object,
+        which takes much less memory than a list of Token() objects for large queries.
+
+        Parameters
+        input: string
+            The query to format.
+
+        Return: sparksqlformatter.src.token_buffer.TokenBuffer() object
+            Tokens extracted from the query.
+        """
+        tokens = TokenBuffer(input)
+        if self.engine == Engine.CASCADE:
+            for token in self.tokenize_by_cascade(input):
+                tokens.append(token.type, token.start, token.end)
+        else:
+            for type, start, end in self.scan(input):
+                tokens.append(type, start, end)
+        return tokens
+
+    def iter_tokens(self, source, chunkSize=STREAM_CHUNK_SIZE):
+        """
+        Generate the tokens of a query lazily, reading file-like objects chunk by chunk through a sliding buffer.
+        A token that crosses the end of the buffer, e.g., a long string or block comment, is completed with the next
+        chunks before it is generated, so the memory used is proportional to the longest token rather than to the query.
+        The cascade engine does not support streaming and reads the whole file first.
+
+        Parameters
+        source: string or file-like object
+            The query to format, or a file opened in text mode to read it from.
+        chunkSize: int
+            Number of characters to read at a time, default to STREAM_CHUNK_SIZE.
+
+        Return: generator
+            Tokens extracted from the query, with offsets counted from the start of the source.
+        """
+        if not hasattr(source, 'read'):
+            for token in self.tokenize(source):
+                yield token
+            return
+        if self.engine == Engine.CASCADE:
+            for token in self.tokenize(source.read()):
+                yield token
+            return
+
+        buffer = ''
+        base = 0  # offset of the buffer in the source
+        position = 0  # offset in the buffer right after the last generated token
+        afterDot = False
+        final = False
+        while not final:
+            # read at least as much as is left over, so that a long token is completed in logarithmically many reads
+            chunk = source.read(max(chunkSize, len(buffer) - position))
+            final = not chunk
+            buffer = buffer[position:] + chunk
+            base += position
+            position = 0
+            for type, start, end in self.scan(buffer, final=final, afterDot=afterDot):
+                yield Token(type=type, value=buffer[start:end], start=base + start, end=base + end)
+                afterDot = end - start == 1 and buffer[start] == '.'
+                position = end
+
+    def scan(self, input, position=0, final=True, afterDot=False):
+        """
+        Generate the type and offsets of each token in the query with the master regex.
+
+        Parameters
+        input: string
+            The query to format.
+        position: int
+            The offset in the query at which to start, default to 0.
+        final: bool
+            False if input is a buffer that more of the query may be appended to. Then the generator stops at the first
+            token that could come out differently with more input, so that it can be scanned again once more is read.
+        afterDot: bool
+            True if the token right before position is a dot, so that the word at position is not a keyword.
+
+        Return: generator
+            Tuples of type, start and end offsets of the tokens.
+        """
+        length = len(input)
+        scan, types = self.grammar.SCANNER_REGEX.match, self.grammar.SCANNER_TYPES
+        while position < length:
+            # one match of the master regex per token
+            matches = scan(input, position)
+            type = types[matches.lastgroup]
+            end = matches.end()
+            if type == TokenType.WORD and not afterDot:
+                keyword = self.get_keyword_type(input, position, final)
+                if keyword:
+                    type, end = keyword
+                    if type is None:
+                        return
+            if not final and self.needs_more_input(input, type, position, end):
+                return
+            yield type, position, end
+            afterDot = end - position == 1 and input[position] == '.'
+            position = end
+
+    def needs_more_input(self, input, type, start, end):
+        """
+        Check whether the token matched in a buffer could come out differently if more of the query were appended.
+
+        Parameters
+        input: string
+            The buffer holding part of the query.
+        type: int
+            The type of the token.
+        start: int
+            The offset of the token in the buffer.
+        end: int
+            The offset right after the token in the buffer.
+
+        Return: bool
+            True if the token must be scanned again after reading more of the query.
+        """
+        if end + STREAM_LOOKAHEAD > len(input):
+            # the token or what the regexes look ahead at after it, e.g., \b or longer operators, may go on
+            return True
+        if type == TokenType.OPERATOR:
+            # an unterminated block comment or string, e.g., one with a trailing backslash, is matched as an operator
+            # until the end of it is read
+            if input.startswith('/*', start) or input[start] in self.grammar.STRING_OPENERS:
+                return True
+            # a minus followed by whitespace only may turn out to be the sign of a number
+            if input[start] == '-':
+                return self.is_blank_until_end(input, end)
+        return False
+
+    def is_blank_until_end(self, input, position):
+        """
+        Check whether there is only whitespace from given position to the end of the buffer.
+
+        Parameters
+        input: string
+            The buffer holding part of the query.
+        position: int
+            The offset in the buffer to check from.
+
+        Return: bool
+            True if the rest of the buffer is empty or whitespace.
+        """
+        matches = self.grammar.WHITESPACE_REGEX.match(input, position)
+        return position == len(input) or (matches is not None and matches.end() == len(input))
+
+    def get_keyword_type(self, input, position, final=True):
+        '''
+        Look up the keyword starting at given position of the query in the keyword trie.
+        Gives the same keyword as the regexes in create_keyword_regex() would: among the keywords that end with a word
+        boundary, the one tried first.
+
+        Parameters
+        input: string
+            The query to format.
+        position: int
+            The offset in the query at which the keyword starts.
+        final: bool
+            False if input is a buffer that more of the query may be appended to, see scan().
+
+        Return: tuple
+            The type of the keyword and the offset right after it, or None if there is no keyword at position.
+            The type and offset are both None if the keyword could come out differently with more input.
+        '''
+        matches = self.grammar.KEYWORD_PART_REGEX.match(input, position)
+        if not matches:
+            return None
+        node = self.grammar.KEYWORD_TRIE.get(upper_keyword(matches.group(0)))
+        end = matches.end()
+        keyword = None
+        while node is not None:
+            rank, type, children = node
+            if rank is not None and (keyword is None or rank < keyword[0]):
+                keyword = (rank, type, end)
+            if not children:
+                break
+            # next word of keywords like LEFT OUTER JOIN
+            matches = self.grammar.NEXT_KEYWORD_PART_REGEX.match(input, end)
+            if not final and ((matches and matches.end() + STREAM_LOOKAHEAD > len(input)) or
+                              (not matches and self.is_blank_until_end(input, end))):
+                return None, None
+            if not matches:
+                break
+            node = children.get(upper_keyword(matches.group(1)))
+            end = matches.end()
+        if keyword:
+            return keyword[1], keyword[2]
+
+    def tokenize_by_cascade(self, input):
+        """
+        Takes a SQL string and breaks it into tokens by trying the regex of each token type in turn.
+        Slower than the master regex in tokenize(), kept for comparison.
+
+        Parameters
+        input: string
+            The query to format.
+        
+        Return: list
+            Tokens extracted from the query.
+        """
         tokens = []
         token = None
-        while len(input):
-            # Keep processing the string until it is empty
-            token = self.get_next_token(input, token)  # get next token
-            start = 0 if token is None else len(token.value)
-            input = input[start::]  # advance thte string
+        position = 0
+        length = len(input)
+        while position < length:
+            # Keep processing the string from the end of the previous token until it is consumed,
+            # matching at an offset instead of slicing off the consumed part
+            token = self.get_next_token(input, token, position)  # get next token
+            position = token.end  # advance the position
             tokens.append(token)
 
         return tokens
 
-    def get_next_token(self, input, previousToken):
+    def get_next_token(self, input, previousToken, position=0):
         '''
         Find the next token object in given query.
 
@@ -245,137 +577,178 @@ class Tokenizer:
             The query to format.
         previousToken: Token() object
             The previous token found in the query.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The next token in the query.
         '''
-        return (self.get_white_space_token(input) or self.get_comment_token(input) or self.get_string_token(input)
-                or self.get_open_paren_token(input) or self.get_close_paren_token(input) or self.get_number_token(input)
-                or self.get_keyword_token(input, previousToken) or self.get_word_token(input)
-                or self.get_operator_token(input))
+        return (self.get_white_space_token(input, position) or self.get_comment_token(input, position)
+                or self.get_string_token(input, position) or self.get_open_paren_token(input, position)
+                or self.get_close_paren_token(input, position) or self.get_number_token(input, position)
+                or self.get_keyword_token(input, previousToken, position) or self.get_word_token(input, position)
+                or self.get_operator_token(input, position))
 
-    def get_white_space_token(self, input):
+    def get_white_space_token(self, input, position=0):
         '''
         Find token of type TokenType.WHITESPACE in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified white space token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.WHITESPACE, regex=self.WHITESPACE_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.WHITESPACE,
+                                                  regex=self.grammar.WHITESPACE_REGEX,
+                                                  position=position)
 
-    def get_comment_token(self, input):
+    def get_comment_token(self, input, position=0):
         '''
         Find comment in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified comment token.
         '''
-        return self.get_line_comment_token(input) or self.get_block_comment_token(input)
+        return self.get_line_comment_token(input, position) or self.get_block_comment_token(input, position)
 
-    def get_line_comment_token(self, input):
+    def get_line_comment_token(self, input, position=0):
         '''
         Find token of type TokenType.LINE_COMMENT in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified line comment token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.LINE_COMMENT,
-                                                  regex=self.LINE_COMMENT_REGEX)
+                                                  regex=self.grammar.LINE_COMMENT_REGEX,
+                                                  position=position)
 
-    def get_block_comment_token(self, input):
+    def get_block_comment_token(self, input, position=0):
         '''
         Find token of type TokenType.BLOCK_COMMENT in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified block comment token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.BLOCK_COMMENT,
-                                                  regex=self.BLOCK_COMMENT_REGEX)
+                                                  regex=self.grammar.BLOCK_COMMENT_REGEX,
+                                                  position=position)
 
-    def get_string_token(self, input):
+    def get_string_token(self, input, position=0):
         '''
         Find token of type TokenType.STRING in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified string token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.STRING, regex=self.STRING_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.STRING,
+                                                  regex=self.grammar.STRING_REGEX,
+                                                  position=position)
 
-    def get_open_paren_token(self, input):
+    def get_open_paren_token(self, input, position=0):
         '''
         Find token of type TokenType.OPEN_PAREN in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified opening parenthesis token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.OPEN_PAREN, regex=self.OPEN_PAREN_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.OPEN_PAREN,
+                                                  regex=self.grammar.OPEN_PAREN_REGEX,
+                                                  position=position)
 
-    def get_close_paren_token(self, input):
+    def get_close_paren_token(self, input, position=0):
         '''
         Find token of type TokenType.CLOSE_PAREN in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified closing parenthesis token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.CLOSE_PAREN, regex=self.CLOSE_PAREN_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.CLOSE_PAREN,
+                                                  regex=self.grammar.CLOSE_PAREN_REGEX,
+                                                  position=position)
 
-    def get_number_token(self, input):
+    def get_number_token(self, input, position=0):
         '''
         Find token of type TokenType.NUMBER in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
-            The identified  number token.
+            The identified number token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.NUMBER, regex=self.NUMBER_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.NUMBER,
+                                                  regex=self.grammar.NUMBER_REGEX,
+                                                  position=position)
 
-    def get_operator_token(self, input):
+    def get_operator_token(self, input, position=0):
         '''
         Find token of type TokenType.OPERATOR in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified operator token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.OPERATOR, regex=self.OPERATOR_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.OPERATOR,
+                                                  regex=self.grammar.OPERATOR_REGEX,
+                                                  position=position)
 
-    def get_keyword_token(self, input, previousToken):
+    def get_keyword_token(self, input, previousToken, position=0):
         """
         A keyword cannot be preceded by a "."
         This makes it so in "my_table.from", "from" is not considered a key word
@@ -387,126 +760,205 @@ class Tokenizer:
             The query to format.
         previousToken: Token() object
             The last identified token.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified keyword token.
         """
         if (previousToken and previousToken.value and previousToken.value == '.'):
             return
-        return (self.get_top_level_keyword_token(input) or self.get_newline_keyword_token(input)
-                or self.get_top_level_keyword_token_no_indent(input) or self.get_reserved_keyword_token(input)
-                or self.get_plain_keyword_token(input))
+        return (self.get_top_level_keyword_token(input, position) or self.get_newline_keyword_token(input, position)
+                or self.get_top_level_keyword_token_no_indent(input, position)
+                or self.get_reserved_keyword_token(input, position) or self.get_plain_keyword_token(input, position))
 
-    def get_reserved_keyword_token(self, input):
+    def get_reserved_keyword_token(self, input, position=0):
         '''
         Find token of type TokenType.RESERVED_KEYWORD in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified reserved keyword token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.RESERVED_KEYWORD,
-                                                  regex=self.RESERVED_KEYWORD_REGEX)
+                                                  regex=self.grammar.RESERVED_KEYWORD_REGEX,
+                                                  position=position)
 
-    def get_top_level_keyword_token(self, input):
+    def get_top_level_keyword_token(self, input, position=0):
         '''
         Find token of type TokenType.TOP_LEVEL_KEYWORD in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified top-level keyword token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.TOP_LEVEL_KEYWORD,
-                                                  regex=self.TOP_LEVEL_KEYWORD_REGEX)
+                                                  regex=self.grammar.TOP_LEVEL_KEYWORD_REGEX,
+                                                  position=position)
 
-    def get_newline_keyword_token(self, input):
+    def get_newline_keyword_token(self, input, position=0):
         '''
         Find token of type TokenType.NEWLINE_KEYWORD in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified newline keyword token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.NEWLINE_KEYWORD,
-                                                  regex=self.NEWLINE_KEYWORD_REGEX)
+                                                  regex=self.grammar.NEWLINE_KEYWORD_REGEX,
+                                                  position=position)
 
-    def get_top_level_keyword_token_no_indent(self, input):
+    def get_top_level_keyword_token_no_indent(self, input, position=0):
         '''
-        Find token of type TokenType.TOP_LEVEL_KEYWORD_TOKEN_NO_INDENT in the query.
+        Find token of type TokenType.TOP_LEVEL_KEYWORD_NO_INDENT in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
-            The identified token.
+            The identified top-level keyword with no indent token.
         '''
         return Tokenizer.get_token_on_first_match(input=input,
                                                   type=TokenType.TOP_LEVEL_KEYWORD_NO_INDENT,
-                                                  regex=self.TOP_LEVEL_KEYWORD_NO_INDENT_REGEX)
+                                                  regex=self.grammar.TOP_LEVEL_KEYWORD_NO_INDENT_REGEX,
+                                                  position=position)
 
-    def get_plain_keyword_token(self, input):
+    def get_plain_keyword_token(self, input, position=0):
         '''
         Find token of type TokenType.KEYWORD in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified keyword token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.KEYWORD, regex=self.PLAIN_KEYWORD_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.KEYWORD,
+                                                  regex=self.grammar.PLAIN_KEYWORD_REGEX,
+                                                  position=position)
 
-    def get_word_token(self, input):
+    def get_word_token(self, input, position=0):
         '''
         Find token of type TokenType.WORD in the query.
 
         Parameters
         input: string
             The query to format.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The identified word token.
         '''
-        return Tokenizer.get_token_on_first_match(input=input, type=TokenType.WORD, regex=self.WORD_REGEX)
+        return Tokenizer.get_token_on_first_match(input=input,
+                                                  type=TokenType.WORD,
+                                                  regex=self.grammar.WORD_REGEX,
+                                                  position=position)
 
     @staticmethod
-    def get_token_on_first_match(input, type, regex):
+    def get_token_on_first_match(input, type, regex, position=0):
         '''
-        Find token of given type upon the first match.
+        Find token of given type upon the first match at given position.
 
         Parameters
         input: string
             The query to format.
         type: string
             Type of the token.
-        regex: string
-            The regex pattern that matches the token.
+        regex: re.Pattern
+            The compiled regex pattern that matches the token.
+        position: int
+            The offset in the query at which the token starts.
         
         Return: Token() object
             The matched token.
         '''
-        if type in [
-                TokenType.RESERVED_KEYWORD, TokenType.TOP_LEVEL_KEYWORD, TokenType.TOP_LEVEL_KEYWORD_NO_INDENT,
-                TokenType.NEWLINE_KEYWORD, TokenType.KEYWORD, TokenType.OPEN_PAREN, TokenType.CLOSE_PAREN
-        ]:
-            # matches = re.search(pattern=regex, string=input, flags=re.IGNORECASE | re.UNICODE)
-            matches = re.match(pattern=regex, string=input, flags=re.IGNORECASE | re.UNICODE)
-        else:
-            # matches = re.search(pattern=regex, string=input, flags=re.UNICODE)
-            matches = re.match(pattern=regex, string=input, flags=re.UNICODE)
+        matches = regex.match(input, position)
         if matches:
-            return Token(type=type, value=matches.group(0))
+            return Token(type=type, value=matches.group(0), start=position, end=matches.end())
+
+
+class Grammar:
+    '''
+    Class for the compiled regexes and keyword trie that Tokenizer() uses for a style.
+    A grammar is not changed once built, so that it can be shared by all tokenizers with the same style.
+    '''
+    def __init__(self, style, engine=Engine.SCANNER):
+        '''
+        Parameters
+        style: sparksqlformatter.src.style.Style() object
+            Styleurations for the query language.
+        engine: string
+            One of the Engine types, default to Engine.SCANNER.
+        '''
+        # the patterns are matched at an offset of the query via pattern.match(query, position),
+        # so they are compiled once here and must not be anchored with ^
+        self.WHITESPACE_REGEX = re.compile(r'(\s+)', re.UNICODE)
+        self.NUMBER_REGEX = re.compile(r'((-\s*)?[0-9]+(\.[0-9]+)?|0x[0-9a-fA-F]+|0b[01]+)\b', re.UNICODE)
+        self.OPERATOR_REGEX = re.compile(
+            r'([^\{\}]!=|<>|==|<=|>=|!=|!<|!>|\|\||::|->>|->|~~\*|~~|!~~\*|!~~|~\*|!~\*|!~|:=|.)', re.UNICODE)
+
+        # (?s:...) applies flag for re.DOTALL over ...
+        self.BLOCK_COMMENT_REGEX = re.compile(r'(?s:(\/\*.*?\*\/))', re.UNICODE)
+        self.LINE_COMMENT_REGEX = re.compile(Tokenizer.create_line_comment_regex(style.lineCommentTypes), re.UNICODE)
+
+        self.WORD_REGEX = re.compile(Tokenizer.create_word_regex(style.specialWordChars), re.UNICODE)
+        self.STRING_REGEX = re.compile(Tokenizer.create_string_regex(style.stringTypes), re.UNICODE)
+        self.STRING_OPENERS = ''.join([stringType[0] for stringType in style.stringTypes])
+
+        self.OPEN_PAREN_REGEX = re.compile(Tokenizer.create_paren_regex(style.openParens), re.IGNORECASE | re.UNICODE)
+        self.CLOSE_PAREN_REGEX = re.compile(Tokenizer.create_paren_regex(style.closeParens), re.IGNORECASE | re.UNICODE)
+
+        # keywords in the order they are tried, see get_keyword_token()
+        keywords = [(TokenType.TOP_LEVEL_KEYWORD, style.topLevelKeywords),
+                    (TokenType.NEWLINE_KEYWORD, style.newlineKeywords),
+                    (TokenType.TOP_LEVEL_KEYWORD_NO_INDENT, style.topLevelKeywordsNoIndent),
+                    (TokenType.RESERVED_KEYWORD, config.Keyword.RESERVED_KEYWORDS),
+                    (TokenType.KEYWORD, config.KEYWORDS + list(style.userDefinedFunctions))]
+
+        if engine == Engine.CASCADE:
+            # the keyword regexes are large alternations, only compile them for the engine that uses them
+            self.TOP_LEVEL_KEYWORD_REGEX, self.NEWLINE_KEYWORD_REGEX, self.TOP_LEVEL_KEYWORD_NO_INDENT_REGEX, \
+                self.RESERVED_KEYWORD_REGEX, self.PLAIN_KEYWORD_REGEX = [
+                    Tokenizer.compile_keyword_regex(words) for (_, words) in keywords]
+        else:
+            # words are matched by WORD_REGEX and then looked up among the keywords, see get_keyword_type()
+            self.KEYWORD_TRIE = Tokenizer.create_keyword_trie(keywords)
+            self.KEYWORD_PART_REGEX = re.compile(r'\w+', re.UNICODE)
+            self.NEXT_KEYWORD_PART_REGEX = re.compile(r'\s+(\w+)', re.UNICODE)
+            # token types in the order they are tried, i.e., the order in get_next_token() except for keywords
+            self.SCANNER_REGEX, self.SCANNER_TYPES = Tokenizer.create_scanner_regex([
+                (TokenType.WHITESPACE, self.WHITESPACE_REGEX), (TokenType.LINE_COMMENT, self.LINE_COMMENT_REGEX),
+                (TokenType.BLOCK_COMMENT, self.BLOCK_COMMENT_REGEX), (TokenType.STRING, self.STRING_REGEX),
+                (TokenType.OPEN_PAREN, self.OPEN_PAREN_REGEX), (TokenType.CLOSE_PAREN, self.CLOSE_PAREN_REGEX),
+                (TokenType.NUMBER, self.NUMBER_REGEX), (TokenType.WORD, self.WORD_REGEX),
+                (TokenType.OPERATOR, self.OPERATOR_REGEX)
+            ])
+
+
+GRAMMAR_CACHE = LRUCache(maxSize=64)  # grammars of recently used styles, keyed by style and engine
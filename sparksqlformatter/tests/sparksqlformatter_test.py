@@ -25,9 +25,29 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import logging
+import io
+import threading
+import time
+import tempfile
+import shutil
+import subprocess
+import json
+import sparksqlformatter
 from sparksqlformatter.src import api
+from sparksqlformatter.src import runner
+from sparksqlformatter.src import discovery
 from sparksqlformatter.src.formatter import Formatter
 from sparksqlformatter.src.style import Style
+from sparksqlformatter.src.tokenizer import Tokenizer, TokenType, Engine, GRAMMAR_CACHE
+from sparksqlformatter.src.cache import LRUCache, FormatCache
+from sparksqlformatter.src.output_builder import OutputBuilder
+from sparksqlformatter.src.token_index import TokenIndex
+from sparksqlformatter.src.inline_block import InlineBlock
+from sparksqlformatter.src.file_cache import FileCache
+from sparksqlformatter.src import file_cache
+from sparksqlformatter.src import server
+from sparksqlformatter.src import profiling
+from sparksqlformatter.src.client import Client, ServerError
 
 logger = logging.getLogger(__name__)
 log_formatter = '[%(asctime)s] %(levelname)s [%(filename)s:%(lineno)s:%(funcName)s] %(message)s'
@@ -986,6 +1006,758 @@ FROM
         formattedQuery = api.format_query(testQuery, {'indent': "  "})
         self.assertEqual(formattedQuery, key)
 
+    def test_tokenizer_offsets(self):
+        msg = 'Testing tokenizer: token offsets'
+        testQuery = '''select t0.c1, 'a b' -- comment
+from t0 /* block
+comment */ where c2 >= -1'''
+        tokens = Tokenizer(Style()).tokenize(testQuery)
+        self.assertEqual(''.join(token.value for token in tokens), testQuery)
+        self.assertEqual(tokens[0].start, 0)
+        self.assertEqual(tokens[-1].end, len(testQuery))
+        for previousToken, token in zip(tokens, tokens[1:]):
+            self.assertEqual(previousToken.end, token.start)
+        for token in tokens:
+            self.assertEqual(testQuery[token.start:token.end], token.value)
+
+    def test_tokenizer_engines(self):
+        msg = 'Testing tokenizer: scanner engine matches cascade engine'
+        testQuery = '''select t0.from, -1, 0x1F, case when a <> b then 'x' else "y" end -- comment
+from t0 left  outer
+join t1 on t0.c1 = t1.c1 /* block */ where c2 >= - 2 union all select `c3` from t2'''
+        style = Style(userDefinedFunctions=['my_udf'])
+        tokens = Tokenizer(style, engine=Engine.SCANNER).tokenize(testQuery)
+        key = Tokenizer(style, engine=Engine.CASCADE).tokenize(testQuery)
+        self.assertEqual([(token.type, token.value, token.start, token.end) for token in tokens],
+                         [(token.type, token.value, token.start, token.end) for token in key])
+
+    def test_tokenizer_keyword_lookup(self):
+        msg = 'Testing tokenizer: keyword lookup matches keyword regexes'
+        testQuery = '''select udf_7(c1), Left  Outer
+Join t1, left outer t2, partition by, partitioned   by, set schema, set current x, insert into t3, t0.select'''
+        style = Style(userDefinedFunctions=['udf_' + str(i) for i in range(1000)])
+        tokens = Tokenizer(style).tokenize(testQuery)
+        key = Tokenizer(style, engine=Engine.CASCADE).tokenize(testQuery)
+        self.assertEqual([(token.type, token.value) for token in tokens], [(token.type, token.value) for token in key])
+        self.assertIn((TokenType.TOP_LEVEL_KEYWORD, 'Left  Outer\nJoin'), [(token.type, token.value) for token in tokens])
+        # non-ASCII letters match the keywords as with re.IGNORECASE, e.g., \u00df is not SS and \u0130 is I
+        testQuery = u'cro\u00df join t1, \ufb01lter, \u017felect a, \u0130nsert into t2, a l\u0131ke b, gr\u00f6\u00dfe(c)'
+        style = Style(userDefinedFunctions=[u'gr\u00f6\u00dfe'])
+        tokens = Tokenizer(style).tokenize(testQuery)
+        key = Tokenizer(style, engine=Engine.CASCADE).tokenize(testQuery)
+        self.assertEqual([(token.type, token.value) for token in tokens], [(token.type, token.value) for token in key])
+
+    def test_grammar_cache(self):
+        msg = 'Testing tokenizer: grammar cache keyed by style fingerprint'
+        style = Style(userDefinedFunctions=['udf_grammar_cache'])
+        hits = GRAMMAR_CACHE.stats()['hits']
+        grammar = Tokenizer(style).grammar
+        self.assertIs(Tokenizer(Style(userDefinedFunctions=['udf_grammar_cache'])).grammar, grammar)
+        self.assertEqual(GRAMMAR_CACHE.stats()['hits'], hits + 1)
+        self.assertIsNot(Tokenizer(Style(userDefinedFunctions=['udf_other'])).grammar, grammar)
+
+    def test_lru_cache_eviction(self):
+        msg = 'Testing cache: least recently used entries are evicted'
+        cache = LRUCache(maxSize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)  # evicts 'b'
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'size': 2, 'maxSize': 2})
+
+    def test_token_slots(self):
+        msg = 'Testing tokenizer: slotted tokens with integer types'
+        tokens = Tokenizer(Style()).tokenize('select c1, c1 from t0')
+        self.assertFalse(hasattr(tokens[0], '__dict__'))
+        self.assertTrue(all(isinstance(token.type, int) for token in tokens))
+        self.assertEqual([token.upper for token in tokens if token.type != TokenType.WHITESPACE],
+                         ['SELECT', 'C1', ',', 'C1', 'FROM', 'T0'])
+        self.assertIs(tokens[2].value, tokens[5].value)  # tokens with the same value share the string
+
+    def test_token_buffer(self):
+        msg = 'Testing formatter: tokens in token buffer'
+        testQuery = '''with t0 as (select c1, count(*) from t group by c1) select -c1, case when c2 > 0 then 1 end from t0 order by c1'''
+        tokens = Tokenizer(Style()).tokenize(testQuery)
+        buffer = Tokenizer(Style()).tokenize_into_buffer(testQuery)
+        self.assertEqual([(token.type, token.value, token.start, token.end) for token in buffer],
+                         [(token.type, token.value, token.start, token.end) for token in tokens])
+        formattedQuery = Formatter(style=Style(), useTokenBuffer=True).format(testQuery)
+        self.assertEqual(formattedQuery, api.format_query(testQuery))
+
+    def test_iter_tokens(self):
+        msg = 'Testing tokenizer: tokens streamed from a file'
+        testQuery = '''select t0.c1, 'it''s a \\' string' -- comment
+from t0 /* block
+comment */ left   outer
+join t1 on t0.c1 = t1.c1 where c2 >= - 1 and c3 = case when c4 then 1 end'''
+        tokenizer = Tokenizer(Style())
+        tokens = [(token.type, token.value, token.start, token.end) for token in tokenizer.tokenize(testQuery)]
+        for chunkSize in [1, 2, 3, 7, 1024]:
+            streamedTokens = tokenizer.iter_tokens(io.StringIO(testQuery), chunkSize=chunkSize)
+            self.assertEqual([(token.type, token.value, token.start, token.end) for token in streamedTokens], tokens)
+        self.assertEqual([(token.type, token.value) for token in tokenizer.iter_tokens(testQuery)],
+                         [(type, value) for (type, value, _, _) in tokens])
+
+    def test_format_stream(self):
+        msg = 'Testing formatter: formatting a stream one statement at a time'
+        testQuery = '''with t0 as (select c1, c2 from t) select c1, count(*) from t0 group by c1;
+-- comment
+insert overwrite table t1 select * from t0 where c1 > - 1; select case when c2 then 1 end from t1'''
+        for style in [Style(), Style(splitOnComma=False, linesBetweenQueries=2)]:
+            output = io.StringIO()
+            Formatter(style=style).format_stream(io.StringIO(testQuery), output)
+            self.assertEqual(output.getvalue(), Formatter(style=style).format(testQuery))
+
+    def test_output_builder(self):
+        msg = 'Testing formatter: trimming and columns in output builder'
+        query = OutputBuilder('select')
+        query.append(' c1,  \t')
+        query.trim_trailing_spaces()
+        self.assertEqual(query.getvalue(), 'select c1,')
+        query.append(' \n')
+        query.trim_trailing_spaces()
+        self.assertEqual(query.getvalue(), 'select c1,\n')
+        query.append('    c2  ')
+        self.assertEqual(query.column(), 8)
+        self.assertFalse(query.endswith('\n'))
+        query.rstrip()
+        self.assertEqual(query.getvalue(), 'select c1,\n    c2')
+        query.append('\n\n')
+        query.rstrip()
+        self.assertEqual(query.column(), 6)
+        self.assertEqual(len(query), len('select c1,\n    c2'))
+
+    def test_token_index(self):
+        msg = 'Testing formatter: inline blocks looked up in token index'
+        testQuery = '''select count(*), nvl(c1, 0), coalesce(c2, (select max(c2) from t1)), c3 in (1, 2) from t0 where c4 = (c5'''
+        tokens = Tokenizer(Style()).tokenize(testQuery)
+        tokenIndex = TokenIndex(tokens)
+        parens = [i for i, token in enumerate(tokens) if token.type == TokenType.OPEN_PAREN]
+        matchingParens = [tokenIndex.matching_paren(i) for i in parens]
+        self.assertEqual([tokens[i].value for i in matchingParens[:-1]], [')'] * 6)
+        self.assertIsNone(matchingParens[-1])
+        self.assertEqual(tokenIndex.length(0, len(tokens)), len(testQuery))
+        inlineBlock = InlineBlock(inlineMaxLength=20)
+        self.assertEqual([inlineBlock.is_inline_block(tokenIndex, i) for i in parens],
+                         [True, True, False, False, True, True, False])
+
+    def test_formatter_reuse(self):
+        msg = 'Testing formatter: reusing one formatter for many queries and threads'
+        testQueries = [
+            '''select c1, count(*) from t0 group by c1''',
+            '''select c1 from t0 where c2 in (select c2 from t1) union all select c1 from t1''',
+            '''with t0 as (select c1 from t) select -c1, case when c2 then 1 end from t0 order by c1''',
+        ] * 5
+        expectedQueries = [Formatter(style=Style()).format(testQuery) for testQuery in testQueries]
+        formatter = Formatter(style=Style())
+        self.assertEqual([formatter.format(testQuery) for testQuery in testQueries], expectedQueries)
+        formattedQueries = [None] * len(testQueries)
+
+        def format_query(i):
+            formattedQueries[i] = formatter.format(testQueries[i])
+
+        threads = [threading.Thread(target=format_query, args=(i, )) for i in range(len(testQueries))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(formattedQueries, expectedQueries)
+        self.assertIs(api._get_formatter(Style()), api._get_formatter({'linesBetweenQueries': 1}))
+
+    def test_minus_operator(self):
+        msg = 'Testing query: Minus operator and negative numbers'
+        testQuery = '''select c1 - c2, c3 -c4, -1 from t where c5 = - c6 and c7 in (1, -5)'''
+        key = '''
+SELECT
+    c1 - c2,
+    c3 - c4,
+    -1
+FROM
+    t
+WHERE
+    c5 = - c6
+    AND c7 IN (1, -5)
+        '''.strip()
+        formattedQuery = api.format_query(testQuery)
+        self.assertEqual(formattedQuery, key)
+
+    def test_format_files_in_parallel(self):
+        msg = 'Testing runner: formatting files in worker processes'
+        directory = tempfile.mkdtemp()
+        try:
+            filePaths = []
+            for i in range(6):
+                filePath = os.path.join(directory, 'q' + str(i) + '.sql')
+                with io.open(filePath, mode='w', encoding='utf-8') as f:
+                    f.write(u'select c' + str(i) + ', c from t where c > ' + str(i) + '; select 1')
+                filePaths.append(filePath)
+            filePaths.insert(2, os.path.join(directory, 'missing.sql'))
+            outputs = []
+            for jobs in [1, 3]:
+                output = io.StringIO()
+                results = list(runner.format_files(filePaths, jobs=jobs, output=output))
+                self.assertEqual([result.filePath for result in results], filePaths)
+                self.assertEqual([result.error is None for result in results], [True, True, False, True, True, True, True])
+                outputs.append(output.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+            list(runner.format_files(filePaths[3:], inPlace=True, jobs=2))
+            with io.open(filePaths[3], mode='r', encoding='utf-8') as f:
+                self.assertEqual(f.read(), api.format_query('select c2, c from t where c > 2; select 1'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_discover_files(self):
+        msg = 'Testing discovery: walking directories with include, exclude and .gitignore rules'
+        directory = tempfile.mkdtemp()
+        try:
+            filePaths = [
+                'q.sql', 'a/q1.sql', 'a/build/z.sql', 'a/r.txt', 'a/x.tmp.sql', 'a/keep.tmp.sql', 'b/x.sql', 'b/y.sql',
+                'staging/s.sql'
+            ]
+            for filePath in filePaths:
+                filePath = os.path.join(directory, *filePath.split('/'))
+                if not os.path.isdir(os.path.dirname(filePath)):
+                    os.makedirs(os.path.dirname(filePath))
+                with io.open(filePath, mode='w', encoding='utf-8') as f:
+                    f.write(u'select 1')
+            os.makedirs(os.path.join(directory, '.git'))
+            with io.open(os.path.join(directory, '.gitignore'), mode='w', encoding='utf-8') as f:
+                f.write(u'# build outputs\nbuild/\n*.tmp.sql\n!keep.tmp.sql\n')
+            with io.open(os.path.join(directory, 'b', '.gitignore'), mode='w', encoding='utf-8') as f:
+                f.write(u'/x.sql\n')
+
+            def discover(paths, **kwargs):
+                return [
+                    os.path.relpath(filePath, directory).replace(os.sep, '/')
+                    for filePath in discovery.discover_files(paths, **kwargs)
+                ]
+
+            self.assertEqual(discover([directory]), ['a/keep.tmp.sql', 'a/q1.sql', 'b/y.sql', 'q.sql', 'staging/s.sql'])
+            self.assertEqual(discover([os.path.join(directory, 'a')], include=['*.txt', 'q*.sql'], useGitignore=False),
+                             ['a/q1.sql', 'a/r.txt'])
+            self.assertEqual(discover([os.path.join(directory, 'b'), os.path.join(directory, 'b', 'x.sql')]),
+                             ['b/y.sql', 'b/x.sql'])  # files given explicitly are not ignored
+            self.assertEqual(discover([os.path.join(directory, '**', '*.sql'), directory], exclude=['staging', 'a/']),
+                             ['b/x.sql', 'b/y.sql', 'q.sql'])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_file_cache(self):
+        msg = 'Testing runner: skipping files known to be formatted'
+        directory = tempfile.mkdtemp()
+        try:
+            cacheDir = os.path.join(directory, 'cache')
+            filePaths = [os.path.join(directory, 'q' + str(i) + '.sql') for i in range(3)]
+            for filePath in filePaths:
+                with io.open(filePath, mode='w', encoding='utf-8') as f:
+                    f.write(u'select c1, c2 from t')
+
+            def format_files(style=Style(), inPlace=True):
+                output = io.StringIO()
+                results = runner.format_files(filePaths,
+                                              style=style,
+                                              inPlace=inPlace,
+                                              output=output,
+                                              cache=FileCache(style, directory=cacheDir))
+                return [result.cached for result in results], output.getvalue()
+
+            self.assertEqual(format_files(), ([False, False, False], ''))
+            self.assertEqual(format_files(), ([True, True, True], ''))
+            with io.open(filePaths[1], mode='w', encoding='utf-8') as f:
+                f.write(u'select c1,c2 from t')
+            self.assertEqual(format_files(inPlace=False),
+                             ([True, False, True], api.format_query('select c1, c2 from t') * 3))
+            self.assertEqual(format_files(), ([True, False, True], ''))
+            self.assertEqual(format_files(style=Style(indent='  ')), ([False, False, False], ''))
+            self.assertEqual(len(os.listdir(cacheDir)), 2)  # one cache file per style
+            # a change to the code of the formatter without a new VERSION starts an empty cache
+            sourceDigest = file_cache.get_source_digest()
+            try:
+                file_cache.SOURCE_DIGEST = 'changed'
+                self.assertEqual(format_files(), ([False, False, False], ''))
+            finally:
+                file_cache.SOURCE_DIGEST = sourceDigest
+            self.assertEqual(format_files(), ([True, True, True], ''))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_check_and_diff(self):
+        msg = 'Testing runner: checking files and writing diffs without writing the files'
+        directory = tempfile.mkdtemp()
+        try:
+            queries = [u'SELECT\n    c1,\n    c2\nFROM\n    t;\nSELECT\n    1', u'SELECT\n    1;\nselect c1,c2 from t']
+            filePaths = []
+            for i, query in enumerate(queries):
+                filePath = os.path.join(directory, 'q' + str(i) + '.sql')
+                with io.open(filePath, mode='w', encoding='utf-8', newline='') as f:
+                    f.write(query)
+                filePaths.append(filePath)
+            for jobs in [1, 2]:
+                output = io.StringIO()
+                results = list(runner.format_files(filePaths, jobs=jobs, output=output, check=True))
+                self.assertEqual([result.changed for result in results], [False, True])
+                self.assertEqual(output.getvalue(), '')
+                output = io.StringIO()
+                results = list(runner.format_files(filePaths, jobs=jobs, output=output, diff=True))
+                self.assertEqual([result.changed for result in results], [False, True])
+                self.assertEqual(
+                    output.getvalue(), '--- ' + filePaths[1] + ' (original)\n+++ ' + filePaths[1] + ' (formatted)\n' +
+                    '@@ -1,3 +1,7 @@\n SELECT\n     1;\n-select c1,c2 from t\n\\ No newline at end of file\n' +
+                    '+SELECT\n+    c1,\n+    c2\n+FROM\n+    t\n\\ No newline at end of file\n')
+            for filePath, query in zip(filePaths, queries):
+                with io.open(filePath, mode='r', encoding='utf-8') as f:
+                    self.assertEqual(f.read(), query)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_write_only_if_changed(self):
+        msg = 'Testing runner: formatting in place only writes files that change'
+        directory = tempfile.mkdtemp()
+        try:
+            queries = [u'SELECT\n    c1\nFROM\n    t', u'select c1 from t', u'SELECT\r\n    c1\r\nFROM\r\n    t']
+            filePaths = []
+            for i, query in enumerate(queries):
+                filePath = os.path.join(directory, 'q' + str(i) + '.sql')
+                with io.open(filePath, mode='w', encoding='utf-8', newline='') as f:
+                    f.write(query)
+                os.chmod(filePath, 0o640)
+                os.utime(filePath, (1000000000, 1000000000))
+                filePaths.append(filePath)
+            results = list(runner.format_files(filePaths, inPlace=True))
+            self.assertEqual([result.changed for result in results], [False, True, True])
+            self.assertEqual([os.stat(filePath).st_mtime == 1000000000 for filePath in filePaths], [True, False, False])
+            self.assertEqual([os.stat(filePath).st_mode & 0o777 for filePath in filePaths], [0o640] * 3)
+            for filePath in filePaths:
+                with io.open(filePath, mode='r', encoding='utf-8', newline='') as f:
+                    self.assertEqual(f.read(), queries[0])
+            self.assertEqual(sorted(os.listdir(directory)), ['q0.sql', 'q1.sql', 'q2.sql'])  # no temporary files left
+        finally:
+            shutil.rmtree(directory)
+
+    def test_format_server(self):
+        msg = 'Testing server: formatting queries sent by clients over a socket'
+        directory = tempfile.mkdtemp()
+        formatServer = server.make_server(os.path.join(directory, 'test.sock'), style=Style(linesBetweenQueries=2))
+        thread = threading.Thread(target=formatServer.serve_forever)
+        thread.start()
+        try:
+            query = 'select c1 from t; select 2'
+            with Client(os.path.join(directory, 'test.sock'), timeout=10) as client:
+                self.assertEqual(client.format(query), api.format_query(query, Style(linesBetweenQueries=2)))
+                self.assertEqual(client.format(query, style={'reservedKeywordUppercase': False}),
+                                 api.format_query(query, {'reservedKeywordUppercase': False}))
+                self.assertRaises(ServerError, client.format, query, {'unknownKey': 1})
+                self.assertEqual(client.request({'id': 7, 'query': 'select 1'}), {'id': 7, 'formattedQuery': 'SELECT\n    1'})
+        finally:
+            formatServer.shutdown()
+            formatServer.server_close()
+            thread.join()
+            shutil.rmtree(directory)
+
+    def test_format_queries(self):
+        msg = 'Testing api: formatting many queries with one formatter'
+        queries = ['select c' + str(i) + ' from t' for i in range(20)]
+        queries[5] = '(select 1)'  # fails to be formatted
+        style = {'reservedKeywordUppercase': False}
+        for workers in [1, 2]:
+            results = list(api.format_queries(iter(queries), style=style, workers=workers, chunkSize=3))
+            self.assertEqual(len(results), len(queries))
+            for query, (formattedQuery, error) in zip(queries, results):
+                if query == '(select 1)':
+                    self.assertIsNone(formattedQuery)
+                    self.assertIsInstance(error, Exception)
+                else:
+                    self.assertEqual(formattedQuery, api.format_query(query, style))
+                    self.assertIsNone(error)
+
+    def test_format_cache(self):
+        msg = 'Testing formatter: reusing formatted queries and statements from a format cache'
+        formatter = Formatter()
+        formatCache = FormatCache()
+        query = 'select a, b from t0 where a = 1'
+        script = query + ';\nselect c from t1 group by c;\n\n' + query + ';'
+        for q in [query, query, script, script]:
+            self.assertEqual(formatter.format(q, formatCache), formatter.format(q), msg)
+        stats = formatCache.stats()
+        self.assertEqual(stats['hits'], 2, msg)  # the repeated query and script
+        self.assertEqual(stats['size'], 5, msg)  # 2 queries and 3 statements of the script
+        self.assertGreater(stats['bytes'], 0, msg)
+        # statements are reused by other scripts
+        otherScript = query + ';\nselect c from t1 group by c;\nselect d from t2'
+        self.assertEqual(formatter.format(otherScript, formatCache), formatter.format(otherScript), msg)
+        self.assertEqual(formatCache.stats()['hits'], 4, msg)
+        # queries formatted in other styles are not reused
+        otherFormatter = Formatter(style=Style(reservedKeywordUppercase=False))
+        self.assertEqual(otherFormatter.format(query, formatCache), otherFormatter.format(query), msg)
+        # least recently used entries are evicted when the cache takes too many bytes
+        smallCache = FormatCache(maxBytes=2000)
+        for i in range(20):
+            formatter.format('select c' + str(i) + ' from t0', smallCache)
+        self.assertLessEqual(smallCache.stats()['bytes'], 2000, msg)
+        self.assertLess(len(smallCache), 20, msg)
+        formatCache.clear()
+        self.assertEqual(formatCache.stats()['hits'], 0, msg)
+        self.assertEqual(len(formatCache), 0, msg)
+
+    def test_style_cache(self):
+        msg = 'Testing style: immutable styles and the cache of styles loaded from files and dictionaries'
+        style = Style(userDefinedFunctions=['my_udf'])
+        self.assertEqual(style.userDefinedFunctions, ('my_udf', ), msg)
+        self.assertEqual(style, Style(userDefinedFunctions=('my_udf', )), msg)
+        self.assertEqual(hash(style), hash(Style(userDefinedFunctions=('my_udf', ))), msg)
+        self.assertNotEqual(style, Style(), msg)
+        with self.assertRaises(AttributeError):
+            style.indent = '  '
+        self.assertEqual(style.replace(indent='  ').indent, '  ', msg)
+        self.assertEqual(style.indent, '    ', msg)
+        # styles from dictionaries with the same contents are created once
+        styleDict = {'reservedKeywordUppercase': False, 'userDefinedFunctions': ['my_udf']}
+        self.assertIs(api._get_style(styleDict), api._get_style(dict(styleDict)), msg)
+        self.assertIs(api._get_style(str(styleDict)), api._get_style(str(styleDict)), msg)
+        with self.assertRaises(ValueError):  # strings are parsed as literals, not evaluated
+            api._get_style("{'indent': str(2)}")
+        # styles from files are created again only if the file changes
+        directory = tempfile.mkdtemp()
+        try:
+            filePath = os.path.join(directory, 'style.conf')
+            for indent, age in [("'  '", 60), ("'\\t'", 30)]:
+                with io.open(filePath, 'w') as f:
+                    f.write(u'[sparksqlformatter]\nindent = ' + indent + '\n')
+                os.utime(filePath, (time.time() - age, time.time() - age))  # old enough for its mtime to be trusted
+                fileStyle = api._get_style(filePath)
+                self.assertIs(api._get_style(filePath), fileStyle, msg)
+            self.assertEqual(fileStyle.indent, '\t', msg)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_import_time(self):
+        msg = 'Testing package: fast imports without side effects'
+        packageRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(api.__file__))))
+        environment = dict(os.environ, PYTHONPATH=packageRoot)
+        deferredModules = [
+            'argparse', 'configparser', 'multiprocessing', 'tempfile', 'json', 'hashlib', 'logging', 'ast',
+            'sparksqlformatter.src.runner', 'sparksqlformatter.src.discovery', 'sparksqlformatter.src.file_cache',
+            'sparksqlformatter.src.server'
+        ]
+        statements = ['import sparksqlformatter', "from sparksqlformatter import api; api.format_query('select 1')"]
+        for statement in statements:
+            script = ('import sys; ' + statement +
+                      "; logging = sys.modules.get('logging'); print(len(logging.root.handlers) if logging else 0)")
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                     env=environment,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     universal_newlines=True)
+            self.assertEqual(process.stdout.strip(), '0', msg)  # logging is not configured
+            # each line of -X importtime is "import time: self [us] | cumulative | module", nested modules indented
+            imported = {}
+            for line in process.stderr.splitlines()[1:]:
+                selfTime, _, module = line[len('import time:'):].split('|')
+                imported[module.strip()] = int(selfTime)
+            for module in deferredModules:
+                self.assertNotIn(module, imported, msg + ': ' + statement + ' imports ' + module)
+            if statement == 'import sparksqlformatter':
+                self.assertEqual([module for module in imported if module.startswith('sparksqlformatter.')], [], msg)
+            # the modules of the package take a few milliseconds, the budget leaves room for slow machines and compiling
+            ownTime = sum(moduleTime for module, moduleTime in imported.items()
+                          if module.startswith('sparksqlformatter'))
+            self.assertLess(ownTime, 100000, msg)
+
+    def test_profiling(self):
+        msg = 'Testing profiling: times of the phases and counters of each call'
+        query = 'select a, count(b) from t0 group by a;\nselect c from t1'
+        formattedQuery = api.format_query(query)
+        calls = []
+        directory = tempfile.mkdtemp()
+        try:
+            filePaths = [os.path.join(directory, str(i) + '.sql') for i in range(3)]
+            for filePath in filePaths:
+                with io.open(filePath, 'w') as f:
+                    f.write(query)
+            with profiling.profile(callback=calls.append) as profile:
+                self.assertEqual(api.format_query(query), formattedQuery, msg)
+                api.format_file(filePaths[0], inPlace=True)
+                list(runner.format_files(filePaths[1:], jobs=2, check=True))  # profiled in the worker processes
+            self.assertIsNone(profiling.get_profile(), msg)
+            self.assertEqual(len(calls), 4, msg)  # one per query or file
+            self.assertEqual(profile.counts['queries'], 2, msg)
+            self.assertEqual(profile.counts['files'], 3, msg)
+            self.assertEqual(calls[0].counts['tokens'], len(Tokenizer(Style()).tokenize(query)), msg)
+            self.assertEqual(calls[0].counts['outputCharacters'], len(formattedQuery), msg)
+            self.assertEqual(calls[0].counts['inlineBlockLookaheads'], 1, msg)
+            for phase in ['read', 'tokenize', 'format', 'write']:
+                self.assertGreater(profile.times[phase], 0, msg)
+            self.assertEqual(profile.counts['tokens'], sum(call.counts['tokens'] for call in calls), msg)
+            self.assertIn('inlineBlockLookaheads', profile.summary(), msg)
+            # the format cache and file cache are counted
+            formatCache = FormatCache()
+            with profiling.profile() as profile:
+                api.format_query(query, formatCache=formatCache)
+                api.format_query(query, formatCache=formatCache)
+            self.assertEqual(profile.counts['formatCacheHits'], 1, msg)
+            self.assertEqual(profile.counts['formatCacheMisses'], 3, msg)  # the query and its 2 statements
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stats(self):
+        msg = 'Testing --stats: report of a run in JSON'
+        directory = tempfile.mkdtemp()
+        try:
+            queries = [('formatted.sql', api.format_query('select a from t')), ('unformatted.sql', 'select b from t')]
+            for name, query in queries:
+                with io.open(os.path.join(directory, name), 'w') as f:
+                    f.write(query)
+            statsPath = os.path.join(directory, 'stats.json')
+            argv = ['sparksqlformatter', '-f', directory, '--check', '--no-cache', '-j', '1']
+            argv += ['--stats-output', statsPath]
+            self.assertEqual(sparksqlformatter.main(argv), 1, msg)
+            with io.open(statsPath) as f:
+                stats = json.load(f)
+            expected = {'total': 2, 'changed': 1, 'unchanged': 1, 'failed': 0, 'unknown': 0, 'cached': 0}
+            self.assertEqual(stats['files'], expected, msg)
+            self.assertEqual(stats['inputBytes'], sum(len(query) for _, query in queries), msg)
+            self.assertGreater(stats['tokens'], 0, msg)
+            for key in ['filesPerSecond', 'bytesPerSecond', 'tokensPerSecond', 'wallSeconds']:
+                self.assertGreater(stats[key], 0, msg)
+            self.assertEqual(len(stats['slowestFiles']), 2, msg)
+            self.assertGreaterEqual(stats['slowestFiles'][0]['seconds'], stats['slowestFiles'][1]['seconds'], msg)
+            self.assertEqual(sorted(os.path.basename(f['filePath']) for f in stats['slowestFiles']),
+                             ['formatted.sql', 'unformatted.sql'], msg)
+            self.assertIn('peakRssBytes', stats, msg)
+            # whether formatting changes a file is not found out when it is written to stdout
+            argv = ['sparksqlformatter', '-f', os.path.join(directory, 'formatted.sql'), '--no-cache']
+            stdout = sys.stdout
+            sys.stdout = io.StringIO()
+            try:
+                self.assertEqual(sparksqlformatter.main(argv + ['--stats-output', statsPath]), 0, msg)
+            finally:
+                sys.stdout = stdout
+            with io.open(statsPath) as f:
+                stats = json.load(f)
+            self.assertEqual(stats['files'], dict(expected, total=1, changed=0, unchanged=0, unknown=1), msg)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_scaling_benchmark(self):
+        msg = 'Testing benchmarks: generators of queries and fitting of the scaling exponent'
+        try:
+            from benchmarks import generators, scaling
+        except ImportError:  # benchmarks is only in a checkout, not in the installed package
+            self.skipTest('benchmarks is not importable')
+        self.assertAlmostEqual(scaling.fit_exponent([10, 100, 1000], [3, 30, 300]), 1.0, msg=msg)
+        self.assertAlmostEqual(scaling.fit_exponent([10, 100, 1000], [2, 200, 20000]), 2.0, msg=msg)
+        self.assertIsNone(scaling.fit_exponent([10], [1]), msg)
+        for name, generator in generators.GENERATORS.items():
+            self.assertEqual(generator(20), generator(20), msg + ': ' + name)  # deterministic
+            self.assertLess(len(generator(10)), len(generator(20)), msg + ': ' + name)
+            self.assertTrue(api.format_query(generator(5)), msg + ': ' + name)
+        result = scaling.run_generator(Formatter(), generators.in_list, [10, 20], 1)
+        self.assertEqual([point['size'] for point in result['points']], [10, 20], msg)
+        self.assertEqual(sorted(result['exponents']), sorted(scaling.MEASURES), msg)
+
+    def test_single_file_without_pool(self):
+        msg = 'Testing format_files(): no pool of worker processes for a single discovered file'
+        directory = tempfile.mkdtemp()
+        formatInPool = runner._format_files_in_pool
+        pools = []
+
+        def spy(*args):
+            pools.append(args[3])  # number of processes
+            return formatInPool(*args)
+
+        try:
+            for name in ['a.sql', 'b.sql']:
+                with io.open(os.path.join(directory, name), 'w') as f:
+                    f.write('select a from t')
+            runner._format_files_in_pool = spy
+            filePaths = discovery.discover_files([os.path.join(directory, 'a.sql')])
+            results = list(runner.format_files(filePaths, jobs=8, output=io.StringIO()))
+            self.assertEqual([result.error for result in results], [None], msg)
+            self.assertEqual(pools, [], msg)
+            results = list(runner.format_files(discovery.discover_files([directory]), jobs=2, output=io.StringIO()))
+            self.assertEqual([result.error for result in results], [None, None], msg)
+            self.assertEqual(pools, [2], msg)
+        finally:
+            runner._format_files_in_pool = formatInPool
+            shutil.rmtree(directory)
+
+    def test_failed_file_output(self):
+        msg = 'Testing format_files(): nothing is written for a file that fails part-way, whatever the number of jobs'
+        directory = tempfile.mkdtemp()
+        try:
+            filePaths = [os.path.join(directory, name) for name in ['bad.sql', 'good.sql']]
+            for filePath, query in zip(filePaths, ['select a from t;\nselect b from (x)) )', 'select c from u']):
+                with io.open(filePath, 'w') as f:
+                    f.write(query)
+            outputs = []
+            for jobs in [1, 2]:
+                output = io.StringIO()
+                results = list(runner.format_files(filePaths, jobs=jobs, output=output))
+                self.assertIsNotNone(results[0].error, msg)
+                self.assertIsNone(results[1].error, msg)
+                outputs.append(output.getvalue())
+            self.assertEqual(outputs[0], outputs[1], msg)
+            self.assertEqual(outputs[0], api.format_query('select c from u'), msg)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_log_to_stderr(self):
+        msg = 'Testing command-line tool: diagnostics are logged to stderr, not mixed with the formatted files'
+        directory = tempfile.mkdtemp()
+        try:
+            filePaths = [os.path.join(directory, name) for name in ['bad.sql', 'good.sql']]
+            for filePath, query in zip(filePaths, ['select a from t;\nselect b from (x)) )', 'select c from u']):
+                with io.open(filePath, 'w') as f:
+                    f.write(query)
+            command = [sys.executable, '-m', 'sparksqlformatter', '-f'] + filePaths + ['--no-cache', '-j', '1']
+            packageRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(api.__file__))))
+            process = subprocess.run(command,
+                                     env=dict(os.environ, PYTHONPATH=packageRoot),
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     universal_newlines=True)
+            self.assertEqual(process.returncode, 1, msg)
+            self.assertEqual(process.stdout, api.format_query('select c from u'), msg)
+            self.assertIn('Failed to format ' + filePaths[0], process.stderr, msg)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stats_of_failed_files(self):
+        msg = 'Testing --stats: files that fail to be formatted are counted whatever the number of jobs'
+        directory = tempfile.mkdtemp()
+        try:
+            queries = [('bad.sql', 'select a from t;\nselect b from (x)) )'),
+                       ('good.sql', api.format_query('select c from u'))]
+            for name, query in queries:
+                with io.open(os.path.join(directory, name), 'w') as f:
+                    f.write(query)
+            statsPath = os.path.join(directory, 'stats.json')
+            reports = []
+            for jobs in ['1', '2']:  # --diff formats the whole file, and writes nothing for a formatted one
+                argv = ['sparksqlformatter', '-f', directory, '--diff', '--no-cache', '-j', jobs]
+                self.assertEqual(sparksqlformatter.main(argv + ['--stats-output', statsPath]), 1, msg)
+                with io.open(statsPath) as f:
+                    reports.append(json.load(f))
+            for stats in reports:
+                self.assertEqual(stats['files']['total'], 2, msg)
+                self.assertEqual(stats['files']['failed'], 1, msg)
+                self.assertEqual(stats['inputBytes'], sum(len(query) for _, query in queries), msg)
+                self.assertEqual(len(stats['slowestFiles']), 2, msg)
+            self.assertEqual(reports[0]['tokens'], reports[1]['tokens'], msg)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_client_relative_style(self):
+        msg = 'Testing client: a style file relative to the client, not to the server'
+        directory = tempfile.mkdtemp()
+        address = os.path.join(directory, 'test.sock')
+        for name in ['server', 'client']:  # the current directories of the server and the client
+            os.mkdir(os.path.join(directory, name))
+        packageRoot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(api.__file__))))
+        process = subprocess.Popen([sys.executable, '-m', 'sparksqlformatter', '--serve', '--address', address],
+                                   env=dict(os.environ, PYTHONPATH=packageRoot),
+                                   cwd=os.path.join(directory, 'server'),
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        cwd = os.getcwd()
+        try:
+            with io.open(os.path.join(directory, 'client', 'team.conf'), 'w') as f:
+                f.write(u'[sparksqlformatter]\nreservedKeywordUppercase = False\n')
+            deadline = time.time() + 10
+            while not os.path.exists(address) and time.time() < deadline:
+                time.sleep(0.05)
+            os.chdir(os.path.join(directory, 'client'))
+            query = 'select a from t'
+            with Client(address, timeout=10) as client:
+                self.assertEqual(client.format(query, style='team.conf'),
+                                 api.format_query(query, {'reservedKeywordUppercase': False}), msg)
+        finally:
+            os.chdir(cwd)
+            process.terminate()
+            process.wait()
+            shutil.rmtree(directory)
+
+    def test_serial_output_spooled(self):
+        msg = 'Testing format_files(): memory of writing a file to output does not grow with the size of the file'
+        import tracemalloc
+
+        class LengthWriter:
+            length = 0
+
+            def write(self, text):
+                self.length += len(text)
+
+        directory = tempfile.mkdtemp()
+        spoolSize = runner.SPOOL_SIZE
+        try:
+            runner.SPOOL_SIZE = 4096
+            filePath = os.path.join(directory, 'big.sql')
+            statement = 'select a from t /* ' + 'x' * 400 + ' */;\n'  # long tokens, so that the test is fast
+            peaks = []
+            lengths = []
+            for statements in [600, 1200]:  # several chunks read by the tokenizer, see tokenizer.STREAM_CHUNK_SIZE
+                with io.open(filePath, 'w') as f:
+                    f.write(statement * statements)
+                output = LengthWriter()
+                tracemalloc.start()
+                try:
+                    results = list(runner.format_files([filePath], jobs=1, output=output))
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+                self.assertIsNone(results[0].error, msg)
+                lengths.append(output.length)
+            self.assertLess(peaks[1] - peaks[0], (lengths[1] - lengths[0]) // 4, msg)
+            output = io.StringIO()
+            list(runner.format_files([filePath], jobs=1, output=output))  # spooled to a temporary file
+            self.assertEqual(output.getvalue(), api.format_query(statement * 1200), msg)
+        finally:
+            runner.SPOOL_SIZE = spoolSize
+            shutil.rmtree(directory)
+
+    def test_in_place_owner(self):
+        msg = 'Testing format_file(): formatting in place keeps the owner and group of the file'
+        if not hasattr(os, 'geteuid') or os.geteuid() != 0:
+            self.skipTest('changing the owner of a file needs root')
+        directory = tempfile.mkdtemp()
+        try:
+            filePath = os.path.join(directory, 'q.sql')
+            with io.open(filePath, 'w') as f:
+                f.write(u'select a from t')
+            os.chown(filePath, 12345, 23456)
+            os.chmod(filePath, 0o640)
+            api.format_file(filePath, inPlace=True)
+            fileStat = os.stat(filePath)
+            self.assertEqual((fileStat.st_uid, fileStat.st_gid, fileStat.st_mode & 0o777), (12345, 23456, 0o640), msg)
+            with io.open(filePath) as f:
+                self.assertEqual(f.read(), api.format_query('select a from t'), msg)
+            self.assertEqual(os.listdir(directory), ['q.sql'], msg)  # no temporary files left
+        finally:
+            shutil.rmtree(directory)
+
+    def test_format_server_security(self):
+        msg = 'Testing server: only the user may connect to the Unix socket, and TCP requests may not name style files'
+        directory = tempfile.mkdtemp()
+        unixServer = server.make_server(os.path.join(directory, 'test.sock'))
+        unixServer.server_close()
+        self.assertEqual(os.stat(os.path.join(directory, 'test.sock')).st_mode & 0o777, 0o600, msg)
+        shutil.rmtree(directory)
+        tcpServer = server.make_server(':0')
+        thread = threading.Thread(target=tcpServer.serve_forever)
+        thread.start()
+        try:
+            host, port = tcpServer.server_address
+            self.assertEqual(host, '127.0.0.1', msg)
+            with Client(host + ':' + str(port), timeout=10) as client:
+                self.assertIn('Style files are not allowed', client.request({'query': 'select 1', 'style': 'style.json'})['error'], msg)
+                self.assertEqual(client.format('select 1', style={'reservedKeywordUppercase': False}), 'select\n    1', msg)
+        finally:
+            tcpServer.shutdown()
+            tcpServer.server_close()
+            thread.join()
+
 
 if __name__ == '__main__':
     unittest.main()